@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the pinax-points hot paths on a synthetic SQLite dataset.
+
+    python benchmarks/run.py run --size 10000 [--iterations 200] [--output results.json]
+    python benchmarks/run.py compare old.json new.json
+
+A dataset of ``size`` users, each with a TargetStat, ``size`` ledger rows
+spread over the last 60 days and ``size // 10`` votes is generated once per
+size and reused (``--rebuild`` starts over). Every operation runs inside a
+transaction that is rolled back, so runs against the same dataset are
+comparable. Results hold throughput, latency percentiles and queries per
+operation along with the versions they were measured on.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup(size, rebuild):
+    path = os.path.join(tempfile.gettempdir(), "pinax-points-bench-{0}.sqlite3".format(size))
+    if rebuild and os.path.exists(path):
+        os.remove(path)
+    os.environ["PINAX_POINTS_BENCH_DB"] = path
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+    sys.path.insert(0, os.path.dirname(HERE))
+    django.setup()
+
+    from django.core.management import call_command
+    from django.contrib.auth.models import User
+
+    call_command("migrate", verbosity=0)
+    if not User.objects.exists():
+        generate(size)
+
+
+def generate(size):
+    from django.contrib.auth.models import User
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import transaction
+    from pinax.points.models import AwardedPointValue, PointRollup, TargetStat, Vote
+
+    rng = random.Random(size)
+    now = datetime.datetime.now()
+    started = time.perf_counter()
+    with transaction.atomic():
+        User.objects.bulk_create(User(username="user_{0}".format(i)) for i in range(size))
+        user_ids = list(User.objects.values_list("pk", flat=True))
+
+        apvs = [
+            AwardedPointValue(
+                target_user_id=rng.choice(user_ids),
+                points=rng.randint(-5, 20),
+                timestamp=now - datetime.timedelta(seconds=rng.randint(0, 60 * 60 * 24 * 60)),
+            )
+            for i in range(size)
+        ]
+        AwardedPointValue.objects.bulk_create(apvs)
+        PointRollup.record((PointRollup.target_key(apv), apv.timestamp, apv.points) for apv in apvs)
+
+        totals = dict((pk, 0) for pk in user_ids)
+        for apv in apvs:
+            totals[apv.target_user_id] += apv.points
+        TargetStat.objects.bulk_create(
+            TargetStat(target_user_id=pk, points=points) for pk, points in totals.items()
+        )
+        TargetStat.update_positions()
+
+        user_type = ContentType.objects.get_for_model(User)
+        pairs = set()
+        while len(pairs) < size // 10:
+            pairs.add((rng.choice(user_ids), rng.choice(user_ids)))
+        Vote.objects.bulk_create(
+            Vote(voter_id=voter, target_content_type=user_type, target_object_id=target, vote=1)
+            for voter, target in pairs
+        )
+    sys.stderr.write("generated {0} targets in {1:.1f}s\n".format(size, time.perf_counter() - started))
+
+
+def operations(rng, user_ids):
+    """
+    ``(name, iterations divisor, callable)`` for each benchmarked operation.
+    """
+    from django.contrib.auth.models import User
+    from pinax.points.models import (
+        TargetStat,
+        VoteError,
+        award_points,
+        fetch_top_objects,
+        points_awarded,
+        record_vote,
+    )
+
+    def user():
+        return User(pk=rng.choice(user_ids))
+
+    week = datetime.timedelta(days=7)
+
+    def vote():
+        try:
+            record_vote(user(), user(), rng.choice([-1, 0, 1]))
+        except VoteError:
+            # repeating an up or down vote raises; it still costs the swap
+            pass
+
+    return [
+        ("award_points", 1, lambda: award_points(user(), rng.randint(-5, 20))),
+        ("update_positions", 20, lambda: TargetStat.update_positions()),
+        ("fetch_top_objects", 1, lambda: list(fetch_top_objects(User, None)[:10])),
+        ("fetch_top_objects_timeframed", 10, lambda: list(fetch_top_objects(User, week)[:10])),
+        ("points_awarded", 1, lambda: points_awarded(user())),
+        ("points_awarded_since", 1, lambda: points_awarded(user(), since=datetime.datetime.now() - week)),
+        ("record_vote", 1, vote),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure(func, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries = [], 0
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        queries += len(captured)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / sum(timings), 2),
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "max_ms": round(max(timings) * 1000, 3),
+        "queries_per_op": round(queries / iterations, 2),
+    }
+
+
+def metadata(size):
+    from django.db import connection
+
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "size": size,
+        "revision": revision,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": connection.Database.sqlite_version,
+        "platform": platform.platform(),
+        "date": datetime.datetime.now().isoformat(),
+    }
+
+
+def run(args):
+    setup(args.size, args.rebuild)
+
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    rng = random.Random(0)
+    user_ids = list(User.objects.values_list("pk", flat=True))
+    results = {"meta": metadata(args.size), "operations": {}}
+    for name, divisor, func in operations(rng, user_ids):
+        if args.only and name not in args.only:
+            continue
+        with transaction.atomic():
+            results["operations"][name] = measure(func, max(1, args.iterations // divisor))
+            transaction.set_rollback(True)
+        sys.stderr.write("{0}: {1}\n".format(name, results["operations"][name]))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    row = "{0:<30} {1:>12} {2:>12} {3:>8} {4:>10} {5:>10} {6:>8}\n"
+    sys.stdout.write(row.format("operation", "old ops/s", "new ops/s", "change", "old p95", "new p95", "queries"))
+    for name in sorted(set(old["operations"]) | set(new["operations"])):
+        a, b = old["operations"].get(name), new["operations"].get(name)
+        if a is None or b is None:
+            sys.stdout.write("{0:<30} only in {1}\n".format(name, "new" if a is None else "old"))
+            continue
+        sys.stdout.write(row.format(
+            name,
+            a["ops_per_sec"],
+            b["ops_per_sec"],
+            "{0:+.0%}".format(b["ops_per_sec"] / a["ops_per_sec"] - 1),
+            a["p95_ms"],
+            b["p95_ms"],
+            "{0}->{1}".format(a["queries_per_op"], b["queries_per_op"]),
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--size", type=int, default=10000, help="targets and ledger rows (e.g. 10000, 100000, 1000000)")
+    run_parser.add_argument("--iterations", type=int, default=200, help="calls per operation")
+    run_parser.add_argument("--only", nargs="*", help="operations to run")
+    run_parser.add_argument("--output", help="write results to this JSON file")
+    run_parser.add_argument("--rebuild", action="store_true", help="regenerate the dataset")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
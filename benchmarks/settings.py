@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+INSTALLED_APPS = [
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sites",
+    "pinax.points",
+]
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get(
+            "PINAX_POINTS_BENCH_DB",
+            os.path.join(tempfile.gettempdir(), "pinax-points-bench.sqlite3"),
+        ),
+    }
+}
+SITE_ID = 1
+SECRET_KEY = "notasecret"
+MIDDLEWARE = []
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates"
+    },
+]
+DEBUG = False
@@ -1,18 +1,61 @@
+import logging
 from functools import update_wrapper
 
 import django
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin import helpers
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
 from django.shortcuts import redirect, render
-from django.template import RequestContext
+from django.utils.functional import cached_property
 
-from .forms import OneOffPointAwardForm
+from . import sql
+from .forms import BulkPointAwardForm, OneOffPointAwardForm
 from .models import AwardedPointValue, PointValue
 
+logger = logging.getLogger(__name__)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Reads the planner's row estimate instead of running ``COUNT(*)`` when
+    the whole of a large table is listed. Filtered lists, small tables and
+    backends without an estimate are counted exactly.
+    """
+
+    # estimates below this are counted exactly
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            connection = connections[queryset.db]
+            statement = sql.estimated_count(connection, queryset.model)
+            if statement is not None:
+                with connection.cursor() as cursor:
+                    cursor.execute(*statement)
+                    row = cursor.fetchone()
+                if row is not None and row[0] is not None and row[0] >= self.threshold:
+                    return int(row[0])
+        return super(EstimatedCountPaginator, self).count
+
 
 class AwardedPointValueAdmin(admin.ModelAdmin):
-    list_display = ["pk", "reason_display", "target", "points"]
+    list_display = ["pk", "reason_display", "target", "points", "timestamp"]
+    list_filter = [("timestamp", admin.DateFieldListFilter), "value"]
+    list_select_related = ["target_user", "value"]
     fields = ["target_user", "value", "timestamp"]
+    raw_id_fields = ["target_user"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "pinax/admin/pinax/points/awardedpointvalue/change_list.html"
+
+    def get_queryset(self, request):
+        # generic targets are loaded with one query per content type
+        return super(AwardedPointValueAdmin, self).get_queryset(request).prefetch_related("target_object")
 
     def target(self, obj):
         if obj.target_user_id:
@@ -50,29 +93,115 @@ class AwardedPointValueAdmin(admin.ModelAdmin):
                 r"^one_off_points/$",
                 wrap(self.one_off_points),
                 name="{0}_{1}_one_off_points".format(info[0], info[1])
+                ), url(
+                r"^bulk_points/$",
+                wrap(self.bulk_points),
+                name="{0}_{1}_bulk_points".format(info[0], info[1])
                 )] + urlpatterns
 
+    def user_widget(self):
+        """
+        A raw id picker for users, so forms don't render every user.
+        """
+        return ForeignKeyRawIdWidget(self.model._meta.get_field("target_user").remote_field, self.admin_site)
+
     def one_off_points(self, request):
         if request.method == "POST":
             form = OneOffPointAwardForm(request.POST)
             if form.is_valid():
                 form.award()
-                return redirect("admin:points_awardedpointvalue_changelist")
+                return redirect("admin:pinax_points_awardedpointvalue_changelist")
         else:
             form = OneOffPointAwardForm()
+        form.fields["user"].widget = self.user_widget()
         form = helpers.AdminForm(
             form=form,
-            fieldsets=[(None, {"fields": form.base_fields.keys()})],
+            fieldsets=[(None, {"fields": list(form.fields)})],
             prepopulated_fields={},
             model_admin=self
         )
-        ctx = {
-            "opts": self.model._meta,
-            "form": form,
-        }
-        ctx = RequestContext(request, ctx)
+        ctx = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            form=form,
+            media=self.media + form.media,
+            title="Award one-off points",
+        )
         return render(request, "pinax/points/one_off_points.html", ctx)
 
+    def bulk_points(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = BulkPointAwardForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            award_bulk(request, form)
+            return redirect("admin:pinax_points_awardedpointvalue_changelist")
+        return render_bulk_points(self, request, form)
+
+
+def render_bulk_points(model_admin, request, form, **extra):
+    form = helpers.AdminForm(
+        form=form,
+        fieldsets=[(None, {"fields": list(form.fields)})],
+        prepopulated_fields={},
+        model_admin=model_admin
+    )
+    ctx = dict(
+        model_admin.admin_site.each_context(request),
+        opts=AwardedPointValue._meta,
+        form=form,
+        media=form.media,
+        title="Award points to many users",
+        user_count=None,
+    )
+    ctx.update(extra)
+    return render(request, "pinax/points/bulk_points.html", ctx)
+
+
+def award_bulk(request, form):
+    """
+    Runs ``form``'s award, logging progress after each chunk, and reports
+    the result to the user.
+    """
+    def progress(done):
+        logger.info("Bulk award by %s: %s users awarded", request.user, done)
+
+    count = form.award(progress=progress)
+    messages.success(request, "Awarded {0} points to {1} user{2}.".format(
+        form.cleaned_data["points"], count, "" if count == 1 else "s"
+    ))
+
+
+def award_points_action(modeladmin, request, queryset):
+    """
+    An action for the user admin that awards the same points to every
+    selected user (or every user matching the changelist's filters when all
+    are selected) through an intermediate form.
+    """
+    if not request.user.has_perm("{0}.add_{1}".format(
+        AwardedPointValue._meta.app_label, AwardedPointValue._meta.model_name
+    )):
+        raise PermissionDenied
+    if request.POST.get("apply"):
+        form = BulkPointAwardForm(request.POST, queryset=queryset)
+        if form.is_valid():
+            award_bulk(request, form)
+            return None
+    else:
+        form = BulkPointAwardForm(queryset=queryset)
+    return render_bulk_points(
+        modeladmin,
+        request,
+        form,
+        action=request.POST.get("action"),
+        select_across=request.POST.get("select_across", "0"),
+        selected=request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        user_count=queryset.count(),
+    )
+
+
+award_points_action.short_description = "Award points to selected users"
+
 
 admin.site.register(AwardedPointValue, AwardedPointValueAdmin)
 admin.site.register(PointValue)
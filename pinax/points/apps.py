@@ -7,3 +7,6 @@ class AppConfig(BaseAppConfig):
     name = "pinax.points"
     label = "pinax_points"
     verbose_name = _("Pinax Points")
+
+    def ready(self):
+        from . import receivers  # noqa
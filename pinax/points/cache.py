@@ -0,0 +1,199 @@
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+POINT_VALUE_CACHE_SIZE = getattr(settings, "PINAX_POINTS_POINT_VALUE_CACHE_SIZE", 1000)
+POINT_VALUE_CACHE_TIMEOUT = getattr(settings, "PINAX_POINTS_POINT_VALUE_CACHE_TIMEOUT", 300)
+SHARED_CACHE = getattr(settings, "PINAX_POINTS_CACHE", None)
+TOP_OBJECTS_CACHE_TIMEOUT = getattr(settings, "PINAX_POINTS_TOP_OBJECTS_CACHE_TIMEOUT", 0)
+
+
+class BoundedCache(object):
+    """
+    A small thread-safe LRU mapping whose entries also expire after
+    ``timeout`` seconds (``None`` to keep them until evicted).
+    """
+
+    def __init__(self, size, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        expires = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_values(self, predicate):
+        with self._lock:
+            for key in [k for k, (e, v) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+point_values = BoundedCache(POINT_VALUE_CACHE_SIZE, POINT_VALUE_CACHE_TIMEOUT)
+
+
+def shared_cache():
+    """
+    The Django cache named by ``PINAX_POINTS_CACHE``, if any.
+    """
+    if SHARED_CACHE is None:
+        return None
+    return caches[SHARED_CACHE]
+
+
+def point_value_cache_key(key):
+    return "pinax-points:point-value:{0}".format(key)
+
+
+def get_point_value(key, loader):
+    """
+    Returns ``(id, value)`` for the ``PointValue`` with ``key``, checking the
+    process-local cache, then the shared cache, then calling ``loader(key)``.
+    """
+    hit = point_values.get(key)
+    if hit is not None:
+        return hit
+    shared = shared_cache()
+    if shared is not None:
+        hit = shared.get(point_value_cache_key(key))
+    if hit is None:
+        hit = loader(key)
+        if shared is not None:
+            shared.set(point_value_cache_key(key), hit, POINT_VALUE_CACHE_TIMEOUT)
+    point_values.set(key, tuple(hit))
+    return tuple(hit)
+
+
+def invalidate_point_value(key, pk=None):
+    """
+    Drops ``key`` (and, locally, anything else cached for ``pk``).
+    """
+    point_values.discard(key)
+    if pk is not None:
+        point_values.discard_values(lambda hit: hit[0] == pk)
+    shared = shared_cache()
+    if shared is not None:
+        shared.delete(point_value_cache_key(key))
+
+
+def leaderboard_cache():
+    """
+    The Django cache used for ``top_objects``: ``PINAX_POINTS_CACHE`` if set,
+    otherwise the default cache.
+    """
+    return caches[SHARED_CACHE or DEFAULT_CACHE_ALIAS]
+
+
+def _top_objects_version_key(model, timeframed):
+    return "pinax-points:top-objects:{0}:{1}:version".format(
+        model._meta.label_lower, "window" if timeframed else "all"
+    )
+
+
+def _top_objects_cutoff_key(model):
+    return "pinax-points:top-objects:{0}:cutoff".format(model._meta.label_lower)
+
+
+def _top_objects_version(cache, model, timeframed):
+    key = _top_objects_version_key(model, timeframed)
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def get_top_objects(model, limit, time_limit, loader):
+    """
+    Returns the cached ``top_objects`` list for ``model``, ``limit`` and
+    ``time_limit``, calling ``loader()`` to fill it on a miss. Caching is off
+    unless ``PINAX_POINTS_TOP_OBJECTS_CACHE_TIMEOUT`` is set.
+
+    All-time entries remember the lowest score on them so that awards which
+    can't reach the list leave it cached; see ``invalidate_top_objects``.
+    """
+    if not TOP_OBJECTS_CACHE_TIMEOUT:
+        return loader()
+    cache = leaderboard_cache()
+    timeframed = time_limit is not None
+    version = _top_objects_version(cache, model, timeframed)
+    key = "pinax-points:top-objects:{0}:{1}:{2}:{3}".format(
+        model._meta.label_lower,
+        limit,
+        int(time_limit.total_seconds()) if timeframed else "all",
+        version,
+    )
+    objects = cache.get(key)
+    if objects is None:
+        objects = list(loader())
+        if not timeframed:
+            if limit is None or len(objects) < limit:
+                cutoff = float("-inf")
+            else:
+                cutoff = objects[-1].num_points
+            _lower_cutoff(cache, model, cutoff)
+        cache.set(key, objects, TOP_OBJECTS_CACHE_TIMEOUT)
+    return objects
+
+
+def _lower_cutoff(cache, model, cutoff):
+    key = _top_objects_cutoff_key(model)
+    current = cache.get(key)
+    if current is None or cutoff < current:
+        cache.set(key, cutoff, TOP_OBJECTS_CACHE_TIMEOUT)
+
+
+def invalidate_top_objects(model, old_total=None, new_total=None):
+    """
+    Drops cached ``top_objects`` for ``model`` that an award moving a target
+    from ``old_total`` to ``new_total`` could change. Timeframed entries are
+    always dropped; all-time ones only when the target was or now is at or
+    above the lowest score on any cached list (or when the totals are unknown).
+    """
+    if not TOP_OBJECTS_CACHE_TIMEOUT:
+        return
+    cache = leaderboard_cache()
+    keys = [_top_objects_version_key(model, True)]
+    cutoff = cache.get(_top_objects_cutoff_key(model))
+    if cutoff is None or old_total is None or new_total is None or max(old_total, new_total) >= cutoff:
+        keys.append(_top_objects_version_key(model, False))
+        cache.delete(_top_objects_cutoff_key(model))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
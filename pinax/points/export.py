@@ -0,0 +1,132 @@
+import csv
+import datetime
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import BULK_BATCH_SIZE, AwardedPointValue
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+FIELDS = [
+    "id",
+    "timestamp",
+    "points",
+    "key",
+    "reason",
+    "target_type",
+    "target_id",
+    "source_type",
+    "source_id",
+]
+COLUMNS = [
+    "pk",
+    "timestamp",
+    "points",
+    "value__key",
+    "reason",
+    "target_user",
+    "target_content_type",
+    "target_object_id",
+    "source_user",
+    "source_content_type",
+    "source_object_id",
+]
+
+
+def parse_when(value):
+    """
+    Parses an ISO date or datetime, as given to ``since`` and ``until``.
+    Raises ``ValueError`` for anything else.
+    """
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError("'{0}' is not an ISO date or datetime".format(value))
+        when = datetime.datetime.combine(day, datetime.time())
+    return when
+
+
+def ledger_rows(since=None, until=None, keys=None, chunk_size=BULK_BATCH_SIZE):
+    """
+    Yields a dict of ``FIELDS`` for each ``AwardedPointValue`` awarded at or
+    after ``since`` and before ``until``, optionally only for the
+    ``PointValue`` ``keys``, in id order. Rows are streamed ``chunk_size`` at
+    a time (from a server-side cursor where the backend has them) and
+    targets and sources are given as ``app_label.model`` and id from a map of
+    content types read up front, so memory use doesn't grow with the ledger.
+    """
+    queryset = AwardedPointValue._default_manager.order_by("pk")
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lt=until)
+    if keys:
+        queryset = queryset.filter(value__key__in=keys)
+
+    types = dict(
+        (pk, "{0}.{1}".format(app_label, model))
+        for pk, app_label, model in ContentType.objects.values_list("pk", "app_label", "model")
+    )
+    user_type = get_user_model()._meta.label_lower
+
+    def reference(user_id, content_type_id, object_id):
+        if user_id is not None:
+            return user_type, user_id
+        if content_type_id is not None:
+            return types.get(content_type_id), object_id
+        return None, None
+
+    for row in queryset.values_list(*COLUMNS).iterator(chunk_size=chunk_size):
+        pk, timestamp, points, key, reason = row[:5]
+        target_type, target_id = reference(*row[5:8])
+        source_type, source_id = reference(*row[8:11])
+        yield {
+            "id": pk,
+            "timestamp": timestamp.isoformat(),
+            "points": points,
+            "key": key,
+            "reason": reason,
+            "target_type": target_type,
+            "target_id": target_id,
+            "source_type": source_type,
+            "source_id": source_id,
+        }
+
+
+class _Line(object):
+    """
+    A file-like object for ``csv.writer`` that hands back what's written.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow([row[name] for name in FIELDS])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def export_lines(format, rows):
+    """
+    Encodes ``rows`` from ``ledger_rows`` as lines of ``format`` (one of
+    ``FORMATS``).
+    """
+    if format == "csv":
+        return csv_lines(rows)
+    if format == "ndjson":
+        return ndjson_lines(rows)
+    raise ValueError("Unknown export format '{0}'".format(format))
@@ -1,7 +1,15 @@
+import re
+
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    FieldError,
+    ValidationError,
+)
+from django.http import QueryDict
 
-from .models import award_points
+from .models import BULK_BATCH_SIZE, _chunks, award_points, award_points_bulk
 
 
 class OneOffPointAwardForm(forms.Form):
@@ -14,3 +22,105 @@ class OneOffPointAwardForm(forms.Form):
         points = self.cleaned_data["points"]
         reason = self.cleaned_data["reason"]
         award_points(user, points, reason=reason)
+
+
+class BulkPointAwardForm(forms.Form):
+    """
+    Awards the same points to many users: the ``queryset`` passed in (from an
+    admin action), the ids in an uploaded file or the users matching a
+    filter.
+    """
+
+    points = forms.IntegerField()
+    reason = forms.CharField(max_length=140)
+    user_ids = forms.FileField(
+        required=False,
+        help_text="A text file of user ids separated by commas, spaces or new lines.",
+    )
+    user_filter = forms.CharField(
+        required=False,
+        help_text=(
+            "Lookups on the user's own fields as a query string, "
+            "e.g. is_active=1&amp;date_joined__gte=2020-01-01."
+        ),
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.queryset = kwargs.pop("queryset", None)
+        super(BulkPointAwardForm, self).__init__(*args, **kwargs)
+        if self.queryset is not None:
+            del self.fields["user_ids"]
+            del self.fields["user_filter"]
+
+    def clean_user_ids(self):
+        upload = self.cleaned_data["user_ids"]
+        if upload is None:
+            return None
+        try:
+            text = b"".join(upload.chunks()).decode("utf-8")
+            return [int(pk) for pk in re.split(r"[\s,]+", text) if pk]
+        except (UnicodeDecodeError, ValueError):
+            raise ValidationError("The file must hold user ids separated by commas, spaces or new lines.")
+
+    def clean_user_filter(self):
+        lookups = QueryDict(self.cleaned_data["user_filter"]).dict()
+        if not lookups:
+            return None
+        model = get_user_model()
+        for lookup in lookups:
+            parts = lookup.split("__")
+            if "password" in parts:
+                raise ValidationError("Users can't be filtered by password.")
+            # plain fields only: following a relation could lead back to the
+            # user model and its passwords
+            name = model._meta.pk.name if parts[0] == "pk" else parts[0]
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or field.is_relation or not field.concrete:
+                raise ValidationError("Users can only be filtered by their own fields, not '{0}'.".format(parts[0]))
+        try:
+            model._default_manager.filter(**lookups).exists()
+        except (FieldError, ValidationError, ValueError) as e:
+            raise ValidationError("Invalid filter: {0}".format(e))
+        return lookups
+
+    def clean(self):
+        cleaned_data = super(BulkPointAwardForm, self).clean()
+        if self.queryset is None and not self.errors:
+            if (cleaned_data.get("user_ids") is None) == (cleaned_data.get("user_filter") is None):
+                raise ValidationError("Upload a list of user ids or enter a filter, but not both.")
+        return cleaned_data
+
+    def users(self, chunk_size=BULK_BATCH_SIZE):
+        """
+        Yields the chosen users, loading only their ids.
+        """
+        manager = get_user_model()._default_manager
+        if self.queryset is not None:
+            queryset = self.queryset
+        elif self.cleaned_data["user_filter"] is not None:
+            queryset = manager.filter(**self.cleaned_data["user_filter"])
+        else:
+            # ids that don't match a user are skipped
+            for chunk in _chunks(self.cleaned_data["user_ids"], chunk_size):
+                for user in manager.filter(pk__in=chunk).only("pk").order_by("pk"):
+                    yield user
+            return
+        for user in queryset.only("pk").order_by("pk").iterator(chunk_size=chunk_size):
+            yield user
+
+    def award(self, chunk_size=BULK_BATCH_SIZE, progress=None):
+        """
+        Awards the points with ``award_points_bulk``, ``chunk_size`` users
+        per transaction, calling ``progress(users awarded so far)`` after
+        each. Positions are recomputed once. Returns the number of users.
+        """
+        points = self.cleaned_data["points"]
+        reason = self.cleaned_data["reason"]
+        return len(award_points_bulk(
+            ((user, points, reason) for user in self.users(chunk_size)),
+            chunk_size=chunk_size,
+            progress=progress,
+        ))
@@ -0,0 +1,319 @@
+import bisect
+import collections
+import functools
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router, transaction
+from django.utils.module_loading import import_string
+
+from . import models
+
+LEADERBOARD_BACKEND = getattr(
+    settings, "PINAX_POINTS_LEADERBOARD_BACKEND", "pinax.points.leaderboard.SQLLeaderboard"
+)
+LEADERBOARD_OPTIONS = getattr(settings, "PINAX_POINTS_LEADERBOARD_OPTIONS", {})
+
+
+@functools.lru_cache(maxsize=None)
+def get_leaderboard():
+    """
+    The leaderboard backend named by ``PINAX_POINTS_LEADERBOARD_BACKEND``,
+    created with ``PINAX_POINTS_LEADERBOARD_OPTIONS`` on first use.
+    """
+    try:
+        backend = import_string(LEADERBOARD_BACKEND)
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "Could not import leaderboard backend '{0}': {1}".format(LEADERBOARD_BACKEND, e)
+        )
+    return backend(**LEADERBOARD_OPTIONS)
+
+
+def iter_totals():
+    """
+    Yields ``((content type id, object id), points)`` for every ``TargetStat``.
+    """
+    user_type = ContentType.objects.get_for_model(get_user_model()).pk
+    rows = models.TargetStat._default_manager.values_list(
+        "target_content_type", "target_object_id", "target_user", "points"
+    )
+    for content_type_id, object_id, user_id, points in rows.iterator():
+        if user_id is not None:
+            yield (user_type, user_id), points
+        else:
+            yield (content_type_id, object_id), points
+
+
+def _on_commit(func):
+    transaction.on_commit(func, using=router.db_for_write(models.TargetStat))
+
+
+class BaseLeaderboard(object):
+    """
+    Ranks targets by their ``TargetStat`` total. Positions follow SQL's
+    ``RANK()``: tied targets share a position and the next one skips past
+    them, counted across targets of every model.
+    """
+
+    # whether update() keeps TargetStat.position current; when it doesn't,
+    # positions read alongside TargetStat rows come from positions() instead
+    stores_positions = False
+
+    def update(self, totals, point_range):
+        """
+        Called after awards with ``{(content type id, object id): new total}``
+        and the ``(low, high)`` range of old and new totals involved.
+        """
+        raise NotImplementedError
+
+    def rank(self, target):
+        """
+        Returns ``target``'s position, or ``None`` if it has no points.
+        """
+        raise NotImplementedError
+
+    def top(self, model, limit=None):
+        """
+        Returns the top ``limit`` objects of ``model`` with ``num_points`` and
+        ``points_position`` set.
+        """
+        raise NotImplementedError
+
+    def positions(self, totals):
+        """
+        Returns ``{points: position}`` with the position a target with each
+        of ``totals`` points holds.
+        """
+        raise NotImplementedError
+
+    def rebuild(self):
+        """
+        Reloads every target's total from ``TargetStat``.
+        """
+        raise NotImplementedError
+
+
+class SQLLeaderboard(BaseLeaderboard):
+    """
+    Keeps ``TargetStat.position`` up to date with one ranking ``UPDATE`` per
+    award and reads leaderboards from ``TargetStat``.
+    """
+
+    stores_positions = True
+
+    def update(self, totals, point_range):
+        models.TargetStat.update_positions(point_range)
+
+    def rank(self, target):
+        stats, field = models.stats_for_model(target.__class__)
+        return stats.filter(**{field: target.pk}).values_list("position", flat=True).first()
+
+    def top(self, model, limit=None):
+        objs = models.fetch_leaderboard(model)
+        if limit is not None:
+            objs = objs[:limit]
+        return objs
+
+    def positions(self, totals):
+        stats = models.TargetStat._default_manager.all()
+        return dict((points, stats.filter(points__gt=points).count() + 1) for points in set(totals))
+
+    def rebuild(self):
+        models.TargetStat.update_positions()
+
+
+class MemoryLeaderboard(BaseLeaderboard):
+    """
+    Keeps every total in sorted arrays in this process, so ranks and top-N
+    lists are binary searches and slices rather than queries. Loaded from
+    ``TargetStat`` on first use and updated as awards commit; awards made by
+    other processes are only seen after ``rebuild()``. ``TargetStat.position``
+    isn't maintained; positions are read from here instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._points = {}
+        self._all = []
+        self._by_type = collections.defaultdict(list)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.rebuild()
+
+    def rebuild(self):
+        totals = dict(iter_totals())
+        with self._lock:
+            self._points = totals
+            self._all = sorted((-points, key) for key, points in totals.items())
+            self._by_type = collections.defaultdict(list)
+            for entry in self._all:
+                self._by_type[entry[1][0]].append(entry)
+            self._loaded = True
+
+    def _set(self, key, points):
+        old = self._points.get(key)
+        if old is not None:
+            for entries in (self._all, self._by_type[key[0]]):
+                del entries[bisect.bisect_left(entries, (-old, key))]
+        self._points[key] = points
+        for entries in (self._all, self._by_type[key[0]]):
+            bisect.insort(entries, (-points, key))
+
+    def _position(self, points):
+        return bisect.bisect_left(self._all, (-points,)) + 1
+
+    def update(self, totals, point_range):
+        totals = dict(totals)
+
+        def apply():
+            with self._lock:
+                # not loaded yet: the first read loads these from TargetStat
+                if self._loaded:
+                    for key, points in totals.items():
+                        self._set(key, points)
+        _on_commit(apply)
+
+    def rank(self, target):
+        self._ensure_loaded()
+        with self._lock:
+            points = self._points.get(models.object_key(target))
+            if points is None:
+                return None
+            return self._position(points)
+
+    def positions(self, totals):
+        self._ensure_loaded()
+        with self._lock:
+            return dict((points, self._position(points)) for points in set(totals))
+
+    def top(self, model, limit=None):
+        self._ensure_loaded()
+        content_type_id = ContentType.objects.get_for_model(model).pk
+        with self._lock:
+            rows = [
+                (None, key[1], -neg_points, self._position(-neg_points))
+                for neg_points, key in self._by_type[content_type_id][:limit]
+            ]
+        return models._load_targets(model, rows)
+
+
+class RedisLeaderboard(BaseLeaderboard):
+    """
+    Keeps totals in Redis sorted sets shared by every process: one across all
+    targets for ranks and one per content type for top-N lists. Pass a
+    ``client`` with the redis-py sorted set API or a ``url``. Ties in top-N
+    lists are ordered by member rather than by ``TargetStat`` id, and
+    ``TargetStat.position`` isn't maintained; positions are read from here
+    instead.
+    """
+
+    def __init__(self, client=None, url="redis://localhost:6379/0", prefix="pinax-points:leaderboard"):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured("RedisLeaderboard requires the redis package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _all_key(self):
+        return "{0}:all".format(self.prefix)
+
+    def _types_key(self):
+        return "{0}:types".format(self.prefix)
+
+    def _type_key(self, content_type_id):
+        return "{0}:type:{1}".format(self.prefix, content_type_id)
+
+    def _add(self, totals):
+        by_type = collections.defaultdict(dict)
+        members = {}
+        for (content_type_id, object_id), points in totals.items():
+            members["{0}:{1}".format(content_type_id, object_id)] = points
+            by_type[content_type_id][str(object_id)] = points
+        if not members:
+            return
+        self.client.zadd(self._all_key(), members)
+        self.client.sadd(self._types_key(), *by_type.keys())
+        for content_type_id, points in by_type.items():
+            self.client.zadd(self._type_key(content_type_id), points)
+
+    def _position(self, points):
+        return self.client.zcount(self._all_key(), "({0}".format(points), "+inf") + 1
+
+    def _ranker(self, high, low):
+        """
+        Returns a function giving the position of any total from ``high``
+        down to ``low``, using one count of the totals above ``high`` and one
+        read of the totals in between.
+        """
+        above = self.client.zcount(self._all_key(), "({0}".format(high), "+inf")
+        scores = [
+            -points for member, points in self.client.zrevrangebyscore(self._all_key(), high, low, withscores=True)
+        ]
+        return lambda points: above + bisect.bisect_left(scores, -points) + 1
+
+    def update(self, totals, point_range):
+        totals = dict(totals)
+        _on_commit(lambda: self._add(totals))
+
+    def rank(self, target):
+        points = self.client.zscore(self._all_key(), "{0}:{1}".format(*models.object_key(target)))
+        if points is None:
+            return None
+        return self._position(points)
+
+    def top(self, model, limit=None):
+        content_type_id = ContentType.objects.get_for_model(model).pk
+        entries = self.client.zrevrange(
+            self._type_key(content_type_id), 0, -1 if limit is None else limit - 1, withscores=True
+        )
+        rows = []
+        if entries:
+            # entries are in points order, so one range covers all their ranks
+            position = self._ranker(entries[0][1], entries[-1][1])
+            rows = [(None, int(member), int(points), position(points)) for member, points in entries]
+        return models._load_targets(model, rows)
+
+    def positions(self, totals):
+        totals = set(totals)
+        if not totals:
+            return {}
+        position = self._ranker(max(totals), min(totals))
+        return dict((points, position(points)) for points in totals)
+
+    def _types(self):
+        return [int(t) for t in self.client.smembers(self._types_key())]
+
+    def _keys(self, types):
+        return [self._all_key(), self._types_key()] + [self._type_key(t) for t in types]
+
+    def rebuild(self):
+        # written under a staging prefix, then renamed over the live keys in
+        # one MULTI/EXEC so readers never see a partly built leaderboard
+        staging = RedisLeaderboard(self.client, prefix="{0}:rebuild".format(self.prefix))
+        self.client.delete(*staging._keys(staging._types()))
+        batch = {}
+        for key, points in iter_totals():
+            batch[key] = points
+            if len(batch) >= models.BULK_BATCH_SIZE:
+                staging._add(batch)
+                batch = {}
+        staging._add(batch)
+
+        types = staging._types()
+        live = self._keys(types) if types else []
+        pipe = self.client.pipeline()
+        dropped = [key for key in self._keys(self._types()) if key not in live]
+        if dropped:
+            pipe.delete(*dropped)
+        for src, dst in zip(staging._keys(types) if types else [], live):
+            pipe.rename(src, dst)
+        pipe.execute()
@@ -0,0 +1,119 @@
+import collections
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from ...models import (
+    BULK_BATCH_SIZE,
+    ArchivedPointValue,
+    AwardedPointValue,
+    PointRollup,
+    _chunks,
+)
+
+# rows are collapsed when all of these match (plus the hour)
+GROUP_FIELDS = [
+    "target_user_id",
+    "target_content_type_id",
+    "target_object_id",
+    "source_user_id",
+    "source_content_type_id",
+    "source_object_id",
+    "value_id",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapses AwardedPointValue rows older than --days into one row per "
+        "target, source, point value and hour, optionally archiving the "
+        "originals. Summary rows are dated at the start of their hour, so "
+        "windowed totals are unchanged for windows starting on the hour and "
+        "may differ within the first hour of other windows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, required=True, help="Compact rows older than this many days")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help="Ledger rows read per query (default %(default)s)",
+        )
+        parser.add_argument(
+            "--archive",
+            action="store_true",
+            help="Copy the collapsed rows to ArchivedPointValue",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=options["days"])
+        ledger = AwardedPointValue._default_manager.filter(timestamp__lt=cutoff).order_by("timestamp", "pk")
+        batch_size = options["batch_size"]
+        removed, created = 0, 0
+        # rows are read in time order; every group lies within an hour, so
+        # the hour still being read is carried into the next batch and the
+        # ones before it are complete. Summaries are dated at the start of
+        # their hour, behind the scan, so they aren't read again.
+        pending, rows = [], None
+        while rows is None or len(rows) == batch_size:
+            queryset = ledger
+            if pending:
+                last = pending[-1]
+                queryset = queryset.filter(
+                    models.Q(timestamp__gt=last.timestamp) | models.Q(timestamp=last.timestamp, pk__gt=last.pk)
+                )
+            rows = list(queryset[:batch_size])
+            pending.extend(rows)
+            if len(rows) == batch_size:
+                current = self.hour(pending[-1])
+                complete = [apv for apv in pending if self.hour(apv) != current]
+                if not complete:
+                    continue
+                pending = pending[len(complete):]
+            else:
+                complete, pending = pending, []
+            with transaction.atomic():
+                batch_removed, batch_created = self.compact(complete, options["archive"])
+            removed += batch_removed
+            created += batch_created
+        self.stdout.write("Compacted {0} awards into {1}".format(removed, created))
+
+    def hour(self, apv):
+        return PointRollup.truncate(apv.timestamp, PointRollup.HOUR)
+
+    def compact(self, rows, archive):
+        """
+        Replaces each group of two or more ``rows`` with a single summary row
+        dated at the start of their hour. The rollup buckets and the totals
+        per target and per source are unchanged.
+        """
+        groups = collections.defaultdict(list)
+        for apv in rows:
+            key = tuple(getattr(apv, name) for name in GROUP_FIELDS)
+            groups[key + (self.hour(apv),)].append(apv)
+
+        collapsed, summaries = [], []
+        for key, group in groups.items():
+            if len(group) < 2:
+                continue
+            summaries.append(AwardedPointValue(
+                reason="compacted from {0} awards".format(len(group)),
+                points=sum(apv.points for apv in group),
+                timestamp=key[-1],
+                **dict(zip(GROUP_FIELDS, key))
+            ))
+            collapsed.extend(group)
+
+        if not summaries:
+            return 0, 0
+        if archive:
+            ArchivedPointValue._default_manager.bulk_create(
+                [ArchivedPointValue.from_awarded(apv) for apv in collapsed]
+            )
+        # each summary lands in the hour and day buckets of the rows it replaces
+        for chunk in _chunks([apv.pk for apv in collapsed], BULK_BATCH_SIZE):
+            AwardedPointValue._default_manager.filter(pk__in=chunk).delete()
+        AwardedPointValue._default_manager.bulk_create(summaries, batch_size=BULK_BATCH_SIZE)
+        return len(collapsed), len(summaries)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...export import FORMATS, export_lines, ledger_rows, parse_when
+from ...models import BULK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Streams the AwardedPointValue ledger as CSV or NDJSON in id order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--since", help="Only awards at or after this ISO date or datetime")
+        parser.add_argument("--until", help="Only awards before this ISO date or datetime")
+        parser.add_argument(
+            "--key",
+            action="append",
+            dest="keys",
+            help="Only awards of this PointValue key (repeatable)",
+        )
+        parser.add_argument("--output", help="Write to this file instead of stdout")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help="Rows fetched per round trip (default %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since, until = [
+                parse_when(options[name]) if options[name] else None
+                for name in ("since", "until")
+            ]
+        except ValueError as e:
+            raise CommandError(str(e))
+        rows = ledger_rows(since, until, options["keys"], options["chunk_size"])
+        lines = export_lines(options["format"], rows)
+        if options["output"]:
+            with open(options["output"], "w", newline="") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
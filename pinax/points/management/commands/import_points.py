@@ -0,0 +1,175 @@
+import collections
+import csv
+import datetime
+import json
+import sys
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...export import FORMATS, parse_when
+from ...leaderboard import get_leaderboard
+from ...models import (
+    BULK_BATCH_SIZE,
+    AwardedPointValue,
+    PointRollup,
+    PointValue,
+    _chunks,
+)
+from .rebuild_points import check_targets
+
+
+def read_rows(f, format):
+    """
+    Yields ``(line number, dict)`` for each record in ``f``.
+    """
+    if format == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    raise CommandError("Line {0}: {1}".format(line_num, e))
+                yield line_num, row
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads historical awards from CSV or NDJSON (the columns written by "
+        "export_points) with bulk inserts, then rebuilds TargetStat totals and "
+        "positions once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin")
+        parser.add_argument(
+            "--format",
+            choices=sorted(FORMATS),
+            help="Defaults to the file extension, or csv",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help="Rows inserted per transaction (default %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        format = options["format"]
+        if format is None:
+            format = "ndjson" if options["path"].endswith((".ndjson", ".jsonl")) else "csv"
+        self.load_maps()
+
+        self.imported = 0
+        # object ids of the targets in committed batches, by content type id
+        self.touched = collections.defaultdict(set)
+        try:
+            if options["path"] == "-":
+                self.load(sys.stdin, format, options["batch_size"])
+            else:
+                with open(options["path"], newline="") as f:
+                    self.load(f, format, options["batch_size"])
+        except Exception:
+            # committed batches stay imported, so their totals are fixed up
+            # before the import's own error is raised
+            try:
+                self.repair(options["batch_size"])
+            except Exception as e:
+                self.stderr.write("Totals of the imported targets were not updated: {0}".format(e))
+            raise
+        checked, repaired = self.repair(options["batch_size"])
+        self.stdout.write("Imported {0} awards, updated {1} of {2} targets".format(
+            self.imported, repaired, checked
+        ))
+
+    def repair(self, batch_size):
+        """
+        Moves the totals of the targets imported so far to their ledger sums
+        and re-ranks them. Returns ``(targets checked, targets updated)``.
+        """
+        user_type = ContentType.objects.get_for_model(get_user_model()).pk
+        checked, totals, changed = 0, {}, []
+        for content_type_id, object_ids in self.touched.items():
+            checked += len(object_ids)
+            for row in check_targets(content_type_id, object_ids, batch_size):
+                (stat_type, object_id), stat_pk, points, total = row
+                totals[(user_type if stat_type is None else stat_type, object_id)] = total
+                changed.extend([points or 0, total])
+        if totals:
+            get_leaderboard().update(totals, (min(changed), max(changed)))
+        return checked, len(totals)
+
+    def load_maps(self):
+        self.point_values = dict(
+            (key, (pk, value)) for pk, key, value in PointValue._default_manager.values_list("pk", "key", "value")
+        )
+        self.types = dict(
+            ("{0}.{1}".format(app_label, model), pk)
+            for pk, app_label, model in ContentType.objects.values_list("pk", "app_label", "model")
+        )
+        self.user_type = get_user_model()._meta.label_lower
+        self.now = datetime.datetime.now()
+
+    def load(self, f, format, batch_size):
+        for chunk in _chunks(read_rows(f, format), batch_size):
+            apvs = []
+            for line_num, row in chunk:
+                try:
+                    apvs.append(self.build(row))
+                except KeyError as e:
+                    raise CommandError("Line {0}: missing {1}".format(line_num, e))
+                except ValueError as e:
+                    raise CommandError("Line {0}: {1}".format(line_num, e))
+            with transaction.atomic():
+                AwardedPointValue._default_manager.bulk_create(apvs)
+                PointRollup.record(
+                    (PointRollup.target_key(apv), apv.timestamp, apv.points) for apv in apvs
+                )
+            self.imported += len(apvs)
+            for apv in apvs:
+                if apv.target_user_id is not None:
+                    self.touched[None].add(apv.target_user_id)
+                else:
+                    self.touched[apv.target_content_type_id].add(apv.target_object_id)
+
+    def build(self, row):
+        """
+        An unsaved ``AwardedPointValue`` for ``row``. ``points`` defaults to
+        the value of ``key``, ``timestamp`` to now and ``source`` to none.
+        """
+        key = row.get("key") or None
+        value_id, points = None, row.get("points")
+        if key is not None:
+            if key not in self.point_values:
+                raise ValueError("unknown PointValue key '{0}'".format(key))
+            value_id, value = self.point_values[key]
+            if points in (None, ""):
+                points = value
+        if points in (None, ""):
+            raise ValueError("points or key is required")
+        apv = AwardedPointValue(
+            value_id=value_id,
+            points=int(points),
+            reason=row.get("reason") or "",
+            timestamp=parse_when(row["timestamp"]) if row.get("timestamp") else self.now,
+        )
+        self.assign(apv, "target", row["target_type"], row["target_id"])
+        if row.get("source_type"):
+            self.assign(apv, "source", row["source_type"], row["source_id"])
+        return apv
+
+    def assign(self, apv, name, type_label, object_id):
+        type_label = type_label.lower()
+        if type_label == self.user_type:
+            setattr(apv, "{0}_user_id".format(name), int(object_id))
+        elif type_label in self.types:
+            setattr(apv, "{0}_content_type_id".format(name), self.types[type_label])
+            setattr(apv, "{0}_object_id".format(name), int(object_id))
+        else:
+            raise ValueError("unknown {0} type '{1}'".format(name, type_label))
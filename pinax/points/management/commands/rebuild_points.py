@@ -0,0 +1,262 @@
+import concurrent.futures
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connections, models, router, transaction
+
+from ...leaderboard import get_leaderboard
+from ...models import (
+    BULK_BATCH_SIZE,
+    AwardedPointValue,
+    TargetStat,
+    _apply_totals,
+    _chunks,
+    level_for_points,
+)
+
+
+def partitions(workers):
+    """
+    Splits the targets into ``(content type id, low, high)`` object id ranges:
+    one per content type, or ``workers`` per content type when running in
+    parallel. Users have a content type id of ``None``.
+    """
+    types = set()
+    for model in (AwardedPointValue, TargetStat):
+        queryset = model._default_manager.order_by()
+        if queryset.filter(target_user__isnull=False).exists():
+            types.add(None)
+        types.update(
+            queryset.filter(target_user__isnull=True).values_list("target_content_type", flat=True).distinct()
+        )
+
+    result = []
+    for content_type_id in sorted(types, key=lambda t: -1 if t is None else t):
+        if workers < 2:
+            result.append((content_type_id, None, None))
+            continue
+        field = _id_field(content_type_id)
+        low, high = None, None
+        for model in (AwardedPointValue, TargetStat):
+            bounds = _filter(model, content_type_id).aggregate(low=models.Min(field), high=models.Max(field))
+            if bounds["low"] is not None:
+                low = bounds["low"] if low is None else min(low, bounds["low"])
+                high = bounds["high"] if high is None else max(high, bounds["high"])
+        if low is None:
+            continue
+        step = (high - low) // workers + 1
+        for start in range(low, high + 1, step):
+            result.append((content_type_id, start, min(start + step - 1, high)))
+    return result
+
+
+def _id_field(content_type_id):
+    return "target_user" if content_type_id is None else "target_object_id"
+
+
+def _filter(model, content_type_id, low=None, high=None):
+    field = _id_field(content_type_id)
+    if content_type_id is None:
+        queryset = model._default_manager.filter(target_user__isnull=False)
+    else:
+        queryset = model._default_manager.filter(target_user__isnull=True, target_content_type=content_type_id)
+    if low is not None:
+        lookup = "target_user__id__range" if content_type_id is None else "target_object_id__range"
+        queryset = queryset.filter(**{lookup: (low, high)})
+    return queryset.order_by(field)
+
+
+def _merge(ledger, stats):
+    """
+    Joins two streams sorted by target id, ``(id, points)`` from the ledger
+    and ``(id, stat pk, points)`` from ``TargetStat``, into ``(id, ledger
+    points, stat pk, stat points)`` with ``None`` for the missing side.
+    """
+    ledger, stats = iter(ledger), iter(stats)
+    total = next(ledger, None)
+    stat = next(stats, None)
+    while total is not None or stat is not None:
+        if stat is None or (total is not None and total[0] < stat[0]):
+            yield total[0], total[1], None, None
+            total = next(ledger, None)
+        elif total is None or stat[0] < total[0]:
+            yield stat[0], None, stat[1], stat[2]
+            stat = next(stats, None)
+        else:
+            yield total[0], total[1], stat[1], stat[2]
+            total, stat = next(ledger, None), next(stats, None)
+
+
+def check_partition(partition, batch_size=BULK_BATCH_SIZE, repair=True, collect=False):
+    """
+    Compares each target's ``TargetStat`` total in ``partition`` with the sum
+    of its ledger rows, streaming both sorted by target. Targets that look
+    drifted are read again ``batch_size`` at a time as they turn up, and
+    (with ``repair``) the ones still drifted are fixed. Returns ``(targets
+    checked, targets drifted, rows)``, where ``rows`` is only filled with
+    ``collect`` and holds ``(stat key, stat pk, stat points, ledger
+    points)`` for each drifted target.
+    """
+    content_type_id, low, high = partition
+    field = _id_field(content_type_id)
+    ledger = _filter(AwardedPointValue, content_type_id, low, high).values_list(field).annotate(
+        models.Sum("points")
+    ).iterator(chunk_size=batch_size)
+    stats = _filter(TargetStat, content_type_id, low, high).values_list(
+        field, "pk", "points"
+    ).iterator(chunk_size=batch_size)
+
+    checked, drifted, rows, suspects = 0, 0, [], []
+    for object_id, total, stat_pk, points in _merge(ledger, stats):
+        checked += 1
+        if _drifted(points, total):
+            suspects.append(object_id)
+        if len(suspects) == batch_size:
+            found = _recheck(content_type_id, suspects, repair)
+            drifted += len(found)
+            rows.extend(found if collect else [])
+            suspects = []
+    if suspects:
+        found = _recheck(content_type_id, suspects, repair)
+        drifted += len(found)
+        rows.extend(found if collect else [])
+    return checked, drifted, rows
+
+
+def check_targets(content_type_id, object_ids, batch_size=BULK_BATCH_SIZE, repair=True):
+    """
+    Like ``check_partition`` for just ``object_ids`` of one content type
+    (``None`` for users), read ``batch_size`` at a time. Returns the drifted
+    targets' rows as ``check_partition`` collects them.
+    """
+    found = []
+    for chunk in _chunks(sorted(object_ids), batch_size):
+        found.extend(_recheck(content_type_id, chunk, repair))
+    return found
+
+
+def _drifted(points, total):
+    total = total or 0
+    return points != total and not (points is None and total == 0)
+
+
+def _recheck(content_type_id, object_ids, repair):
+    """
+    Reads the stats and ledger sums of ``object_ids`` again in one
+    transaction, with the stats locked first when repairing so the two
+    streams' lack of a shared snapshot can't turn an award made meanwhile
+    into drift, and repairs the targets still drifted. Returns their rows
+    as ``check_partition`` describes.
+    """
+    field = _id_field(content_type_id)
+    lookup = {"{0}__in".format(field): object_ids}
+    with transaction.atomic(using=router.db_for_write(TargetStat)):
+        stats = _filter(TargetStat, content_type_id).filter(**lookup)
+        if repair:
+            stats = stats.select_for_update()
+        stats = dict(
+            (object_id, (stat_pk, points)) for object_id, stat_pk, points in stats.values_list(field, "pk", "points")
+        )
+        totals = dict(
+            _filter(AwardedPointValue, content_type_id).filter(**lookup).values_list(field).annotate(
+                models.Sum("points")
+            )
+        )
+        found = []
+        for object_id in object_ids:
+            stat_pk, points = stats.get(object_id, (None, None))
+            total = totals.get(object_id) or 0
+            if _drifted(points, total):
+                found.append(((content_type_id, object_id), stat_pk, points, total))
+        retry = _repair(found) if repair else []
+    if retry:
+        # created by an award since they were read; their rows can be locked now
+        found = [row for row in found if row[0][1] not in retry]
+        found.extend(_recheck(content_type_id, retry, repair))
+    return found
+
+
+def _repair(drifted):
+    """
+    Moves the drifted targets to their ledger totals. Returns the object ids
+    of missing stats that were created concurrently, to be checked again.
+    """
+    stats, totals, lookups, missing = {}, {}, {}, []
+    for stat_key, stat_pk, points, total in drifted:
+        content_type_id, object_id = stat_key
+        if content_type_id is None:
+            lookups[stat_key] = {"target_user_id": object_id}
+        else:
+            lookups[stat_key] = {"target_content_type_id": content_type_id, "target_object_id": object_id}
+        if stat_pk is None:
+            missing.append(TargetStat(**dict(lookups[stat_key], points=total, level=level_for_points(total))))
+        else:
+            stats[stat_key] = TargetStat(pk=stat_pk, points=points)
+            totals[stat_key] = total
+    _apply_totals(stats, totals, lookups)
+    if missing:
+        try:
+            with transaction.atomic(using=router.db_for_write(TargetStat)):
+                TargetStat._default_manager.bulk_create(missing, batch_size=BULK_BATCH_SIZE)
+        except IntegrityError:
+            return [stat_key[1] for stat_key, stat_pk, points, total in drifted if stat_pk is None]
+    return []
+
+
+def _init_worker():
+    django.setup()
+
+
+def _run_partition(args):
+    return check_partition(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every TargetStat total from the AwardedPointValue ledger, "
+        "reports the targets that drifted and repairs them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without repairing it")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help="Rows streamed and repaired per batch (default %(default)s)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Check content types and id ranges in this many processes",
+        )
+
+    def handle(self, *args, **options):
+        repair = not options["dry_run"]
+        # the drifted targets are only kept for the detailed report
+        collect = options["verbosity"] > 1
+        tasks = [(p, options["batch_size"], repair, collect) for p in partitions(options["workers"])]
+        if options["workers"] > 1:
+            # each worker opens its own connections
+            connections.close_all()
+            with concurrent.futures.ProcessPoolExecutor(options["workers"], initializer=_init_worker) as pool:
+                results = list(pool.map(_run_partition, tasks))
+        else:
+            results = [_run_partition(task) for task in tasks]
+
+        checked = sum(result[0] for result in results)
+        drifted = sum(result[1] for result in results)
+        if collect:
+            for (content_type_id, object_id), stat_pk, points, total in [row for r in results for row in r[2]]:
+                self.stdout.write("{0} {1}: TargetStat {2}, ledger {3}".format(
+                    "user" if content_type_id is None else "content type {0}".format(content_type_id),
+                    object_id,
+                    "missing" if points is None else points,
+                    total,
+                ))
+        if repair:
+            get_leaderboard().rebuild()
+        self.stdout.write("Checked {0} targets, {1} {2}".format(
+            checked, drifted, "repaired" if repair else "drifted"
+        ))
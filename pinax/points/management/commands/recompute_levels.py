@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from ...models import BULK_BATCH_SIZE, TargetStat
+
+
+class Command(BaseCommand):
+    help = "Recomputes TargetStat.level from PINAX_POINTS_LEVEL_THRESHOLDS, a chunk of rows at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=BULK_BATCH_SIZE,
+            help="Rows per UPDATE (default %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        stats = TargetStat._default_manager.order_by("pk").values_list("pk", flat=True)
+        low = stats.first()
+        updated = 0
+        while low is not None:
+            # the last primary key in this chunk and the first in the next
+            bounds = list(stats.filter(pk__gte=low)[chunk_size - 1:chunk_size + 1])
+            if not bounds:
+                # fewer than chunk_size rows left
+                updated += TargetStat.update_levels((low, stats.last()))
+                break
+            updated += TargetStat.update_levels((low, bounds[0]))
+            low = bounds[1] if len(bounds) > 1 else None
+        self.stdout.write("Updated the level of {0} targets".format(updated))
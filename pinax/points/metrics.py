@@ -0,0 +1,174 @@
+import collections
+import contextlib
+import functools
+import itertools
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.utils.module_loading import import_string
+
+METRICS_COLLECTOR = getattr(settings, "PINAX_POINTS_METRICS_COLLECTOR", None)
+METRICS_OPTIONS = getattr(settings, "PINAX_POINTS_METRICS_OPTIONS", {})
+
+
+@functools.lru_cache(maxsize=None)
+def get_collector():
+    """
+    The collector named by ``PINAX_POINTS_METRICS_COLLECTOR``, created with
+    ``PINAX_POINTS_METRICS_OPTIONS`` on first use, or ``None`` when
+    instrumentation is off.
+    """
+    if not METRICS_COLLECTOR:
+        return None
+    try:
+        collector = import_string(METRICS_COLLECTOR)
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "Could not import metrics collector '{0}': {1}".format(METRICS_COLLECTOR, e)
+        )
+    return collector(**METRICS_OPTIONS)
+
+
+def increment(name, value=1, **labels):
+    collector = get_collector()
+    if collector is not None:
+        collector.increment(name, labels, value)
+
+
+def observe(name, value, **labels):
+    collector = get_collector()
+    if collector is not None:
+        collector.observe(name, labels, value)
+
+
+def instrumented(operation):
+    """
+    Decorates a function so each call reports ``calls``, ``errors``,
+    ``duration_seconds`` and ``queries`` labelled with ``operation``. Costs
+    one attribute lookup per call when no collector is configured.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            collector = get_collector()
+            if collector is None:
+                return func(*args, **kwargs)
+            return _measure(collector, operation, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def _measure(collector, operation, func, args, kwargs):
+    labels = {"operation": operation}
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            return func(*args, **kwargs)
+    except Exception:
+        collector.increment("errors", labels, 1)
+        raise
+    finally:
+        collector.increment("calls", labels, 1)
+        collector.observe("duration_seconds", labels, time.perf_counter() - started)
+        collector.observe("queries", labels, queries[0])
+
+
+class BaseCollector(object):
+    """
+    Receives the measurements taken by ``instrumented`` functions. ``labels``
+    is a dict of strings; counters only go up and observations are summarised
+    however the collector likes.
+    """
+
+    def increment(self, name, labels, value):
+        raise NotImplementedError
+
+    def observe(self, name, labels, value):
+        raise NotImplementedError
+
+
+class MemoryCollector(BaseCollector):
+    """
+    Keeps counters and ``count``/``sum`` summaries of observations in this
+    process and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self, namespace="pinax_points"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(int)
+        self._summaries = collections.defaultdict(lambda: [0, 0])
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, labels, value):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            summary = self._summaries[self._key(name, labels)]
+            summary[0] += 1
+            summary[1] += value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def summary(self, name, **labels):
+        """
+        Returns ``(count, sum)`` of the values observed for ``name``.
+        """
+        with self._lock:
+            return tuple(self._summaries.get(self._key(name, labels), (0, 0)))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def exposition(self):
+        """
+        The current values in the Prometheus text format, for a scrape view.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted((k, tuple(v)) for k, v in self._summaries.items())
+        lines = []
+        for name, samples in itertools.groupby(counters, lambda sample: sample[0][0]):
+            lines.append(self._type(name + "_total", "counter"))
+            for (name, labels), value in samples:
+                lines.append(self._line(name + "_total", labels, value))
+        for name, samples in itertools.groupby(summaries, lambda sample: sample[0][0]):
+            lines.append(self._type(name, "summary"))
+            for (name, labels), (count, total) in samples:
+                lines.append(self._line(name + "_count", labels, count))
+                lines.append(self._line(name + "_sum", labels, total))
+        return "".join(line + "\n" for line in lines)
+
+    def _type(self, name, kind):
+        return "# TYPE {0}_{1} {2}".format(self.namespace, name, kind)
+
+    def _line(self, name, labels, value):
+        label_text = ",".join(
+            '{0}="{1}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in labels
+        )
+        return "{0}_{1}{2} {3}".format(
+            self.namespace,
+            name,
+            "{" + label_text + "}" if label_text else "",
+            repr(float(value)) if isinstance(value, float) else value,
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+def merge_duplicate_keys(apps, schema_editor):
+    """
+    Keep the oldest PointValue for each key and point awards for the
+    duplicates at it so the unique constraint can be added.
+    """
+    PointValue = apps.get_model('pinax_points', 'PointValue')
+    AwardedPointValue = apps.get_model('pinax_points', 'AwardedPointValue')
+    duplicates = (
+        PointValue.objects.values('key')
+        .annotate(count=models.Count('id'), keep=models.Min('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        others = PointValue.objects.filter(key=duplicate['key']).exclude(id=duplicate['keep'])
+        AwardedPointValue.objects.filter(value__in=others).update(value=duplicate['keep'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_keys, migrations.RunPython.noop),
+    ]
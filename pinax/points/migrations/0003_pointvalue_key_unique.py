@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0002_merge_duplicate_point_values'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointvalue',
+            name='key',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0003_pointvalue_key_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='awardedpointvalue',
+            index=models.Index(fields=['target_content_type', 'target_object_id', 'source_user', 'points'], name='pinax_apv_target_source'),
+        ),
+        migrations.AddIndex(
+            model_name='awardedpointvalue',
+            index=models.Index(fields=['target_user', 'source_user', 'points'], name='pinax_apv_user_source'),
+        ),
+        migrations.AddIndex(
+            model_name='awardedpointvalue',
+            index=models.Index(fields=['target_content_type', 'target_object_id', 'timestamp', 'points'], name='pinax_apv_target_time'),
+        ),
+        migrations.AddIndex(
+            model_name='awardedpointvalue',
+            index=models.Index(fields=['target_user', 'timestamp', 'points'], name='pinax_apv_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='targetstat',
+            index=models.Index(fields=['points'], name='pinax_stat_points'),
+        ),
+    ]
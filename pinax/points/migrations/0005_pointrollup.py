@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('pinax_points', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_object_id', models.IntegerField()),
+                ('period', models.CharField(choices=[('hour', 'hour'), ('day', 'day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('points', models.IntegerField(default=0)),
+                ('target_content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pointrollup_targets', to='contenttypes.ContentType')),
+            ],
+            options={
+                'unique_together': {('target_content_type', 'target_object_id', 'period', 'bucket')},
+            },
+        ),
+    ]
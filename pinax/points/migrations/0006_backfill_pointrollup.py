@@ -0,0 +1,74 @@
+import collections
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def truncate(timestamp, period):
+    if timezone.is_aware(timestamp):
+        timestamp = timestamp.astimezone(timezone.utc)
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def backfill(apps, schema_editor):
+    """
+    Builds the hour and day buckets from the existing ledger, one target at a
+    time so memory stays bounded by a single target's history.
+    """
+    AwardedPointValue = apps.get_model('pinax_points', 'AwardedPointValue')
+    PointRollup = apps.get_model('pinax_points', 'PointRollup')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    user_type = ContentType.objects.get_for_model(user_model)
+
+    rows = AwardedPointValue.objects.order_by(
+        'target_user', 'target_content_type', 'target_object_id'
+    ).values_list(
+        'target_user', 'target_content_type', 'target_object_id', 'timestamp', 'points'
+    ).iterator()
+
+    def flush(target, buckets):
+        PointRollup.objects.bulk_create([
+            PointRollup(
+                target_content_type_id=target[0],
+                target_object_id=target[1],
+                period=period,
+                bucket=bucket,
+                points=points,
+            )
+            for (period, bucket), points in buckets.items()
+        ], batch_size=500)
+
+    current, buckets = None, collections.Counter()
+    for user_id, content_type_id, object_id, timestamp, points in rows:
+        if user_id is not None:
+            target = (user_type.pk, user_id)
+        else:
+            target = (content_type_id, object_id)
+        if target != current:
+            if current is not None:
+                flush(current, buckets)
+            current, buckets = target, collections.Counter()
+        for period in ('hour', 'day'):
+            buckets[(period, truncate(timestamp, period))] += points
+    if current is not None:
+        flush(current, buckets)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('pinax_points', 'PointRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0005_pointrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
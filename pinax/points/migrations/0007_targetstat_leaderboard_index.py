@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0006_backfill_pointrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='targetstat',
+            index=models.Index(fields=['target_content_type', '-points', 'id'], name='pinax_stat_type_points'),
+        ),
+    ]
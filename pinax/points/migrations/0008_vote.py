@@ -0,0 +1,31 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pinax_points', '0007_targetstat_leaderboard_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_object_id', models.IntegerField()),
+                ('vote', models.SmallIntegerField(default=0)),
+                ('previous', models.SmallIntegerField(default=0)),
+                ('target_content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_targets', to='contenttypes.ContentType')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pinax_points_votes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('voter', 'target_content_type', 'target_object_id')},
+            },
+        ),
+    ]
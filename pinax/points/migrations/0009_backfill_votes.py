@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    """
+    Votes used to be the sum of a source user's awards on a target; carry the
+    ones that summed to a valid vote over into the Vote table.
+    """
+    AwardedPointValue = apps.get_model('pinax_points', 'AwardedPointValue')
+    Vote = apps.get_model('pinax_points', 'Vote')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    user_type = ContentType.objects.get_for_model(apps.get_model(settings.AUTH_USER_MODEL))
+
+    sums = AwardedPointValue.objects.filter(
+        source_user__isnull=False,
+    ).values(
+        'source_user', 'target_user', 'target_content_type', 'target_object_id',
+    ).annotate(
+        vote=models.Sum('points'),
+    ).filter(
+        vote__in=[-1, 1],
+    ).order_by()
+
+    batch = []
+    for row in sums.iterator():
+        if row['target_user'] is not None:
+            target = (user_type.pk, row['target_user'])
+        else:
+            target = (row['target_content_type'], row['target_object_id'])
+        batch.append(Vote(
+            voter_id=row['source_user'],
+            target_content_type_id=target[0],
+            target_object_id=target[1],
+            vote=row['vote'],
+        ))
+        if len(batch) >= 500:
+            Vote.objects.bulk_create(batch)
+            batch = []
+    Vote.objects.bulk_create(batch)
+
+
+def clear(apps, schema_editor):
+    apps.get_model('pinax_points', 'Vote').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0008_vote'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, clear),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0009_backfill_votes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='targetstat',
+            name='last_awarded',
+            field=models.IntegerField(default=0),
+        ),
+    ]
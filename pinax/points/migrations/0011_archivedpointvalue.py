@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:26
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0010_targetstat_last_awarded'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPointValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('awarded_id', models.IntegerField()),
+                ('target_user_id', models.IntegerField(null=True)),
+                ('target_content_type_id', models.IntegerField(null=True)),
+                ('target_object_id', models.IntegerField(null=True)),
+                ('value_id', models.IntegerField(null=True)),
+                ('reason', models.CharField(max_length=140)),
+                ('points', models.IntegerField()),
+                ('source_user_id', models.IntegerField(null=True)),
+                ('source_content_type_id', models.IntegerField(null=True)),
+                ('source_object_id', models.IntegerField(null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('archived', models.DateTimeField(default=datetime.datetime.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pinax_points', '0011_archivedpointvalue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='awardedpointvalue',
+            index=models.Index(fields=['timestamp'], name='pinax_apv_time'),
+        ),
+    ]
@@ -1,16 +1,31 @@
+import bisect
+import collections
 import datetime
 import itertools
+import threading
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
-from django.db import IntegrityError, models, transaction
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from . import signals
+from . import cache, leaderboard, metrics, signals, sql
 
 ALLOW_NEGATIVE_TOTALS = getattr(settings, "PINAX_POINTS_ALLOW_NEGATIVE_TOTALS", True)
+BULK_BATCH_SIZE = getattr(settings, "PINAX_POINTS_BULK_BATCH_SIZE", 500)
+LEVEL_THRESHOLDS = sorted(getattr(settings, "PINAX_POINTS_LEVEL_THRESHOLDS", []))
+SIGNAL_DISPATCH = getattr(settings, "PINAX_POINTS_SIGNAL_DISPATCH", "immediate")
+ROLLUP_FIELDS = {
+    "target_user",
+    "target_content_type",
+    "target_object_id",
+    "points",
+    "timestamp",
+}
 
 
 class PointValue(models.Model):
@@ -18,7 +33,7 @@ class PointValue(models.Model):
     Stores a key and its point value. Simple.
     """
 
-    key = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, unique=True)
     value = models.IntegerField()
 
     @classmethod
@@ -55,6 +70,46 @@ class AwardedPointValue(models.Model):
 
     timestamp = models.DateTimeField(default=datetime.datetime.now)
 
+    class Meta:
+        indexes = [
+            # votes and user_has_voted: SUM(points) for a source on a target
+            models.Index(
+                fields=["target_content_type", "target_object_id", "source_user", "points"],
+                name="pinax_apv_target_source",
+            ),
+            models.Index(fields=["target_user", "source_user", "points"], name="pinax_apv_user_source"),
+            # points_awarded(target, since=...)
+            models.Index(
+                fields=["target_content_type", "target_object_id", "timestamp", "points"],
+                name="pinax_apv_target_time",
+            ),
+            models.Index(fields=["target_user", "timestamp", "points"], name="pinax_apv_user_time"),
+            # admin date filter, export since/until
+            models.Index(fields=["timestamp"], name="pinax_apv_time"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the row and moves its points between ``PointRollup`` buckets.
+        ``QuerySet.update()`` and ``bulk_create()`` bypass this and have to
+        call ``PointRollup.record()`` themselves.
+        """
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and not ROLLUP_FIELDS.intersection(update_fields):
+            return super(AwardedPointValue, self).save(*args, **kwargs)
+        awards = []
+        if not self._state.adding:
+            previous = type(self)._default_manager.filter(pk=self.pk).first()
+            if previous is not None:
+                awards.append((PointRollup.target_key(previous), previous.timestamp, -previous.points))
+        super(AwardedPointValue, self).save(*args, **kwargs)
+        awards.append((PointRollup.target_key(self), self.timestamp, self.points))
+        PointRollup.record(awards)
+
+    def delete(self, *args, **kwargs):
+        PointRollup.record([(PointRollup.target_key(self), self.timestamp, -self.points)])
+        return super(AwardedPointValue, self).delete(*args, **kwargs)
+
     @classmethod
     def points_awarded(cls, **lookup_params):
         qs = cls._default_manager.filter(**lookup_params)
@@ -91,27 +146,179 @@ class TargetStat(models.Model):
     points = models.IntegerField(default=0)
     position = models.PositiveIntegerField(null=True)
     level = models.PositiveIntegerField(default=1)
+    # the change the latest award actually made to points, after any floor
+    last_awarded = models.IntegerField(default=0)
 
     class Meta:
         unique_together = [(
             "target_content_type",
             "target_object_id",
         )]
+        indexes = [
+            # ranking and leaderboards
+            models.Index(fields=["points"], name="pinax_stat_points"),
+            models.Index(fields=["target_content_type", "-points", "id"], name="pinax_stat_type_points"),
+        ]
 
     @classmethod
-    def update_points(cls, given, lookup_params):
-        return cls._default_manager.filter(**lookup_params).update(
-            points=models.F("points") + given,
-        )
+    def level_expression(cls, given=0):
+        """
+        The level each row reaches once ``given`` is added to its points.
+        """
+        whens = [
+            models.When(points__gte=threshold - given, then=models.Value(level))
+            for level, threshold in reversed(list(enumerate(LEVEL_THRESHOLDS, 2)))
+        ]
+        return models.Case(*whens, default=models.Value(1), output_field=models.PositiveIntegerField())
+
+    @classmethod
+    def points_update(cls, given, floor=False):
+        """
+        ``update()`` arguments adding ``given`` to the points, recording the
+        change applied in ``last_awarded`` and moving the level when
+        ``PINAX_POINTS_LEVEL_THRESHOLDS`` is set. With ``floor`` a total that
+        would go below zero stops at zero.
+        """
+        integer = models.IntegerField()
+        values = {"last_awarded": models.Value(given, output_field=integer)}
+        level = cls.level_expression(given) if LEVEL_THRESHOLDS else None
+        points = models.F("points") + given
+        if floor:
+            floored = models.Q(points__lt=-given)
+            values["last_awarded"] = models.Case(
+                models.When(floored, then=-models.F("points")), default=values["last_awarded"], output_field=integer
+            )
+            if level is not None:
+                level = models.Case(
+                    models.When(floored, then=models.Value(level_for_points(0))), default=level, output_field=integer
+                )
+            points = models.Case(models.When(floored, then=models.Value(0)), default=points, output_field=integer)
+        # points last: MySQL applies assignments left to right
+        if level is not None:
+            values["level"] = level
+        values["points"] = points
+        return values
+
+    @classmethod
+    def update_points(cls, given, lookup_params, floor=False):
+        return cls._default_manager.filter(**lookup_params).update(**cls.points_update(given, floor))
+
+    @classmethod
+    def update_levels(cls, pk_range=None):
+        """
+        Recomputes ``level`` for the rows with primary keys in ``pk_range``
+        (or all rows), writing only those that change. Returns the number of
+        rows updated.
+        """
+        queryset = cls._default_manager.all()
+        if pk_range is not None:
+            queryset = queryset.filter(pk__range=pk_range)
+        level = cls.level_expression()
+        return queryset.exclude(level=level).update(level=level)
+
+    @classmethod
+    def _read_points(cls, lookup_params):
+        return tuple(cls._default_manager.filter(**lookup_params).values_list("points", "last_awarded")[0])
+
+    @classmethod
+    def increment_points(cls, given, lookup_params, floor=False):
+        """
+        Adds ``given`` to the points of the target matching ``lookup_params``
+        (stopping at zero with ``floor``) and returns ``(new total, change
+        applied)``, or ``None`` if it has no ``TargetStat`` yet. Uses
+        ``UPDATE ... RETURNING`` where the backend supports it.
+        """
+        connection = connections[router.db_for_write(cls)]
+        if not sql.can_return_from_update(connection):
+            # read back under the lock the write takes, so a concurrent award
+            # can't land in between
+            with transaction.atomic(using=connection.alias, savepoint=False):
+                if not cls.update_points(given, lookup_params, floor):
+                    return None
+                return cls._read_points(lookup_params)
+        with connection.cursor() as cursor:
+            cursor.execute(*sql.increment_points(
+                connection, cls, given, lookup_params, LEVEL_THRESHOLDS, floor
+            ))
+            row = cursor.fetchone()
+        return None if row is None else tuple(row)
 
     @classmethod
+    def add_points(cls, given, lookup_params, floor=False):
+        """
+        Adds ``given`` to the points of the target matching ``lookup_params``,
+        creating its ``TargetStat`` if needed, and returns ``(new total,
+        change applied)``. With ``floor`` a total that would go below zero
+        stops at zero, decided by the database in the same statement. Uses the
+        backend's native upsert so the first award to a target costs no more
+        than any other.
+        """
+        connection = connections[router.db_for_write(cls)]
+        if not sql.can_upsert(connection):
+            return cls._add_points_with_savepoint(given, lookup_params, floor)
+        statement = sql.upsert_points(connection, cls, given, lookup_params, LEVEL_THRESHOLDS, floor)
+        if not sql.can_return_from_update(connection):
+            # as in increment_points, read back under the write's lock
+            with transaction.atomic(using=connection.alias, savepoint=False):
+                with connection.cursor() as cursor:
+                    cursor.execute(*statement)
+                return cls._read_points(lookup_params)
+        with connection.cursor() as cursor:
+            cursor.execute(*statement)
+            return tuple(cursor.fetchone())
+
+    @classmethod
+    def _add_points_with_savepoint(cls, given, lookup_params, floor=False):
+        result = cls.increment_points(given, lookup_params, floor)
+        if result is None:
+            inserted = max(given, 0) if floor else given
+            try:
+                sid = transaction.savepoint()
+                cls._default_manager.create(**dict(
+                    lookup_params,
+                    points=inserted,
+                    last_awarded=inserted,
+                    level=level_for_points(inserted),
+                ))
+                transaction.savepoint_commit(sid)
+                result = (inserted, inserted)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                result = cls.increment_points(given, lookup_params, floor)
+        return result
+
+    @classmethod
+    @metrics.instrumented("update_positions")
     def update_positions(cls, point_range=None):
+        """
+        Recomputes ``position`` for every target whose points fall within
+        ``point_range`` (or for all targets). Tied targets share a position and
+        the next position skips past them, as with SQL's ``RANK()``. Returns
+        the number of rows updated.
+        """
+        if point_range is not None and point_range[0] > point_range[1]:
+            # ensure point_range is always [0] < [1]
+            point_range = (point_range[1], point_range[0])
+
+        connection = connections[router.db_for_write(cls)]
+        if sql.can_rank(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(*sql.rank_positions(connection, cls, point_range))
+                updated = cursor.rowcount
+        else:
+            updated = cls._update_positions_grouped(point_range)
+        metrics.observe("rows_reranked", updated)
+        return updated
+
+    @classmethod
+    def _update_positions_grouped(cls, point_range=None):
+        """
+        Fallback for backends without window functions: groups the targets by
+        points in Python and issues one ``UPDATE`` per group.
+        """
         queryset = cls._default_manager.order_by("-points")
 
         if point_range is not None:
-            # ensure point_range is always [0] < [1]
-            if point_range[0] > point_range[1]:
-                point_range = (point_range[1], point_range[0])
             all_target_stats = queryset.filter(points__range=point_range)
             position = queryset.filter(points__gt=point_range[1]).count()
         else:
@@ -120,6 +327,7 @@ class TargetStat(models.Model):
 
         grouped_target_stats = itertools.groupby(all_target_stats, lambda x: x.points)
         prev_group_len = 0
+        updated = 0
 
         for points, target_stats in grouped_target_stats:
             position += prev_group_len + 1
@@ -128,7 +336,8 @@ class TargetStat(models.Model):
             pks = []
             for target_stat in target_stats:
                 pks.append(target_stat.pk)
-            cls._default_manager.filter(pk__in=pks).update(position=position)
+            updated += cls._default_manager.filter(pk__in=pks).update(position=position)
+        return updated
 
     @property
     def target(self):
@@ -148,80 +357,620 @@ class TargetStat(models.Model):
         return self.source_object
 
 
+class PointRollup(models.Model):
+    """
+    Stores the points awarded to a target per hour and per day, kept in step
+    with ``AwardedPointValue`` so windowed sums read whole buckets instead of
+    the ledger. Users are keyed by their content type like any other target.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+    PERIOD_CHOICES = [
+        (HOUR, "hour"),
+        (DAY, "day"),
+    ]
+
+    target_content_type = models.ForeignKey(ContentType, related_name="pointrollup_targets", on_delete=models.CASCADE)
+    target_object_id = models.IntegerField()
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [(
+            "target_content_type",
+            "target_object_id",
+            "period",
+            "bucket",
+        )]
+
+    @staticmethod
+    def aware(timestamp):
+        """
+        ``timestamp`` made aware in the default time zone when ``USE_TZ`` is
+        on and it is naive, as the ORM does when saving it.
+        """
+        if settings.USE_TZ and timezone.is_naive(timestamp):
+            return timezone.make_aware(timestamp, timezone.get_default_timezone())
+        return timestamp
+
+    @classmethod
+    def truncate(cls, timestamp, period):
+        """
+        Start of the ``period`` containing ``timestamp`` (in UTC when aware).
+        """
+        timestamp = cls.aware(timestamp)
+        if timezone.is_aware(timestamp):
+            timestamp = timestamp.astimezone(timezone.utc)
+        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+        if period == PointRollup.DAY:
+            timestamp = timestamp.replace(hour=0)
+        return timestamp
+
+    @classmethod
+    def ceil(cls, timestamp, period):
+        """
+        Start of the first whole ``period`` at or after ``timestamp``.
+        """
+        timestamp = cls.aware(timestamp)
+        start = cls.truncate(timestamp, period)
+        if start == timestamp:
+            return start
+        if period == cls.DAY:
+            return start + datetime.timedelta(days=1)
+        return start + datetime.timedelta(hours=1)
+
+    @staticmethod
+    def target_key(apv):
+        """
+        ``(content type id, object id)`` of an ``AwardedPointValue``'s target.
+        """
+        if apv.target_user_id is not None:
+            content_type = ContentType.objects.get_for_model(get_user_model())
+            return (content_type.pk, apv.target_user_id)
+        return (apv.target_content_type_id, apv.target_object_id)
+
+    @classmethod
+    def record(cls, awards):
+        """
+        Adds ``awards``, an iterable of ``(target_key, timestamp, points)``, to
+        their hour and day buckets with one upsert per batch.
+        """
+        increments = collections.Counter()
+        for (content_type_id, object_id), timestamp, points in awards:
+            for period in (cls.HOUR, cls.DAY):
+                bucket = cls.truncate(timestamp, period)
+                increments[(content_type_id, object_id, period, bucket)] += points
+
+        connection = connections[router.db_for_write(cls)]
+        fields = ["target_content_type", "target_object_id", "period", "bucket", "points"]
+        rows = [key + (points,) for key, points in increments.items() if points]
+        if not sql.can_upsert(connection):
+            for row in rows:
+                cls._record_with_savepoint(dict(zip(fields, row)))
+            return
+        rows = [
+            row[:3] + (connection.ops.adapt_datetimefield_value(row[3]), row[4])
+            for row in rows
+        ]
+        for chunk in _chunks(rows, BULK_BATCH_SIZE):
+            with connection.cursor() as cursor:
+                cursor.execute(*sql.upsert_increments(
+                    connection, cls, fields, fields[:4], "points", chunk
+                ))
+
+    @classmethod
+    def _record_with_savepoint(cls, row):
+        points = row.pop("points")
+        lookup = dict(row, target_content_type_id=row.pop("target_content_type"))
+        if cls._default_manager.filter(**lookup).update(points=models.F("points") + points):
+            return
+        try:
+            sid = transaction.savepoint()
+            cls._default_manager.create(points=points, **lookup)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            cls._default_manager.filter(**lookup).update(points=models.F("points") + points)
+
+    @classmethod
+    def points_since(cls, content_type_id, object_id, since):
+        """
+        Points awarded to the target since ``since``: whole hour and day
+        buckets come from the rollup, the partial hour at the start from the
+        ledger.
+        """
+        return cls.points_since_many(content_type_id, [object_id], since).get(object_id, 0)
+
+    @classmethod
+    def points_since_many(cls, content_type_id, object_ids, since):
+        """
+        Like ``points_since`` for many targets of one content type, returning
+        ``{object_id: points}`` for targets with any points in the window. The
+        buckets and the partial first hour are read in one ``UNION ALL``.
+        """
+        since = cls.aware(since)
+        hour = cls.ceil(since, cls.HOUR)
+        day = cls.ceil(since, cls.DAY)
+        buckets = cls._default_manager.filter(
+            target_content_type=content_type_id,
+            target_object_id__in=object_ids,
+        ).filter(
+            models.Q(period=cls.HOUR, bucket__gte=hour, bucket__lt=day) |
+            models.Q(period=cls.DAY, bucket__gte=day)
+        ).values_list("target_object_id").annotate(models.Sum("points")).order_by()
+        rows = buckets
+        if hour != since:
+            if content_type_id == ContentType.objects.get_for_model(get_user_model()).pk:
+                field, lookup = "target_user", {"target_user__in": object_ids}
+            else:
+                field = "target_object_id"
+                lookup = {"target_content_type": content_type_id, "target_object_id__in": object_ids}
+            edge = AwardedPointValue._default_manager.filter(
+                timestamp__gte=since,
+                timestamp__lt=hour,
+                **lookup
+            ).values_list(field).annotate(models.Sum("points")).order_by()
+            rows = buckets.union(edge, all=True)
+        totals = collections.Counter()
+        for object_id, points in rows:
+            totals[object_id] += points
+        return dict(totals)
+
+
+class Vote(models.Model):
+    """
+    Stores each user's current vote (-1, 0 or 1) on a target, so voting never
+    has to sum the ledger. ``previous`` is the vote this one replaced; it lets
+    a single upsert hand the old vote back.
+    """
+
+    voter = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="pinax_points_votes", on_delete=models.CASCADE)
+    target_content_type = models.ForeignKey(ContentType, related_name="vote_targets", on_delete=models.CASCADE)
+    target_object_id = models.IntegerField()
+    target = GenericForeignKey("target_content_type", "target_object_id")
+
+    vote = models.SmallIntegerField(default=0)
+    previous = models.SmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = [(
+            "voter",
+            "target_content_type",
+            "target_object_id",
+        )]
+
+    @classmethod
+    def swap(cls, voter, target, vote):
+        """
+        Records ``vote`` and returns the vote it replaced, or ``None`` if the
+        vote was already ``vote``. Uses one atomic upsert where the backend
+        supports ``RETURNING`` and a locked read-modify-write elsewhere.
+        """
+        content_type = ContentType.objects.get_for_model(target)
+        connection = connections[router.db_for_write(cls)]
+        if sql.can_swap_votes(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(*sql.swap_vote(
+                    connection, cls, voter.pk, content_type.pk, target.pk, vote
+                ))
+                row = cursor.fetchone()
+            return None if row is None else row[0]
+
+        lookup = {
+            "voter": voter,
+            "target_content_type": content_type,
+            "target_object_id": target.pk,
+        }
+        try:
+            with transaction.atomic(using=connection.alias):
+                return cls._swap_locked(lookup, vote)
+        except IntegrityError:
+            # lost a race to create the row; it exists and can be locked now
+            with transaction.atomic(using=connection.alias):
+                return cls._swap_locked(lookup, vote)
+
+    @classmethod
+    def _swap_locked(cls, lookup, vote):
+        existing = cls._default_manager.select_for_update().filter(**lookup).first()
+        if existing is None:
+            cls._default_manager.create(vote=vote, **lookup)
+            return 0
+        if existing.vote == vote:
+            return None
+        cls._default_manager.filter(pk=existing.pk).update(previous=existing.vote, vote=vote)
+        return existing.vote
+
+
+class ArchivedPointValue(models.Model):
+    """
+    An ``AwardedPointValue`` moved out of the ledger by ``compact_points
+    --archive``. Ids are copied as plain integers, without foreign keys or
+    indexes, so archiving stays cheap and outlives the objects involved.
+    """
+
+    awarded_id = models.IntegerField()
+    target_user_id = models.IntegerField(null=True)
+    target_content_type_id = models.IntegerField(null=True)
+    target_object_id = models.IntegerField(null=True)
+    value_id = models.IntegerField(null=True)
+    reason = models.CharField(max_length=140)
+    points = models.IntegerField()
+    source_user_id = models.IntegerField(null=True)
+    source_content_type_id = models.IntegerField(null=True)
+    source_object_id = models.IntegerField(null=True)
+    timestamp = models.DateTimeField()
+    archived = models.DateTimeField(default=datetime.datetime.now)
+
+    COPIED_FIELDS = [
+        "target_user_id",
+        "target_content_type_id",
+        "target_object_id",
+        "value_id",
+        "reason",
+        "points",
+        "source_user_id",
+        "source_content_type_id",
+        "source_object_id",
+        "timestamp",
+    ]
+
+    @classmethod
+    def from_awarded(cls, apv):
+        return cls(awarded_id=apv.pk, **dict((name, getattr(apv, name)) for name in cls.COPIED_FIELDS))
+
+
+def level_for_points(points):
+    """
+    The level a target with ``points`` is at under ``PINAX_POINTS_LEVEL_THRESHOLDS``.
+    """
+    return bisect.bisect_right(LEVEL_THRESHOLDS, points) + 1
+
+
+def _load_point_value(key):
+    try:
+        return PointValue._default_manager.values_list("id", "value").get(key=key)
+    except PointValue.DoesNotExist:
+        raise ImproperlyConfigured("PointValue for '{0}' does not exist".format(key))
+
+
 def get_points(key):
+    """
+    Resolves ``key`` to ``(point_value, points)``. Integer keys are one off
+    values; anything else is looked up as a ``PointValue`` key through
+    ``pinax.points.cache``.
+    """
     point_value = None
     if isinstance(key, int) and not isinstance(key, bool):
         points = key
     else:
-        try:
-            point_value = PointValue.objects.get(key=key)
-            points = point_value.value
-        except PointValue.DoesNotExist:
-            raise ImproperlyConfigured("PointValue for '{0}' does not exist".format(key))
+        pk, points = cache.get_point_value(key, _load_point_value)
+        point_value = PointValue(id=pk, key=key, value=points)
     return point_value, points
 
 
-def award_points(target, key, reason="", source=None):
+def _assign_target(apv, target):
     """
-    Awards target the point value for key.  If key is an integer then it's a
-    one off assignment and should be interpreted as the actual point value.
+    Points ``apv`` at ``target`` and returns the ``TargetStat`` lookup
+    parameters for it.
     """
-    point_value, points = get_points(key)
-
-    if not ALLOW_NEGATIVE_TOTALS:
-        total = points_awarded(target)
-        if total + points < 0:
-            reason = reason + "(floored from {0} to 0)".format(points)
-            points = -total
-
-    apv = AwardedPointValue(points=points, value=point_value, reason=reason)
     if isinstance(target, get_user_model()):
         apv.target_user = target
-        lookup_params = {
+        return {
             "target_user": target
         }
-    else:
-        apv.target_object = target
-        lookup_params = {
-            "target_content_type": apv.target_content_type,
-            "target_object_id": apv.target_object_id,
-        }
+    apv.target_object = target
+    return {
+        "target_content_type": apv.target_content_type,
+        "target_object_id": apv.target_object_id,
+    }
+
 
+def _assign_source(apv, source):
     if source is not None:
         if isinstance(source, get_user_model()):
             apv.source_user = source
         else:
             apv.source_object = source
 
-    apv.save()
 
-    if not TargetStat.update_points(points, lookup_params):
-        try:
-            sid = transaction.savepoint()
-            TargetStat._default_manager.create(
-                **dict(lookup_params, points=points)
-            )
-            transaction.savepoint_commit(sid)
-        except IntegrityError:
-            transaction.savepoint_rollback(sid)
-            TargetStat.update_points(points, lookup_params)
+@metrics.instrumented("award_points")
+def award_points(target, key, reason="", source=None):
+    """
+    Awards target the point value for key.  If key is an integer then it's a
+    one off assignment and should be interpreted as the actual point value.
+
+    The new total comes back from the write itself, so an award to a target
+    that already has points costs a fixed number of queries; see "Query
+    Budget" in the README.
+    """
+    point_value, points = get_points(key)
+
+    apv = AwardedPointValue(points=points, value=point_value, reason=reason)
+    lookup_params = _assign_target(apv, target)
+    _assign_source(apv, source)
+
+    # the stat, ledger row and rollup commit together; inside a caller's
+    # transaction no savepoint is taken, so a failure rolls that back too
+    with transaction.atomic(using=router.db_for_write(AwardedPointValue), savepoint=False):
+        # the floor is applied by the write itself; record what it applied
+        new_points, applied = TargetStat.add_points(points, lookup_params, floor=not ALLOW_NEGATIVE_TOTALS)
+        if applied != points:
+            apv.reason = reason + "(floored from {0} to 0)".format(points)
+            apv.points = points = applied
+
+        apv.save()
 
-    signals.points_awarded.send(
+    _dispatch_awarded([dict(
         sender=target.__class__,
         target=target,
         key=key,
         points=points,
-        source=source
-    )
+        source=source,
+        total=new_points
+    )])
 
-    new_points = points_awarded(target)
     old_points = new_points - points
 
-    TargetStat.update_positions((old_points, new_points))
+    leaderboard.get_leaderboard().update({object_key(target): new_points}, (old_points, new_points))
 
     return apv
 
 
+def _send_awarded(payloads):
+    for payload in payloads:
+        signals.points_awarded.send(**payload)
+    signals.points_awarded_batch.send(sender=AwardedPointValue, awards=payloads)
+
+
+def _dispatch_awarded(payloads):
+    """
+    Sends ``points_awarded`` for each payload (the signal's keyword
+    arguments) and one ``points_awarded_batch`` for all of them: straight
+    away, or with ``PINAX_POINTS_SIGNAL_DISPATCH = "on_commit"`` once the
+    open transaction commits, batched with its other awards made outside
+    savepoints.
+    """
+    using = router.db_for_write(AwardedPointValue)
+    if SIGNAL_DISPATCH == "on_commit" and transaction.get_connection(using).in_atomic_block:
+        _defer_awarded(using, payloads)
+    else:
+        _send_awarded(payloads)
+
+
+class _PendingAwards(object):
+    """
+    The awards queued in one thread's transactions on a database. Each award
+    has its own ``on_commit`` hook, so only committed ones are collected, and
+    the hook of the last award queued sends them all. Awards queued in the
+    outermost atomic block commit or roll back together, so that hook always
+    runs with the transaction.
+    """
+
+    def __init__(self):
+        self.last = 0
+        self.committed = []
+
+    def queue(self):
+        self.last += 1
+        return self.last
+
+    def collect(self, token, payloads):
+        self.committed.extend(payloads)
+        if token == self.last:
+            committed, self.committed = self.committed, []
+            _send_awarded(committed)
+
+
+_pending = threading.local()
+
+
+def _defer_awarded(using, payloads):
+    if any(transaction.get_connection(using).savepoint_ids):
+        # inside a savepoint: sent on their own so a rollback to it drops them
+        transaction.on_commit(lambda: _send_awarded(payloads), using=using)
+        return
+    pending = _pending.__dict__.setdefault(using, _PendingAwards())
+    token = pending.queue()
+    transaction.on_commit(lambda: pending.collect(token, payloads), using=using)
+
+
+def _stat_key(obj):
+    """
+    Identifies the target of an ``AwardedPointValue`` or ``TargetStat``.
+    """
+    if obj.target_user_id is not None:
+        return (None, obj.target_user_id)
+    return (obj.target_content_type_id, obj.target_object_id)
+
+
+def _fetch_target_stats(stat_keys, lock=False):
+    """
+    Returns a dict of ``_stat_key`` -> ``TargetStat`` for the given keys using
+    one query for users and one per content type for generic targets, locking
+    the rows with ``lock``.
+    """
+    object_ids = collections.defaultdict(list)
+    for content_type_id, object_id in stat_keys:
+        object_ids[content_type_id].append(object_id)
+
+    stats = {}
+    manager = TargetStat._default_manager
+    if lock:
+        manager = manager.select_for_update()
+    for content_type_id, ids in object_ids.items():
+        for chunk in _chunks(ids, BULK_BATCH_SIZE):
+            if content_type_id is None:
+                queryset = manager.filter(target_user__in=chunk)
+            else:
+                queryset = manager.filter(
+                    target_content_type=content_type_id,
+                    target_object_id__in=chunk,
+                )
+            for stat in queryset:
+                stats[_stat_key(stat)] = stat
+    return stats
+
+
+def _chunks(items, size):
+    items = iter(items)
+    chunk = list(itertools.islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, size))
+
+
+def _apply_totals(stats, totals, lookups):
+    """
+    Moves each target in ``totals`` to its new total: one ``UPDATE`` per
+    distinct delta for existing ``TargetStat`` rows and a single
+    ``bulk_create`` for the rest.
+    """
+    by_delta = collections.defaultdict(list)
+    new_stats = []
+    for stat_key, total in totals.items():
+        if stat_key not in stats:
+            new_stats.append(TargetStat(**dict(lookups[stat_key], points=total, level=level_for_points(total))))
+        elif total != stats[stat_key].points:
+            by_delta[total - stats[stat_key].points].append(stats[stat_key].pk)
+
+    for delta, pks in by_delta.items():
+        for chunk in _chunks(pks, BULK_BATCH_SIZE):
+            TargetStat._default_manager.filter(pk__in=chunk).update(**TargetStat.points_update(delta))
+
+    if new_stats:
+        _create_target_stats(new_stats, lookups)
+
+
+def _create_target_stats(new_stats, lookups):
+    try:
+        sid = transaction.savepoint()
+        TargetStat._default_manager.bulk_create(new_stats, batch_size=BULK_BATCH_SIZE)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # a concurrent award created some of these; apply them one by one
+        transaction.savepoint_rollback(sid)
+        for stat in new_stats:
+            lookup_params = lookups[_stat_key(stat)]
+            if not TargetStat.update_points(stat.points, lookup_params):
+                TargetStat._default_manager.create(
+                    **dict(lookup_params, points=stat.points, last_awarded=stat.points, level=stat.level)
+                )
+
+
+def award_points_bulk(awards, chunk_size=None, progress=None):
+    """
+    Awards many point values in one go. ``awards`` is an iterable of
+    ``(target, key, reason, source)`` tuples where ``reason`` and ``source``
+    may be left off. Ledger rows are written with ``bulk_create``, the
+    per-target deltas are applied with one ``UPDATE`` per distinct delta plus
+    one ``INSERT`` for new targets, and positions are recomputed once for the
+    combined point range.
+
+    With ``chunk_size``, awards are written that many at a time, each chunk
+    in its own transaction followed by ``progress(awards written so far)``
+    if given, and positions are recomputed once after the last chunk.
+
+    Returns the list of ``AwardedPointValue`` rows created.
+    """
+    resolved = {}
+    if chunk_size is None:
+        pending, lookups = _prepare_awards(awards, resolved)
+        if not pending:
+            return []
+        with transaction.atomic():
+            totals, point_range, payloads = _write_awards(pending, lookups)
+        _dispatch_awarded(payloads)
+        leaderboard.get_leaderboard().update(totals, point_range)
+        return [apv for apv, target, key, source in pending]
+
+    apvs, totals, changed = [], {}, []
+    for chunk in _chunks(awards, chunk_size):
+        pending, lookups = _prepare_awards(chunk, resolved)
+        with transaction.atomic():
+            chunk_totals, point_range, payloads = _write_awards(pending, lookups)
+        _dispatch_awarded(payloads)
+        apvs.extend(apv for apv, target, key, source in pending)
+        totals.update(chunk_totals)
+        changed.extend(point_range)
+        if progress is not None:
+            progress(len(apvs))
+    if totals:
+        leaderboard.get_leaderboard().update(totals, (min(changed), max(changed)))
+    return apvs
+
+
+def _prepare_awards(awards, resolved):
+    """
+    Builds an unsaved ``AwardedPointValue`` for each award, resolving each
+    distinct key once through ``resolved``. Returns ``[(apv, target, key,
+    source)]`` and the ``TargetStat`` lookup for each target.
+    """
+    pending = []
+    lookups = {}
+    for award in awards:
+        award = tuple(award)
+        target, key, reason, source = award + ("", None)[len(award) - 2:]
+        cache_key = (key.__class__, key)
+        if cache_key not in resolved:
+            resolved[cache_key] = get_points(key)
+        point_value, points = resolved[cache_key]
+        apv = AwardedPointValue(points=points, value=point_value, reason=reason)
+        lookups[_stat_key(apv)] = _assign_target(apv, target)
+        _assign_source(apv, source)
+        pending.append((apv, target, key, source))
+    return pending, lookups
+
+
+def _write_awards(pending, lookups):
+    """
+    Writes the ledger rows, rollups and totals for ``pending``. Returns the
+    new total of each target by ``object_key``, the ``(low, high)`` range of
+    old and new totals, for the leaderboard, and the payloads of their
+    signals, sent once the write's atomic block has exited.
+    """
+    apvs = [apv for apv, target, key, source in pending]
+    # the floor is applied to the totals read here, so hold them
+    stats = _fetch_target_stats(lookups.keys(), lock=not ALLOW_NEGATIVE_TOTALS)
+    old_totals = dict((k, stat.points) for k, stat in stats.items())
+    totals = dict(old_totals)
+    running = []
+    for apv in apvs:
+        total = totals.get(_stat_key(apv), 0)
+        if not ALLOW_NEGATIVE_TOTALS and total + apv.points < 0:
+            apv.reason = apv.reason + "(floored from {0} to 0)".format(apv.points)
+            apv.points = -total
+        totals[_stat_key(apv)] = total + apv.points
+        running.append(total + apv.points)
+
+    AwardedPointValue._default_manager.bulk_create(apvs, batch_size=BULK_BATCH_SIZE)
+    PointRollup.record(
+        (PointRollup.target_key(apv), apv.timestamp, apv.points) for apv in apvs
+    )
+    _apply_totals(stats, totals, lookups)
+
+    payloads = [
+        dict(
+            sender=target.__class__,
+            target=target,
+            key=key,
+            points=apv.points,
+            source=source,
+            total=total
+        )
+        for (apv, target, key, source), total in zip(pending, running)
+    ]
+
+    changed = list(totals.values()) + [old_totals.get(k, 0) for k in totals]
+    return (
+        dict((object_key(target), totals[_stat_key(apv)]) for apv, target, key, source in pending),
+        (min(changed), max(changed)),
+        payloads,
+    )
+
+
+@metrics.instrumented("points_awarded")
 def points_awarded(target=None, source=None, since=None):
     """
     Determine out how many points the given target has received.
@@ -254,31 +1003,246 @@ def points_awarded(target=None, source=None, since=None):
                 return 0
         else:
             return AwardedPointValue.points_awarded(**lookup_params)
+    elif target is not None and source is None:
+        return PointRollup.points_since(
+            ContentType.objects.get_for_model(target).pk,
+            target.pk,
+            since
+        )
     else:
         lookup_params["timestamp__gte"] = since
         return AwardedPointValue.points_awarded(**lookup_params)
 
 
-def fetch_top_objects(model, time_limit):
-    queryset = model.objects.all()
+def stats_for_model(model):
+    """
+    Returns ``(queryset, field)``: the ``TargetStat`` rows for targets of
+    ``model`` and the name of the field holding each target's primary key.
+    """
+    manager = TargetStat._default_manager
+    if issubclass(model, get_user_model()):
+        return manager.filter(target_user__isnull=False), "target_user_id"
+    content_type = ContentType.objects.get_for_model(model)
+    return manager.filter(target_content_type=content_type), "target_object_id"
+
+
+def _ranked(rows):
+    """
+    ``(stat pk, target pk, points, position)`` rows with their positions
+    taken from the leaderboard backend when it doesn't keep
+    ``TargetStat.position`` up to date.
+    """
+    board = leaderboard.get_leaderboard()
+    if board.stores_positions or not rows:
+        return rows
+    positions = board.positions(row[2] for row in rows)
+    return [row[:3] + (positions[row[2]],) for row in rows]
+
 
+def _load_targets(model, rows):
+    """
+    Turns ``(stat pk, target pk, points, position)`` rows into ``model``
+    instances with one bulk fetch, skipping targets that no longer exist.
+    """
+    objects = model._default_manager.in_bulk([row[1] for row in rows])
+    results = []
+    for stat_pk, pk, points, position in rows:
+        obj = objects.get(pk)
+        if obj is not None:
+            obj.num_points = points
+            obj.points_position = position
+            results.append(obj)
+    return results
+
+
+def encode_cursor(points, stat_pk):
+    return "{0}:{1}".format(points, stat_pk)
+
+
+def decode_cursor(cursor):
+    """
+    Parses a cursor from ``encode_cursor``; raises ``ValueError`` if it is
+    malformed.
+    """
+    points, stat_pk = str(cursor).split(":")
+    return int(points), int(stat_pk)
+
+
+class TopObjects(object):
+    """
+    A lazily evaluated, sliceable leaderboard of ``model`` instances read from
+    ``TargetStat`` in points order. The objects are loaded with one bulk fetch
+    and carry ``num_points`` and ``points_position`` attributes.
+    """
+
+    def __init__(self, model, stats=None):
+        self.model = model
+        if stats is None:
+            stats = stats_for_model(model)[0].order_by("-points", "pk")
+        self.stats = stats
+        self._rows = None
+        self._result_cache = None
+
+    def __getitem__(self, k):
+        if self._result_cache is not None:
+            return self._result_cache[k]
+        if isinstance(k, slice):
+            return TopObjects(self.model, self.stats[k])
+        return list(TopObjects(self.model, self.stats[k:k + 1]))[0]
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __bool__(self):
+        return bool(self._fetch())
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return self.stats.count()
+
+    @property
+    def cursor(self):
+        """
+        Cursor for the page after these objects, or ``None`` when empty.
+        """
+        self._fetch()
+        if not self._rows:
+            return None
+        return encode_cursor(self._rows[-1][2], self._rows[-1][0])
+
+    def _fetch(self):
+        if self._result_cache is None:
+            field = stats_for_model(self.model)[1]
+            self._rows = _ranked(list(self.stats.values_list("pk", field, "points", "position")))
+            self._result_cache = _load_targets(self.model, self._rows)
+        return self._result_cache
+
+
+def leaderboard_page(model, cursor=None, limit=20):
+    """
+    Returns a page of ``limit`` objects of ``model`` in points order starting
+    after ``cursor`` (from a previous page's ``cursor`` attribute). Pages are
+    found by seeking on ``(points, id)`` so deep pages cost the same as the
+    first.
+    """
+    stats = stats_for_model(model)[0]
+    if cursor is not None:
+        points, stat_pk = decode_cursor(cursor)
+        stats = stats.filter(
+            models.Q(points__lt=points) | models.Q(points=points, pk__gt=stat_pk)
+        )
+    return TopObjects(model, stats.order_by("-points", "pk")[:limit])
+
+
+def leaderboard_around(target, count=10):
+    """
+    Returns ``target`` and up to ``count`` objects of the same model either
+    side of it in leaderboard order, each with ``num_points`` and
+    ``points_position``. Returns an empty list if ``target`` has no points.
+    """
+    model = target.__class__
+    stats, field = stats_for_model(model)
+    try:
+        stat = stats.get(**{field: target.pk})
+    except TargetStat.DoesNotExist:
+        return []
+
+    columns = ("pk", field, "points", "position")
+    above = stats.filter(
+        models.Q(points__gt=stat.points) | models.Q(points=stat.points, pk__lt=stat.pk)
+    ).order_by("points", "-pk").values_list(*columns)[:count]
+    below = stats.filter(
+        models.Q(points__lt=stat.points) | models.Q(points=stat.points, pk__gt=stat.pk)
+    ).order_by("-points", "pk").values_list(*columns)[:count]
+
+    rows = list(above)[::-1] + [(stat.pk, target.pk, stat.points, stat.position)] + list(below)
+    return _load_targets(model, _ranked(rows))
+
+
+def points_awarded_many(targets, since=None):
+    """
+    Returns ``{target: points}`` for every object in ``targets`` using one
+    query per content type, windowed or not.
+    """
+    targets = list(targets)
+    by_type = collections.defaultdict(set)
+    for target in targets:
+        content_type_id, pk = object_key(target)
+        by_type[content_type_id].add(pk)
+
+    user_type = ContentType.objects.get_for_model(get_user_model()).pk
+    totals = {}
+    for content_type_id, pks in by_type.items():
+        for chunk in _chunks(pks, BULK_BATCH_SIZE):
+            if since is not None:
+                points = PointRollup.points_since_many(content_type_id, chunk, since).items()
+            elif content_type_id == user_type:
+                points = TargetStat._default_manager.filter(
+                    target_user__in=chunk,
+                ).values_list("target_user", "points")
+            else:
+                points = TargetStat._default_manager.filter(
+                    target_content_type=content_type_id,
+                    target_object_id__in=chunk,
+                ).values_list("target_object_id", "points")
+            totals.update(((content_type_id, pk), total) for pk, total in points)
+    return dict((target, totals.get(object_key(target), 0)) for target in targets)
+
+
+def with_points(queryset, name="num_points"):
+    """
+    Annotates ``queryset`` with each object's total points as ``name``
+    (0 for objects without any) using a ``TargetStat`` subquery.
+    """
+    stats, field = stats_for_model(queryset.model)
+    points = stats.filter(**{field: models.OuterRef("pk")}).values("points")[:1]
+    return queryset.annotate(**{
+        name: Coalesce(models.Subquery(points), 0),
+    })
+
+
+def fetch_leaderboard(model):
+    """
+    The all-time leaderboard of ``model`` as a ``TopObjects``: read from
+    ``TargetStat`` in points order on its index, with the objects loaded in
+    one bulk fetch and ``points_position`` set on each.
+    """
+    return TopObjects(model)
+
+
+@metrics.instrumented("fetch_top_objects")
+def fetch_top_objects(model, time_limit):
+    """
+    Returns a queryset of ``model`` annotated with ``num_points`` in points
+    order. All-time leaderboards work for any model and read the totals from
+    ``TargetStat``: users through the join on its one-to-one, other models
+    through a subquery. Timeframed ones (users only) sum the ledger.
+    """
     if time_limit is None:
         if issubclass(model, get_user_model()):
-            queryset = queryset.annotate(
-                num_points=models.Sum("targetstat_targets__points")
-            )
-        else:
-            raise NotImplementedError("Only auth.User is supported at this time.")
-    else:
-        since = datetime.datetime.now() - time_limit
-        if issubclass(model, get_user_model()):
-            queryset = queryset.filter(
-                awardedpointvalue_targets__timestamp__gte=since
+            queryset = model.objects.filter(
+                targetstat_targets__isnull=False
             ).annotate(
-                num_points=models.Sum("awardedpointvalue_targets__points")
+                num_points=models.F("targetstat_targets__points")
             )
         else:
-            raise NotImplementedError("Only auth.User is supported at this time.")
+            stats, field = stats_for_model(model)
+            queryset = with_points(model.objects.filter(pk__in=stats.values(field)))
+        return queryset.order_by("-num_points")
+
+    if not issubclass(model, get_user_model()):
+        raise NotImplementedError("Only auth.User is supported at this time.")
+
+    since = datetime.datetime.now() - time_limit
+    queryset = model.objects.filter(
+        awardedpointvalue_targets__timestamp__gte=since
+    ).annotate(
+        num_points=models.Sum("awardedpointvalue_targets__points")
+    )
 
     queryset = queryset.filter(num_points__isnull=False).order_by("-num_points")
 
@@ -289,34 +1253,70 @@ class VoteError(Exception):
     pass
 
 
-def record_vote(user, target, vote):
-    # @@@ WARNING: this code is not safe concurrently
+def get_vote(user, target):
+    """
+    Returns ``user``'s current vote (-1, 0 or 1) on ``target``.
+    """
+    if not getattr(user, "is_authenticated", False):
+        return 0
+    votes = Vote._default_manager.filter(
+        voter=user,
+        target_content_type=ContentType.objects.get_for_model(target),
+        target_object_id=target.pk,
+    ).values_list("vote", flat=True)
+    return next(iter(votes), 0)
 
-    # fetch the current vote for user on target (vote should only ever be -1, 0 or 1)
-    existing = points_awarded(source=user, target=target)
 
-    # ensure we have valid data
-    if existing not in (-1, 0, 1):
-        raise ValueError("something has gone wrong with voting")
+def object_key(obj):
+    """
+    ``(content type id, pk)`` identifying any model instance.
+    """
+    return (ContentType.objects.get_for_model(obj).pk, obj.pk)
+
+
+def get_votes(user, targets):
+    """
+    Returns ``{target: vote}`` with ``user``'s vote (-1, 0 or 1) on each of
+    ``targets`` using one query, whatever mix of models ``targets`` holds.
+    """
+    targets = list(targets)
+    votes = dict((object_key(target), 0) for target in targets)
+    if votes and getattr(user, "is_authenticated", False):
+        by_type = collections.defaultdict(list)
+        for content_type_id, pk in votes:
+            by_type[content_type_id].append(pk)
+        match = models.Q()
+        for content_type_id, pks in by_type.items():
+            match |= models.Q(target_content_type=content_type_id, target_object_id__in=pks)
+        rows = Vote._default_manager.filter(match, voter=user).values_list(
+            "target_content_type", "target_object_id", "vote"
+        )
+        for content_type_id, pk, vote in rows:
+            votes[(content_type_id, pk)] = vote
+    return dict((target, votes[object_key(target)]) for target in targets)
+
+
+def record_vote(user, target, vote):
+    """
+    Sets ``user``'s vote on ``target`` to -1, 0 or 1 and awards ``target``
+    the difference. Safe to call concurrently: the old vote comes back from
+    the same atomic write that stores the new one.
+    """
     if vote not in (-1, 0, 1):
         raise ValueError("invalid vote value")
 
-    # ensure we won't do something dumb
-    if existing == -1 and vote == -1:
-        raise VoteError("cannot downvote when already downvoted")
-    if existing == 1 and vote == 1:
-        raise VoteError("cannot upvote when already upvoted")
-
-    points = {
-        (1, 0): -1,
-        (1, -1): -2,
-        (0, 1): 1,
-        (0, 0): 0,
-        (0, -1): -1,
-        (-1, 1): 2,
-        (-1, 0): 1,
-    }[(existing, vote)]
-
-    if points:
-        award_points(target, points, source=user)
-        return points_awarded(target=target)
+    with transaction.atomic():
+        existing = Vote.swap(user, target, vote)
+
+        if existing is None:
+            # ensure we won't do something dumb
+            if vote == -1:
+                raise VoteError("cannot downvote when already downvoted")
+            if vote == 1:
+                raise VoteError("cannot upvote when already upvoted")
+            return None
+
+        points = vote - existing
+        if points:
+            award_points(target, points, source=user)
+            return points_awarded(target=target)
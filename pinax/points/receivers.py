@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, signals
+from .cache import invalidate_point_value, invalidate_top_objects
+from .models import PointValue
+
+
+def _invalidate(keys, pk):
+    for key in keys:
+        invalidate_point_value(key, pk)
+
+
+@receiver(pre_save, sender=PointValue)
+def remember_point_value_key(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._cached_keys = set()
+    else:
+        instance._cached_keys = set(
+            sender._default_manager.filter(pk=instance.pk).values_list("key", flat=True)
+        )
+
+
+@receiver(post_save, sender=PointValue)
+@receiver(post_delete, sender=PointValue)
+def invalidate_point_value_cache(sender, instance, **kwargs):
+    keys = getattr(instance, "_cached_keys", set()) | {instance.key}
+    _invalidate(keys, instance.pk)
+    # readers may have refilled the cache from the old row before commit
+    transaction.on_commit(lambda: _invalidate(keys, instance.pk))
+
+
+@receiver(signals.points_awarded)
+def invalidate_top_objects_cache(sender, points, total=None, **kwargs):
+    if not cache.TOP_OBJECTS_CACHE_TIMEOUT:
+        return
+    old_total = None if total is None else total - points
+    invalidate_top_objects(sender, old_total, total)
+    if transaction.get_connection().in_atomic_block:
+        # readers may have refilled the cache from the old totals before commit
+        transaction.on_commit(lambda: invalidate_top_objects(sender, old_total, total))
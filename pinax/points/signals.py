@@ -1,3 +1,4 @@
 from django.dispatch import Signal
 
-points_awarded = Signal(providing_args=["target", "key", "points", "source"])
+points_awarded = Signal(providing_args=["target", "key", "points", "source", "total"])
+points_awarded_batch = Signal(providing_args=["awards"])
@@ -0,0 +1,284 @@
+"""
+Backend specific SQL used on the hot paths where the ORM can't express a
+single statement.
+"""
+import bisect
+
+
+def can_rank(connection):
+    """
+    Whether ``connection`` can recompute positions with one ``UPDATE`` built
+    around ``RANK()``.
+    """
+    if not connection.features.supports_over_clause:
+        return False
+    if connection.vendor == "sqlite":
+        # UPDATE ... FROM arrived after window functions
+        return connection.Database.sqlite_version_info >= (3, 33, 0)
+    return connection.vendor in ("postgresql", "mysql")
+
+
+def rank_positions(connection, model, point_range=None):
+    """
+    Returns ``(sql, params)`` for an ``UPDATE`` that sets ``position`` to the
+    ``RANK()`` of ``points`` (descending) for every row of ``model`` within
+    ``point_range``, offset by the number of rows above the range. Rows whose
+    position is already correct are left alone.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    pk = qn(opts.pk.column)
+    points = qn(opts.get_field("points").column)
+    position = qn(opts.get_field("position").column)
+
+    if point_range is None:
+        where, above, params = "", "0", []
+    else:
+        where = " WHERE {points} BETWEEN %s AND %s".format(points=points)
+        above = "(SELECT COUNT(*) FROM {table} AS above WHERE above.{points} > %s)".format(
+            table=table,
+            points=points,
+        )
+        params = [point_range[1], point_range[0], point_range[1]]
+
+    ranked = (
+        "SELECT {pk} AS stat_id, RANK() OVER (ORDER BY {points} DESC) + {above} AS new_position"
+        " FROM {table}{where}"
+    ).format(pk=pk, points=points, above=above, table=table, where=where)
+    changed = "({table}.{position} IS NULL OR {table}.{position} <> ranked.new_position)".format(
+        table=table,
+        position=position,
+    )
+
+    if connection.vendor == "mysql":
+        sql = (
+            "UPDATE {table} INNER JOIN ({ranked}) AS ranked ON {table}.{pk} = ranked.stat_id"
+            " SET {table}.{position} = ranked.new_position WHERE {changed}"
+        )
+    else:
+        sql = (
+            "UPDATE {table} SET {position} = ranked.new_position FROM ({ranked}) AS ranked"
+            " WHERE {table}.{pk} = ranked.stat_id AND {changed}"
+        )
+    return sql.format(table=table, ranked=ranked, pk=pk, position=position, changed=changed), params
+
+
+def can_return_from_update(connection):
+    """
+    Whether ``connection`` supports ``UPDATE ... RETURNING``.
+    """
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def where_target(connection, model, lookup_params):
+    """
+    Returns ``(sql, params)`` for a ``WHERE`` clause matching ``TargetStat``
+    style ``lookup_params`` (``target_user`` or the generic target pair).
+    """
+    qn = connection.ops.quote_name
+    clauses, params = [], []
+    for name, value in sorted(lookup_params.items()):
+        field = model._meta.get_field(name)
+        clauses.append("{0} = %s".format(qn(field.column)))
+        params.append(getattr(value, "pk", value))
+    return " AND ".join(clauses), params
+
+
+def level_case(total, total_params, thresholds):
+    """
+    Returns ``(sql, params)`` for a ``CASE`` giving the level reached by the
+    SQL expression ``total`` (with ``total_params``): 1 below
+    ``thresholds[0]``, 2 from there up to ``thresholds[1]`` and so on.
+    """
+    whens, params = [], []
+    for level, threshold in reversed(list(enumerate(thresholds, 2))):
+        whens.append("WHEN {0} >= %s THEN %s".format(total))
+        params += list(total_params) + [threshold, level]
+    return "CASE {0} ELSE 1 END".format(" ".join(whens)), params
+
+
+def stat_assignments(connection, model, current, added, added_params, thresholds=(), floor=False):
+    """
+    Returns ``(sql, params)`` for the ``SET`` list adding the SQL expression
+    ``added`` to a stat row whose points are ``current``. ``last_awarded`` is
+    set to the change actually applied: with ``floor`` a total that would go
+    below zero stops at zero. With level ``thresholds`` the level moves too.
+    Every assignment reads the old row, which MySQL (applying them left to
+    right) only guarantees because points come last.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    raw = "{0} + {1}".format(current, added)
+    if floor:
+        total = "CASE WHEN {0} < 0 THEN 0 ELSE {0} END".format(raw)
+        applied = "CASE WHEN {0} < 0 THEN -{1} ELSE {2} END".format(raw, current, added)
+        total_params = applied_params = list(added_params) * 2
+    else:
+        total, total_params = raw, list(added_params)
+        applied, applied_params = added, list(added_params)
+
+    assignments = ["{0} = {1}".format(qn(opts.get_field("last_awarded").column), applied)]
+    params = list(applied_params)
+    if thresholds:
+        case, case_params = level_case(total, total_params, thresholds)
+        assignments.append("{0} = {1}".format(qn(opts.get_field("level").column), case))
+        params += case_params
+    assignments.append("{0} = {1}".format(qn(opts.get_field("points").column), total))
+    params += total_params
+    return ", ".join(assignments), params
+
+
+def increment_points(connection, model, given, lookup_params, thresholds=(), floor=False):
+    """
+    Returns ``(sql, params)`` for an ``UPDATE`` adding ``given`` to the points
+    of the target in ``lookup_params`` and returning the new total and the
+    change applied (see ``stat_assignments``).
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    assignments, params = stat_assignments(
+        connection, model, qn(opts.get_field("points").column), "%s", [given], thresholds, floor
+    )
+    where, where_params = where_target(connection, model, lookup_params)
+    sql = "UPDATE {table} SET {assignments} WHERE {where} RETURNING {points}, {last_awarded}".format(
+        table=qn(opts.db_table),
+        assignments=assignments,
+        where=where,
+        points=qn(opts.get_field("points").column),
+        last_awarded=qn(opts.get_field("last_awarded").column),
+    )
+    return sql, params + where_params
+
+
+def can_upsert(connection):
+    """
+    Whether ``connection`` has a native upsert we know how to write.
+    """
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 24, 0)
+    return connection.vendor in ("postgresql", "mysql")
+
+
+def upsert_points(connection, model, given, lookup_params, thresholds=(), floor=False):
+    """
+    Returns ``(sql, params)`` for an ``INSERT`` of a stat row for the target in
+    ``lookup_params`` holding ``given`` points that adds ``given`` to the
+    existing row instead when the target's unique key already exists. The new
+    total and the change applied (see ``stat_assignments``) are returned when
+    the backend supports ``RETURNING``.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    points = qn(opts.get_field("points").column)
+    last_awarded = qn(opts.get_field("last_awarded").column)
+    inserted = max(given, 0) if floor else given
+
+    conflict, params = [], []
+    for name, value in sorted(lookup_params.items()):
+        conflict.append(qn(opts.get_field(name).column))
+        params.append(getattr(value, "pk", value))
+    columns = conflict + [points, last_awarded, qn(opts.get_field("level").column)]
+    params += [inserted, inserted, bisect.bisect_right(thresholds, inserted) + 1]
+
+    sql = "INSERT INTO {table} ({columns}) VALUES ({values})".format(
+        table=table,
+        columns=", ".join(columns),
+        values=", ".join(["%s"] * len(columns)),
+    )
+    if connection.vendor == "mysql":
+        current = points
+        sql += " ON DUPLICATE KEY UPDATE "
+    else:
+        current = "{0}.{1}".format(table, points)
+        sql += " ON CONFLICT ({0}) DO UPDATE SET ".format(", ".join(conflict))
+    # the inserted value may be floored, so add ``given`` rather than it
+    assignments, assignment_params = stat_assignments(
+        connection, model, current, "%s", [given], thresholds, floor
+    )
+    sql += assignments
+    params += assignment_params
+    if connection.vendor != "mysql" and can_return_from_update(connection):
+        sql += " RETURNING {0}, {1}".format(points, last_awarded)
+    return sql, params
+
+
+def upsert_increments(connection, model, fields, conflict, increment, rows):
+    """
+    Returns ``(sql, params)`` for a multi-row ``INSERT`` of ``rows`` (tuples
+    of values for ``fields``) that adds ``increment`` to the existing row
+    when the ``conflict`` fields already exist.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    columns = [qn(opts.get_field(name).column) for name in fields]
+    column = qn(opts.get_field(increment).column)
+
+    placeholder = "({0})".format(", ".join(["%s"] * len(columns)))
+    sql = "INSERT INTO {table} ({columns}) VALUES {values}".format(
+        table=table,
+        columns=", ".join(columns),
+        values=", ".join([placeholder] * len(rows)),
+    )
+    if connection.vendor == "mysql":
+        sql += " ON DUPLICATE KEY UPDATE {column} = {column} + VALUES({column})".format(column=column)
+    else:
+        sql += " ON CONFLICT ({conflict}) DO UPDATE SET {column} = {table}.{column} + excluded.{column}".format(
+            conflict=", ".join(qn(opts.get_field(name).column) for name in conflict),
+            table=table,
+            column=column,
+        )
+    return sql, [value for row in rows for value in row]
+
+
+def can_swap_votes(connection):
+    """
+    Whether ``swap_vote`` can run on ``connection``.
+    """
+    return can_upsert(connection) and can_return_from_update(connection)
+
+
+def swap_vote(connection, model, voter_id, content_type_id, object_id, vote):
+    """
+    Returns ``(sql, params)`` for an upsert that sets a voter's vote on a
+    target and returns the vote it replaced (``0`` for a new row). No row is
+    returned when the vote is unchanged.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    key = [qn(opts.get_field(name).column) for name in ("voter", "target_content_type", "target_object_id")]
+    column = qn(opts.get_field("vote").column)
+    previous = qn(opts.get_field("previous").column)
+    sql = (
+        "INSERT INTO {table} ({key}, {column}, {previous}) VALUES (%s, %s, %s, %s, 0)"
+        " ON CONFLICT ({key}) DO UPDATE SET {previous} = {table}.{column}, {column} = excluded.{column}"
+        " WHERE {table}.{column} <> excluded.{column}"
+        " RETURNING {previous}"
+    ).format(table=table, key=", ".join(key), column=column, previous=previous)
+    return sql, [voter_id, content_type_id, object_id, vote]
+
+
+def estimated_count(connection, model):
+    """
+    Returns ``(sql, params)`` for a query reading the planner's estimate of
+    the number of rows in ``model``'s table, or ``None`` where the backend
+    keeps none.
+    """
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        return "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [
+            connection.ops.quote_name(table)
+        ]
+    if connection.vendor == "mysql":
+        return (
+            "SELECT table_rows FROM information_schema.tables"
+            " WHERE table_schema = DATABASE() AND table_name = %s"
+        ), [table]
+    return None
@@ -3,7 +3,19 @@ import datetime
 from django import template
 from django.apps import apps
 
-from ..models import fetch_top_objects, points_awarded
+from .. import metrics
+from ..cache import get_top_objects
+from ..leaderboard import get_leaderboard
+from ..models import (
+    fetch_top_objects,
+    get_vote,
+    get_votes,
+    leaderboard_around,
+    leaderboard_page,
+    object_key,
+    points_awarded,
+    points_awarded_many,
+)
 
 register = template.Library()
 
@@ -58,6 +70,36 @@ def get_time_num_and_unit(bits):
     return time_unit, time_num
 
 
+def resolve_model(model_lookup):
+    incorrect_value = ValueError(
+        "'{0}' does not result in a model. Is it correct?".format(model_lookup)
+    )
+
+    try:
+        model = apps.get_model(*model_lookup.split("."))
+    except TypeError:
+        raise incorrect_value
+    else:
+        if model is None:
+            raise incorrect_value
+    return model
+
+
+def get_options(bits, allowed):
+    """
+    Parses trailing ``name value`` pairs after ``tag arg as var``.
+    """
+    options = {}
+    rest = bits[4:]
+    if len(rest) % 2 or any(name not in allowed for name in rest[::2]):
+        raise template.TemplateSyntaxError(
+            "'{0}' options must be pairs of {1}".format(bits[0], " / ".join(allowed))
+        )
+    for name, value in zip(rest[::2], rest[1::2]):
+        options[name] = template.Variable(value)
+    return options
+
+
 class TopObjectsNode(template.Node):
 
     @classmethod
@@ -88,30 +130,23 @@ class TopObjectsNode(template.Node):
                 time_unit: int(time_num)  # @@@ doing this means can't express "7 days" as variables
             })
 
+    @metrics.instrumented("top_objects_tag")
     def render(self, context):
         limit = None
-        model_lookup = self.model.resolve(context)
-        incorrect_value = ValueError(
-            "'{0}' does not result in a model. Is it correct?".format(model_lookup)
-        )
-
-        try:
-            model = apps.get_model(*model_lookup.split("."))
-        except TypeError:
-            raise incorrect_value
-        else:
-            if model is None:
-                raise incorrect_value
+        model = resolve_model(self.model.resolve(context))
 
         if self.limit is not None:
             limit = self.limit.resolve(context)
 
-        objs = fetch_top_objects(model, self.time_limit)
-
-        if limit is not None:
-            objs = objs[:limit]
+        def load():
+            if self.time_limit is None:
+                return get_leaderboard().top(model, limit)
+            objs = fetch_top_objects(model, self.time_limit)
+            if limit is not None:
+                objs = objs[:limit]
+            return objs
 
-        context[self.context_var] = objs
+        context[self.context_var] = get_top_objects(model, limit, self.time_limit, load)
 
         return ""
 
@@ -131,11 +166,98 @@ def top_objects(parser, token):
 
         {% top_objects "auth.User" as top_users limit 10 timeframe 7 days %}
 
-    All variations return a queryset of the model passed in with points annotated.
+    All variations return objects of the model passed in with ``num_points``
+    set. All-time leaderboards work for any model; timeframed ones only for
+    the user model.
     """
     return TopObjectsNode.handle_token(parser, token)
 
 
+class LeaderboardPageNode(template.Node):
+
+    @classmethod
+    def handle_token(cls, parser, token):
+        bits = token.split_contents()
+        if len(bits) < 4:
+            raise template.TemplateSyntaxError(
+                "'{0}' takes at least three arguments (second argument must be 'as')".format(bits[0])
+            )
+        assert_has_as(bits)
+        return cls(bits[1], bits[3], **get_options(bits, ["limit", "after"]))
+
+    def __init__(self, model, context_var, limit=None, after=None):
+        self.model = template.Variable(model)
+        self.context_var = context_var
+        self.limit = limit
+        self.after = after
+
+    @metrics.instrumented("leaderboard_page_tag")
+    def render(self, context):
+        model = resolve_model(self.model.resolve(context))
+        limit = 20 if self.limit is None else int(self.limit.resolve(context))
+        cursor = None if self.after is None else self.after.resolve(context)
+        try:
+            page = leaderboard_page(model, cursor or None, limit)
+        except ValueError:
+            # a bad cursor (usually from a query string) starts from the top
+            page = leaderboard_page(model, None, limit)
+        context[self.context_var] = page
+        return ""
+
+
+@register.tag(name="leaderboard_page")
+def do_leaderboard_page(parser, token):
+    """
+    Usage::
+
+        {% leaderboard_page "auth.User" as page limit 20 after request.GET.after %}
+
+    ``page`` is a page of objects with ``num_points`` and ``points_position``
+    set; ``page.cursor`` goes in the ``after`` argument for the next page.
+    ``limit`` defaults to 20.
+    """
+    return LeaderboardPageNode.handle_token(parser, token)
+
+
+class LeaderboardAroundNode(template.Node):
+
+    @classmethod
+    def handle_token(cls, parser, token):
+        bits = token.split_contents()
+        if len(bits) < 4:
+            raise template.TemplateSyntaxError(
+                "'{0}' takes at least three arguments (second argument must be 'as')".format(bits[0])
+            )
+        assert_has_as(bits)
+        return cls(bits[1], bits[3], **get_options(bits, ["limit"]))
+
+    def __init__(self, obj, context_var, limit=None):
+        self.obj = template.Variable(obj)
+        self.context_var = context_var
+        self.limit = limit
+
+    @metrics.instrumented("leaderboard_around_tag")
+    def render(self, context):
+        obj = self.obj.resolve(context)
+        limit = 10 if self.limit is None else int(self.limit.resolve(context))
+        context[self.context_var] = leaderboard_around(obj, limit)
+        return ""
+
+
+@register.tag(name="leaderboard_around")
+def do_leaderboard_around(parser, token):
+    """
+    Usage::
+
+        {% leaderboard_around user as neighbours limit 10 %}
+
+    ``neighbours`` lists up to ``limit`` objects above ``user``, ``user``
+    itself and up to ``limit`` below, each with ``num_points`` and
+    ``points_position``. ``limit`` defaults to 10.
+    """
+    return LeaderboardAroundNode.handle_token(parser, token)
+
+
 class PointsForObjectNode(template.Node):
 
     @classmethod
@@ -169,6 +291,7 @@ class PointsForObjectNode(template.Node):
         self.limit_num = limit_num
         self.limit_unit = limit_unit
 
+    @metrics.instrumented("points_for_object_tag")
     def render(self, context):
         obj = self.obj.resolve(context)
 
@@ -204,6 +327,65 @@ def points_for_object(parser, token):
     return PointsForObjectNode.handle_token(parser, token)
 
 
+class PointsForObjectsNode(template.Node):
+
+    @classmethod
+    def handle_token(cls, parser, token):
+        bits = token.split_contents()
+        if len(bits) == 4 and bits[2] == "as":
+            return cls(parser.compile_filter(bits[1]), bits[3])
+        if len(bits) == 7 and bits[2] == "limit" and bits[5] == "as":
+            return cls(parser.compile_filter(bits[1]), bits[6], bits[3], bits[4])
+        raise template.TemplateSyntaxError(
+            "'{0}' takes 3 or 6 arguments ('objs as var' or 'objs limit N unit as var')".format(bits[0])
+        )
+
+    def __init__(self, objs, context_var, limit_num=None, limit_unit=None):
+        self.objs = objs
+        self.context_var = context_var
+        self.limit_num = limit_num
+        self.limit_unit = limit_unit
+
+    @metrics.instrumented("points_for_objects_tag")
+    def render(self, context):
+        since = None
+        if self.limit_num is not None:
+            since = datetime.datetime.now() - datetime.timedelta(
+                **{self.limit_unit: int(self.limit_num)}
+            )
+        context[self.context_var] = points_awarded_many(
+            self.objs.resolve(context) or [],
+            since=since,
+        )
+        return ""
+
+
+@register.tag
+def points_for_objects(parser, token):
+    """
+    Gets the current points for every object in a list with one query per
+    model, usage:
+
+        {% points_for_objects object_list as points %}
+        {% for obj in object_list %}
+            {{ points|for_object:obj }}
+        {% endfor %}
+
+    or
+
+        {% points_for_objects object_list limit 7 days as points %}
+    """
+    return PointsForObjectsNode.handle_token(parser, token)
+
+
+VOTE_NAMES = {
+    -1: "downvote",
+    0: "novote",
+    1: "upvote",
+}
+PRELOADED_VOTES = "_pinax_points_votes"
+
+
 class UserHasVotedNode(template.Node):
 
     @classmethod
@@ -224,17 +406,18 @@ class UserHasVotedNode(template.Node):
         self.obj = obj
         self.varname = varname
 
+    @metrics.instrumented("user_has_voted_tag")
     def render(self, context):
         user = self.user.resolve(context)
         obj = self.obj.resolve(context)
 
-        vote = points_awarded(source=user, target=obj)
+        preloaded = context.get(PRELOADED_VOTES, {}).get(getattr(user, "pk", None), {})
+        try:
+            vote = preloaded[object_key(obj)]
+        except KeyError:
+            vote = get_vote(user, obj)
 
-        context[self.varname] = {
-            -1: "downvote",
-            0: "novote",
-            1: "upvote",
-        }.get(vote, "badvote")
+        context[self.varname] = VOTE_NAMES.get(vote, "badvote")
 
         return ""
 
@@ -246,3 +429,68 @@ def user_has_voted(parser, token):
         {% user_has_voted user obj as var %}
     """
     return UserHasVotedNode.handle_token(parser, token)
+
+
+class UserVotesNode(template.Node):
+
+    @classmethod
+    def handle_token(cls, parser, token):
+        bits = token.split_contents()
+        if len(bits) != 5 or bits[3] != "as":
+            raise template.TemplateSyntaxError(
+                "'{0}' takes exactly four arguments (third argument must be 'as')".format(bits[0])
+            )
+        return cls(
+            parser.compile_filter(bits[1]),
+            parser.compile_filter(bits[2]),
+            bits[4]
+        )
+
+    def __init__(self, user, objs, varname):
+        self.user = user
+        self.objs = objs
+        self.varname = varname
+
+    @metrics.instrumented("user_votes_tag")
+    def render(self, context):
+        user = self.user.resolve(context)
+        votes = get_votes(user, self.objs.resolve(context) or [])
+
+        preloaded = dict(context.get(PRELOADED_VOTES, {}))
+        by_key = dict(preloaded.get(getattr(user, "pk", None), {}))
+        by_key.update((object_key(obj), vote) for obj, vote in votes.items())
+        preloaded[getattr(user, "pk", None)] = by_key
+        context[PRELOADED_VOTES] = preloaded
+
+        context[self.varname] = dict((obj, VOTE_NAMES[vote]) for obj, vote in votes.items())
+        return ""
+
+
+@register.tag
+def user_votes(parser, token):
+    """
+    Loads ``user``'s votes on every object in ``objs`` with one query::
+
+        {% user_votes user object_list as votes %}
+        {% for obj in object_list %}
+            {{ votes|for_object:obj }}
+            {% user_has_voted user obj as vote %}
+        {% endfor %}
+
+    ``votes`` maps each object to ``"upvote"``, ``"downvote"`` or
+    ``"novote"``; ``user_has_voted`` tags rendered afterwards in the same
+    context read from it instead of querying.
+    """
+    return UserVotesNode.handle_token(parser, token)
+
+
+@register.filter
+def for_object(mapping, obj):
+    """
+    Looks ``obj`` up in a mapping keyed by objects, such as the ones set by
+    ``user_votes`` and ``points_for_objects``.
+    """
+    try:
+        return mapping.get(obj, "")
+    except AttributeError:
+        return ""
@@ -1,6 +1,9 @@
 INSTALLED_APPS = [
+    "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
+    "django.contrib.messages",
+    "django.contrib.sessions",
     "django.contrib.sites",
     "pinax.points",
     "pinax.points.tests"
@@ -14,11 +17,27 @@ DATABASES = {
 SITE_ID = 1
 ROOT_URLCONF = "pinax.points.tests.urls"
 SECRET_KEY = "notasecret"
-MIDDLEWARE = []
+MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+]
 MIDDLEWARE_CLASSES = MIDDLEWARE
 PINAX_POINTS_ALLOW_NEGATIVE_TOTALS = False
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates"
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ],
+        },
     },
 ]
+STATIC_URL = "/static/"
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.MD5PasswordHasher",
+]
@@ -1,17 +1,68 @@
-from datetime import timedelta
+import copy
+import json
+import multiprocessing
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
 from django.conf import settings
-from django.contrib.auth.models import Group, User
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages import get_messages
+from django.contrib.sites.models import Site
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import QuerySet, Sum
+from django.http import StreamingHttpResponse
 from django.template import Context, Template, TemplateSyntaxError
-from django.test import TestCase
-
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from pinax.points import (
+    cache,
+    export,
+    leaderboard,
+    metrics,
+    signals,
+    sql,
+    views,
+)
+from pinax.points.admin import EstimatedCountPaginator, award_points_action
 from pinax.points.models import (
+    ArchivedPointValue,
     AwardedPointValue,
+    PointRollup,
     PointValue,
     TargetStat,
+    Vote,
+    VoteError,
     award_points,
+    award_points_bulk,
+    fetch_leaderboard,
+    fetch_top_objects,
+    get_points,
+    get_vote,
+    get_votes,
+    leaderboard_around,
+    leaderboard_page,
+    level_for_points,
     points_awarded,
+    points_awarded_many,
+    record_vote,
+    with_points,
 )
 
 
@@ -27,6 +78,7 @@ class BasePointsTestCase(object):
     def tearDown(self):
         if hasattr(settings, "PINAX_POINT_VALUES"):
             del settings.PINAX_POINT_VALUES
+        cache.point_values.clear()
 
     def setup_users(self, N):
         self.users = [
@@ -147,6 +199,236 @@ class PointsTestCase(BasePointsTestCase, TestCase):
         )
 
 
+class PointValueCacheTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(1)
+        self.setup_points({
+            "JOINED_SITE": 5,
+        })
+
+    def test_cached_lookup(self):
+        award_points(self.users[0], "JOINED_SITE")
+        with self.assertNumQueries(0):
+            point_value, points = get_points("JOINED_SITE")
+        self.assertEqual(points, 5)
+        self.assertEqual(point_value.pk, PointValue.objects.get(key="JOINED_SITE").pk)
+
+    def test_invalidated_on_save(self):
+        get_points("JOINED_SITE")
+        point_value = PointValue.objects.get(key="JOINED_SITE")
+        point_value.value = 8
+        point_value.save()
+        award_points(self.users[0], "JOINED_SITE")
+        self.assertEqual(points_awarded(self.users[0]), 8)
+
+    def test_invalidated_on_rename(self):
+        get_points("JOINED_SITE")
+        point_value = PointValue.objects.get(key="JOINED_SITE")
+        point_value.key = "SIGNED_UP"
+        point_value.save()
+        self.assertEqual(get_points("SIGNED_UP")[1], 5)
+        self.assertRaises(ImproperlyConfigured, get_points, "JOINED_SITE")
+
+    def test_invalidated_on_delete(self):
+        get_points("JOINED_SITE")
+        PointValue.objects.get(key="JOINED_SITE").delete()
+        self.assertRaises(ImproperlyConfigured, get_points, "JOINED_SITE")
+
+    def test_bounded(self):
+        bounded = cache.BoundedCache(2)
+        bounded.set("a", 1)
+        bounded.set("b", 2)
+        bounded.get("a")
+        bounded.set("c", 3)
+        self.assertEqual((bounded.get("a"), bounded.get("b"), bounded.get("c")), (1, None, 3))
+
+    def test_expiry(self):
+        expiring = cache.BoundedCache(2, timeout=-1)
+        expiring.set("a", 1)
+        self.assertEqual(expiring.get("a"), None)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_shared_cache(self):
+        with mock.patch("pinax.points.cache.SHARED_CACHE", "default"):
+            get_points("JOINED_SITE")
+            cache.point_values.clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(get_points("JOINED_SITE")[1], 5)
+            PointValue.objects.filter(key="JOINED_SITE").get().delete()
+            self.assertEqual(caches["default"].get(cache.point_value_cache_key("JOINED_SITE")), None)
+
+    def test_keys_are_unique(self):
+        self.assertRaises(IntegrityError, PointValue.create, "JOINED_SITE", 1)
+
+
+@mock.patch("pinax.points.models.ALLOW_NEGATIVE_TOTALS", True)
+class QueryBudgetTestCase(BasePointsTestCase, TestCase):
+    """
+    Enforces the per-call query budget documented in the README.
+    """
+
+    def setUp(self):
+        self.setup_users(2)
+        self.setup_points({
+            "JOINED_SITE": 1,
+        })
+        self.group = Group.objects.create(name="Dwarfs")
+        award_points(self.users[0], 10)
+        award_points(self.group, 10)
+
+    def test_user_award(self):
+        # stat upsert ... RETURNING, ledger INSERT, rollup upsert, ranking UPDATE
+        with self.assertNumQueries(4):
+            award_points(self.users[0], 5)
+        self.assertEqual(points_awarded(self.users[0]), 15)
+
+    def test_generic_award(self):
+        with self.assertNumQueries(4):
+            award_points(self.group, 5)
+        self.assertEqual(points_awarded(self.group), 15)
+
+    def test_point_value_key(self):
+        # the PointValue lookup is only paid on a cache miss
+        with self.assertNumQueries(5):
+            award_points(self.users[0], "JOINED_SITE")
+        with self.assertNumQueries(4):
+            award_points(self.users[0], "JOINED_SITE")
+
+    def test_first_award(self):
+        # the upsert creates the TargetStat in the same statement
+        with self.assertNumQueries(4):
+            award_points(self.users[1], 5)
+        self.assertEqual(points_awarded(self.users[1]), 5)
+        stat = TargetStat.objects.get(target_user=self.users[1])
+        self.assertEqual((stat.points, stat.level, stat.position), (5, 1, 3))
+
+    def test_first_generic_award(self):
+        group = Group.objects.create(name="Elves")
+        with self.assertNumQueries(4):
+            award_points(group, 5)
+        with self.assertNumQueries(4):
+            award_points(group, 5)
+        self.assertEqual(points_awarded(group), 10)
+        self.assertEqual(TargetStat.objects.filter(target_object_id=group.pk).count(), 1)
+
+    def test_without_upsert(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+            # each UPDATE misses and is followed by SAVEPOINT, INSERT, RELEASE
+            with self.assertNumQueries(14):
+                award_points(self.users[1], 5)
+            with self.assertNumQueries(5):
+                award_points(self.users[1], 5)
+        self.assertEqual(points_awarded(self.users[1]), 10)
+
+    def test_floored_totals(self):
+        with mock.patch("pinax.points.models.ALLOW_NEGATIVE_TOTALS", False):
+            # the floor is applied by the stat upsert, with no read first
+            with self.assertNumQueries(4):
+                award_points(self.users[0], -5)
+        self.assertEqual(points_awarded(self.users[0]), 5)
+
+    def test_without_update_returning(self):
+        with mock.patch("pinax.points.sql.can_return_from_update", return_value=False):
+            # upsert then SELECT of the new total
+            with self.assertNumQueries(5):
+                award_points(self.users[0], 5)
+            with self.assertNumQueries(5):
+                award_points(self.users[1], 5)
+        self.assertEqual(points_awarded(self.users[0]), 15)
+        self.assertEqual(points_awarded(self.users[1]), 5)
+
+    def test_positions_follow_award(self):
+        award_points(self.users[1], 20)
+        self.assertEqual(
+            [(s.target, s.position) for s in TargetStat.objects.order_by("position", "pk")],
+            [(self.users[1], 1), (self.users[0], 2), (self.group, 2)]
+        )
+
+
+class BulkAwardTestCase(BasePointsTestCase, TestCase):
+
+    def test_bulk_award_totals(self):
+        self.setup_users(3)
+        self.setup_points({
+            "JOINED_SITE": 5,
+        })
+        group = Group.objects.create(name="Dwarfs")
+        award_points(self.users[0], 10)
+        apvs = award_points_bulk([
+            (self.users[0], "JOINED_SITE"),
+            (self.users[1], "JOINED_SITE", "welcome"),
+            (self.users[1], 3, "bonus", self.users[2]),
+            (group, 7),
+        ])
+        self.assertEqual(len(apvs), 4)
+        self.assertEqual(AwardedPointValue.objects.count(), 5)
+        self.assertEqual(points_awarded(self.users[0]), 15)
+        self.assertEqual(points_awarded(self.users[1]), 8)
+        self.assertEqual(points_awarded(self.users[2]), 0)
+        self.assertEqual(points_awarded(group), 7)
+        self.assertEqual(points_awarded(target=self.users[1], source=self.users[2]), 3)
+
+    def test_bulk_award_positions(self):
+        self.setup_users(4)
+        award_points(self.users[0], 20)
+        award_points(self.users[1], 10)
+        award_points_bulk([
+            (self.users[1], 15),
+            (self.users[2], 25),
+            (self.users[3], 10),
+        ])
+        self.assertEqual(
+            [(p.target_user, p.position, p.points) for p in TargetStat.objects.order_by("position")],
+            [(self.users[1], 1, 25), (self.users[2], 1, 25), (self.users[0], 3, 20), (self.users[3], 4, 10)]
+        )
+
+    def test_bulk_award_floors_negative_totals(self):
+        self.setup_users(1)
+        user = self.users[0]
+        award_points(user, 5)
+        award_points_bulk([(user, 3), (user, -10), (user, 4)])
+        self.assertEqual(points_awarded(user), 4)
+        self.assertEqual(
+            list(AwardedPointValue.objects.order_by("pk").values_list("points", flat=True)),
+            [5, 3, -8, 4]
+        )
+
+    def test_bulk_award_query_count_is_independent_of_size(self):
+        self.setup_users(20)
+        for user in self.users[:10]:
+            award_points(user, 1)
+        with self.assertNumQueries(10):
+            award_points_bulk([(user, 2) for user in self.users])
+
+    def test_bulk_award_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(award_points_bulk([]), [])
+
+    def test_bulk_award_chunked(self):
+        self.setup_users(5)
+        award_points(self.users[4], 3)
+        done = []
+        with mock.patch.object(TargetStat, "update_positions", wraps=TargetStat.update_positions) as update:
+            apvs = award_points_bulk(
+                ((user, i + 1) for i, user in enumerate(self.users)),
+                chunk_size=2,
+                progress=done.append,
+            )
+        self.assertEqual(len(apvs), 5)
+        self.assertEqual(done, [2, 4, 5])
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(
+            [(p.target_user, p.position, p.points) for p in TargetStat.objects.order_by("position")],
+            [(self.users[4], 1, 8), (self.users[3], 2, 4), (self.users[2], 3, 3),
+             (self.users[1], 4, 2), (self.users[0], 5, 1)]
+        )
+
+    def test_bulk_award_chunked_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(award_points_bulk([], chunk_size=2), [])
+
+
 # class NegativePointsTestCase(BasePointsTestCase, TestCase):
 
 #     def test_negative_totals_floored(self):
@@ -186,6 +468,174 @@ class PointsTestCase(BasePointsTestCase, TestCase):
 #         self.assertEqual(points_awarded(user), 50)
 
 
+class AtomicAwardTestCase(BasePointsTestCase, TransactionTestCase):
+
+    def setUp(self):
+        self.setup_users(1)
+        self.user = self.users[0]
+
+    def test_read_back_in_write_transaction(self):
+        atomic = []
+        read_points = TargetStat._read_points
+
+        def read(lookup_params):
+            atomic.append(connection.in_atomic_block)
+            return read_points(lookup_params)
+
+        lookup_params = {"target_user": self.user}
+        with mock.patch("pinax.points.sql.can_return_from_update", return_value=False), \
+                mock.patch.object(TargetStat, "_read_points", side_effect=read):
+            self.assertEqual(TargetStat.add_points(5, lookup_params), (5, 5))
+            self.assertEqual(TargetStat.increment_points(3, lookup_params), (8, 3))
+        self.assertEqual(atomic, [True, True])
+        self.assertFalse(connection.in_atomic_block)
+
+    def test_award_writes_together(self):
+        with mock.patch.object(PointRollup, "record", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                award_points(self.user, 5)
+        self.assertFalse(TargetStat.objects.exists())
+        self.assertFalse(AwardedPointValue.objects.exists())
+
+
+class FloorTestCase(BasePointsTestCase, TestCase):
+    """
+    PINAX_POINTS_ALLOW_NEGATIVE_TOTALS = False in the test settings
+    """
+
+    def setUp(self):
+        self.setup_users(1)
+        self.user = self.users[0]
+        award_points(self.user, 10)
+
+    def assertFloored(self):
+        apv = award_points(self.user, -15)
+        self.assertEqual(apv.points, -10)
+        self.assertEqual(apv.reason, "(floored from -15 to 0)")
+        self.assertEqual(AwardedPointValue.objects.get(pk=apv.pk).points, -10)
+        self.assertEqual(points_awarded(self.user), 0)
+        self.assertEqual(TargetStat.objects.get(target_user=self.user).last_awarded, -10)
+        apv = award_points(self.user, -1)
+        self.assertEqual(apv.points, 0)
+        apv = award_points(self.user, 3)
+        self.assertEqual((apv.points, apv.reason), (3, ""))
+        self.assertEqual(points_awarded(self.user), 3)
+        self.assertEqual(
+            AwardedPointValue.objects.filter(target_user=self.user).aggregate(Sum("points"))["points__sum"],
+            3
+        )
+
+    def test_floor(self):
+        self.assertFloored()
+
+    def test_first_award(self):
+        group = Group.objects.create(name="Hobbits")
+        apv = award_points(group, -4)
+        self.assertEqual(apv.points, 0)
+        self.assertEqual(points_awarded(group), 0)
+
+    def test_without_returning(self):
+        with mock.patch("pinax.points.sql.can_return_from_update", return_value=False):
+            self.assertFloored()
+
+    def test_without_upsert(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+            self.assertFloored()
+            group = Group.objects.create(name="Hobbits")
+            self.assertEqual(award_points(group, -4).points, 0)
+
+    def test_without_upsert_or_returning(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False), \
+                mock.patch("pinax.points.sql.can_return_from_update", return_value=False):
+            self.assertFloored()
+
+    def test_signal_sends_applied_points(self):
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append((kwargs["points"], kwargs["total"]))
+
+        signals.points_awarded.connect(receiver)
+        try:
+            award_points(self.user, -25)
+        finally:
+            signals.points_awarded.disconnect(receiver)
+        self.assertEqual(received, [(-10, 0)])
+
+    @mock.patch("pinax.points.models.LEVEL_THRESHOLDS", [-5, 5])
+    def test_floor_sets_level(self):
+        award_points(self.user, 1)
+        self.assertEqual(TargetStat.objects.get(target_user=self.user).level, 3)
+        award_points(self.user, -20)
+        self.assertEqual(TargetStat.objects.get(target_user=self.user).level, 2)
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+            award_points(self.user, 6)
+            award_points(self.user, -20)
+        self.assertEqual(TargetStat.objects.get(target_user=self.user).level, 2)
+
+
+@mock.patch("pinax.points.models.ALLOW_NEGATIVE_TOTALS", True)
+@mock.patch("pinax.points.models.LEVEL_THRESHOLDS", [10, 50, 100])
+class LevelsTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.user = self.users[0]
+
+    def level(self, target):
+        return TargetStat.objects.get(target_user=target).level
+
+    def assertLevels(self):
+        for points, level in [(5, 1), (5, 2), (140, 4), (-60, 3), (-85, 1)]:
+            award_points(self.user, points)
+            self.assertEqual(self.level(self.user), level)
+
+    def test_level_for_points(self):
+        self.assertEqual(
+            [level_for_points(p) for p in [-5, 0, 9, 10, 49, 50, 100, 1000]],
+            [1, 1, 1, 2, 2, 3, 4, 4]
+        )
+
+    def test_award_moves_level(self):
+        self.assertLevels()
+
+    def test_first_award(self):
+        award_points(self.user, 60)
+        self.assertEqual(self.level(self.user), 3)
+
+    def test_no_extra_queries(self):
+        award_points(self.user, 5)
+        with self.assertNumQueries(4):
+            award_points(self.user, 5)
+        self.assertEqual(self.level(self.user), 2)
+
+    def test_without_upsert(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+            award_points(self.users[1], 20)
+            self.assertEqual(self.level(self.users[1]), 2)
+            self.assertLevels()
+
+    def test_without_returning(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False), \
+                mock.patch("pinax.points.sql.can_return_from_update", return_value=False):
+            self.assertLevels()
+
+    def test_bulk(self):
+        award_points(self.users[0], 40)
+        award_points_bulk([(self.users[0], 20), (self.users[1], 120), (self.users[2], 3)])
+        self.assertEqual([self.level(u) for u in self.users], [3, 4, 1])
+
+    def test_recompute_command(self):
+        for i, user in enumerate(self.users):
+            award_points(user, 30 * (i + 1))
+        TargetStat.objects.update(level=1)
+        out = StringIO()
+        with mock.patch("pinax.points.models.LEVEL_THRESHOLDS", [20, 60]):
+            call_command("recompute_levels", chunk_size=2, stdout=out)
+            self.assertEqual([self.level(u) for u in self.users], [2, 3, 3])
+        self.assertEqual(out.getvalue().strip(), "Updated the level of 3 targets")
+
+
 class PositionsTestCase(BasePointsTestCase, TestCase):
 
     def test_no_range(self):
@@ -308,6 +758,818 @@ class PositionsTestCase(BasePointsTestCase, TestCase):
         )
 
 
+class RankedPositionsTestCase(BasePointsTestCase, TestCase):
+    """
+    The window function engine must match the grouped Python fallback.
+    """
+
+    def setUp(self):
+        self.setup_users(30)
+        for i, user in enumerate(self.users):
+            TargetStat.objects.create(target_user=user, points=(i * 7) % 11)
+
+    def positions(self):
+        return list(TargetStat.objects.order_by("pk").values_list("position", flat=True))
+
+    def assertEnginesAgree(self, point_range=None):
+        stale = TargetStat.objects.all()
+        if point_range is not None:
+            stale = stale.filter(points__range=sorted(point_range))
+        stale.update(position=None)
+        TargetStat._update_positions_grouped(point_range and tuple(sorted(point_range)))
+        expected = self.positions()
+        stale.update(position=None)
+        TargetStat.update_positions(point_range)
+        self.assertEqual(self.positions(), expected)
+
+    def test_can_rank_on_sqlite(self):
+        self.assertTrue(sql.can_rank(connection))
+
+    def test_full_recompute(self):
+        self.assertEnginesAgree()
+
+    def test_range_recompute(self):
+        self.assertEnginesAgree((3, 7))
+
+    def test_reversed_range_recompute(self):
+        TargetStat._update_positions_grouped()
+        TargetStat.objects.filter(points=10).update(points=4)
+        self.assertEnginesAgree((10, 4))
+
+    def test_positions_follow_rank_semantics(self):
+        TargetStat.update_positions()
+        for stat in TargetStat.objects.all():
+            self.assertEqual(stat.position, TargetStat.objects.filter(points__gt=stat.points).count() + 1)
+
+    def test_only_changed_rows_are_written(self):
+        TargetStat.update_positions()
+        self.assertEqual(TargetStat.update_positions(), 0)
+        TargetStat.objects.filter(target_user=self.users[0]).update(points=100)
+        # the bumped user moves to the top and everyone else shifts down one
+        self.assertEqual(TargetStat.update_positions((0, 100)), 30)
+        self.assertEqual(TargetStat.update_positions((0, 100)), 0)
+
+    def test_fallback_without_window_functions(self):
+        with mock.patch("pinax.points.sql.can_rank", return_value=False):
+            TargetStat.update_positions()
+        expected = self.positions()
+        TargetStat.objects.update(position=None)
+        TargetStat.update_positions()
+        self.assertEqual(self.positions(), expected)
+
+
+class PointRollupTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(1)
+        self.user = self.users[0]
+        self.group = Group.objects.create(name="Dwarfs")
+        self.now = datetime.now()
+        for target in (self.user, self.group):
+            for minutes, points in [(0, 1), (20, 2), (95, 4), (60 * 30, 8), (60 * 24 * 9, 16)]:
+                apv = award_points(target, points)
+                apv.timestamp = self.now - timedelta(minutes=minutes)
+                apv.save()
+
+    def assertMatchesLedger(self, target, since):
+        expected = sum(
+            apv.points for apv in AwardedPointValue.objects.filter(timestamp__gte=since)
+            if apv.target == target
+        )
+        self.assertEqual(points_awarded(target, since=since), expected)
+
+    def test_windows_match_ledger(self):
+        for target in (self.user, self.group):
+            for minutes in [1, 19, 21, 59, 60, 61, 96, 60 * 24, 60 * 31, 60 * 24 * 8, 60 * 24 * 10]:
+                self.assertMatchesLedger(target, self.now - timedelta(minutes=minutes))
+
+    def test_buckets(self):
+        user_type = ContentType.objects.get_for_model(User)
+        day = PointRollup.truncate(self.now, PointRollup.DAY)
+        total = PointRollup.objects.filter(
+            target_content_type=user_type,
+            target_object_id=self.user.pk,
+            period=PointRollup.DAY,
+        ).aggregate(Sum("points"))["points__sum"]
+        self.assertEqual(total, 31)
+        hours = PointRollup.objects.filter(
+            target_content_type=user_type,
+            target_object_id=self.user.pk,
+            period=PointRollup.HOUR,
+        )
+        self.assertEqual(
+            sorted(hours.values_list("bucket", flat=True)),
+            sorted(set(
+                PointRollup.truncate(apv.timestamp, PointRollup.HOUR)
+                for apv in AwardedPointValue.objects.filter(target_user=self.user)
+            ))
+        )
+        self.assertTrue(PointRollup.objects.filter(bucket=day, period=PointRollup.DAY).exists())
+
+    def test_aligned_window_skips_ledger(self):
+        since = PointRollup.truncate(self.now, PointRollup.HOUR) - timedelta(hours=3)
+        with self.assertNumQueries(1):
+            points = points_awarded(self.user, since=since)
+        self.assertEqual(points, sum(
+            apv.points for apv in AwardedPointValue.objects.filter(target_user=self.user, timestamp__gte=since)
+        ))
+
+    def test_delete(self):
+        apv = AwardedPointValue.objects.filter(target_user=self.user).order_by("-timestamp")[0]
+        apv.delete()
+        self.assertEqual(points_awarded(self.user, since=self.now - timedelta(minutes=1)), 0)
+
+    def test_bulk_award(self):
+        award_points_bulk([(self.user, 32), (self.group, 64)])
+        self.assertEqual(points_awarded(self.user, since=self.now - timedelta(hours=1)), 35)
+        self.assertEqual(points_awarded(self.group, since=self.now - timedelta(hours=1)), 67)
+
+    def test_without_upsert(self):
+        with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+            award_points(self.user, 32)
+            award_points(self.user, 32)
+        self.assertEqual(points_awarded(self.user, since=self.now - timedelta(hours=1)), 67)
+
+    def test_ceil(self):
+        hour = datetime(2020, 1, 1, 10)
+        self.assertEqual(PointRollup.ceil(hour, PointRollup.HOUR), hour)
+        self.assertEqual(PointRollup.ceil(hour + timedelta(seconds=1), PointRollup.HOUR), hour + timedelta(hours=1))
+        self.assertEqual(PointRollup.ceil(hour, PointRollup.DAY), datetime(2020, 1, 2))
+
+    @override_settings(USE_TZ=True, TIME_ZONE="America/New_York")
+    def test_time_zone(self):
+        user = User.objects.create_user("eastern")
+        # naive, as the timestamp default gives; 01:45 UTC on June 2nd
+        stamp = datetime(2020, 6, 1, 21, 45)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", "DateTimeField .* received a naive datetime", RuntimeWarning)
+            apv = award_points(user, 5)
+            apv.timestamp = stamp
+            apv.save()
+            with mock.patch("pinax.points.sql.can_upsert", return_value=False):
+                apv = award_points(user, 3)
+                apv.timestamp = stamp
+                apv.save()
+            buckets = PointRollup.objects.filter(
+                target_content_type=ContentType.objects.get_for_model(User),
+                target_object_id=user.pk,
+            ).exclude(points=0)
+            self.assertEqual(sorted(buckets.values_list("period", "bucket", "points")), [
+                (PointRollup.DAY, datetime(2020, 6, 2, tzinfo=timezone.utc), 8),
+                (PointRollup.HOUR, datetime(2020, 6, 2, 1, tzinfo=timezone.utc), 8),
+            ])
+            self.assertEqual(points_awarded(user, since=stamp - timedelta(hours=3)), 8)
+            self.assertEqual(points_awarded(user, since=stamp - timedelta(minutes=5)), 8)
+            self.assertEqual(points_awarded(user, since=stamp + timedelta(minutes=5)), 0)
+
+
+class CompactPointsTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(2)
+        self.setup_points({"POSTED": 3})
+        self.user, self.source = self.users
+        self.group = Group.objects.create(name="Dwarfs")
+        self.now = datetime.now()
+        for days, minutes, key, source in [
+            (40, 60, "POSTED", None),
+            (40, 70, "POSTED", None),
+            (40, 80, "POSTED", self.source),
+            (40, 90, 2, self.source),
+            (40, 100, 2, self.source),
+            (40, 300, "POSTED", None),
+            (41, 180, "POSTED", None),
+            (41, 210, "POSTED", None),
+            (45, 120, "POSTED", None),
+            (45, 150, "POSTED", None),
+            (1, 0, "POSTED", None),
+            (1, 10, "POSTED", None),
+        ]:
+            for target in (self.user, self.group):
+                apv = award_points(target, key, source=source)
+                day = PointRollup.truncate(self.now - timedelta(days=days), PointRollup.DAY)
+                apv.timestamp = day + timedelta(minutes=minutes)
+                apv.save()
+        hour = PointRollup.truncate(self.now, PointRollup.HOUR)
+        self.windows = [
+            hour - timedelta(days=days, hours=hours)
+            for days in [0, 2, 40, 41, 44, 46] for hours in [0, 6, 23]
+        ]
+
+    def totals(self, target):
+        return (
+            points_awarded(target),
+            points_awarded(target, source=self.source),
+            AwardedPointValue.objects.filter(pk__in=[
+                apv.pk for apv in AwardedPointValue.objects.all() if apv.target == target
+            ]).aggregate(Sum("points"))["points__sum"],
+        )
+
+    def windowed(self, target):
+        return [
+            (points_awarded(target, since=since), sum(
+                apv.points for apv in AwardedPointValue.objects.filter(timestamp__gte=since)
+                if apv.target == target
+            ))
+            for since in self.windows
+        ]
+
+    def test_compact(self):
+        targets = (self.user, self.group)
+        before = [self.totals(target) for target in targets]
+        windowed = [self.windowed(target) for target in targets]
+        out = StringIO()
+        call_command("compact_points", days=30, batch_size=3, stdout=out)
+        self.assertEqual([self.totals(target) for target in targets], before)
+        # windows starting on the hour are unchanged, and rollup and ledger agree
+        self.assertEqual([self.windowed(target) for target in targets], windowed)
+        for target in targets:
+            for rollup, ledger in self.windowed(target):
+                self.assertEqual(rollup, ledger)
+        self.assertEqual(out.getvalue().strip(), "Compacted 16 awards into 8")
+        self.assertEqual(AwardedPointValue.objects.count(), 16)
+        self.assertFalse(ArchivedPointValue.objects.exists())
+        summary = AwardedPointValue.objects.get(
+            target_user=self.user, source_user=self.source, value__isnull=True
+        )
+        self.assertEqual((summary.points, summary.reason), (4, "compacted from 2 awards"))
+        self.assertEqual(summary.timestamp, PointRollup.truncate(self.now - timedelta(days=40), PointRollup.DAY) +
+                         timedelta(hours=1))
+
+        call_command("compact_points", days=30, batch_size=3, stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[-1], "Compacted 0 awards into 0")
+
+    def test_interleaved_targets(self):
+        AwardedPointValue.objects.all().delete()
+        users = self.users + [User.objects.create_user("user_{0}".format(i)) for i in range(2, 5)]
+        hour = PointRollup.truncate(self.now - timedelta(days=40), PointRollup.HOUR)
+        for i in range(6):
+            for user in users:
+                apv = award_points(user, 1)
+                apv.timestamp = hour + timedelta(minutes=i)
+                apv.save()
+        out = StringIO()
+        call_command("compact_points", days=30, batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Compacted 30 awards into 5")
+        self.assertEqual(
+            sorted(AwardedPointValue.objects.values_list("target_user", "points")),
+            sorted((user.pk, 6) for user in users)
+        )
+
+    def test_archive(self):
+        originals = set(AwardedPointValue.objects.filter(
+            timestamp__lt=self.now - timedelta(days=30)
+        ).values_list("pk", "points"))
+        call_command("compact_points", days=30, archive=True, stdout=StringIO())
+        archived = set(ArchivedPointValue.objects.values_list("awarded_id", "points"))
+        self.assertEqual(len(archived), 16)
+        self.assertTrue(archived < originals)
+        self.assertEqual(AwardedPointValue.objects.count(), 16)
+
+    def test_recent_rows_are_kept(self):
+        recent = set(AwardedPointValue.objects.filter(
+            timestamp__gte=self.now - timedelta(days=30)
+        ).values_list("pk", flat=True))
+        call_command("compact_points", days=30, stdout=StringIO())
+        self.assertTrue(recent <= set(AwardedPointValue.objects.values_list("pk", flat=True)))
+
+
+class RebuildPointsMixin(BasePointsTestCase):
+
+    def setUp(self):
+        self.setup_users(4)
+        self.groups = [Group.objects.create(name="Group {0}".format(i)) for i in range(4)]
+        for i, target in enumerate(self.users + self.groups):
+            award_points(target, 10 + i)
+            award_points(target, 5)
+        # drift: a wrong total, a missing row and a row without any awards
+        TargetStat.objects.filter(target_user=self.users[1]).update(points=3)
+        TargetStat.objects.filter(target_object_id=self.groups[2].pk).delete()
+        TargetStat.objects.create(
+            target_content_type=ContentType.objects.get_for_model(Site),
+            target_object_id=1,
+            points=7,
+        )
+
+    def stats(self):
+        return sorted(TargetStat.objects.values_list(
+            "target_user", "target_content_type", "target_object_id", "points", "position"
+        ), key=str)
+
+    def report(self):
+        return [
+            "user {0}: TargetStat 3, ledger 16".format(self.users[1].pk),
+            "content type {0} {1}: TargetStat missing, ledger 21".format(
+                ContentType.objects.get_for_model(Group).pk, self.groups[2].pk
+            ),
+            "content type {0} 1: TargetStat 7, ledger 0".format(ContentType.objects.get_for_model(Site).pk),
+        ]
+
+
+class RebuildPointsTestCase(RebuildPointsMixin, TestCase):
+
+    def test_dry_run(self):
+        before = self.stats()
+        out = StringIO()
+        call_command("rebuild_points", dry_run=True, verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), self.report() + ["Checked 9 targets, 3 drifted"])
+        self.assertEqual(self.stats(), before)
+
+    def test_repair(self):
+        out = StringIO()
+        call_command("rebuild_points", batch_size=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Checked 9 targets, 3 repaired")
+        self.assertEqual(points_awarded(self.users[1]), 16)
+        self.assertEqual(points_awarded(self.groups[2]), 21)
+        self.assertEqual(
+            TargetStat.objects.get(target_content_type=ContentType.objects.get_for_model(Site)).points, 0
+        )
+        self.assertEqual(
+            list(TargetStat.objects.order_by("position").values_list("points", "position"))[:3],
+            [(22, 1), (21, 2), (20, 3)]
+        )
+        call_command("rebuild_points", stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[-1], "Checked 9 targets, 0 repaired")
+
+    def test_partitions(self):
+        from pinax.points.management.commands.rebuild_points import check_partition, partitions
+        whole = partitions(1)
+        self.assertEqual(len(whole), 3)
+        split = partitions(3)
+        self.assertTrue(len(split) > len(whole))
+        for tasks in (whole, split):
+            results = [check_partition(task, repair=False, collect=True) for task in tasks]
+            self.assertEqual(sum(r[0] for r in results), 9)
+            self.assertEqual(sum(r[1] for r in results), 3)
+            self.assertEqual(len([row for r in results for row in r[2]]), 3)
+        self.assertEqual([check_partition(task, repair=False)[2] for task in whole], [[], [], []])
+
+    def test_award_between_reads(self):
+        from pinax.points.management.commands import rebuild_points
+        merge = rebuild_points._merge
+        awarded = []
+
+        def award_after_ledger(ledger, stats):
+            # the users' ledger stream is read before the award, their stats after it
+            ledger = list(ledger)
+            if not awarded:
+                awarded.append(award_points(self.users[2], 5))
+            return merge(ledger, stats)
+
+        out = StringIO()
+        with mock.patch.object(rebuild_points, "_merge", side_effect=award_after_ledger):
+            call_command("rebuild_points", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Checked 9 targets, 3 repaired")
+        self.assertEqual(points_awarded(self.users[2]), 22)
+        self.assertEqual(AwardedPointValue.points_awarded(target_user=self.users[2]), 22)
+
+    def test_repairs_each_batch(self):
+        from pinax.points.management.commands import rebuild_points
+        with mock.patch.object(rebuild_points, "_recheck", wraps=rebuild_points._recheck) as recheck:
+            call_command("rebuild_points", batch_size=1, stdout=StringIO())
+        self.assertEqual([len(c[0][1]) for c in recheck.call_args_list], [1, 1, 1])
+        self.assertEqual(points_awarded(self.users[1]), 16)
+
+
+@skipUnless(multiprocessing.get_start_method() == "fork", "workers inherit the in-memory test database")
+class RebuildPointsWorkersTestCase(RebuildPointsMixin, TransactionTestCase):
+
+    def test_workers(self):
+        # each worker checks and repairs its own copy of the in-memory test
+        # database, so only the reports that come back are compared
+        out = StringIO()
+        call_command("rebuild_points", workers=2, dry_run=True, verbosity=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(sorted(lines[:-1]), sorted(self.report()))
+        self.assertEqual(lines[-1], "Checked 9 targets, 3 drifted")
+        out = StringIO()
+        call_command("rebuild_points", workers=2, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Checked 9 targets, 3 repaired")
+
+
+class ExportPointsTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(2)
+        self.setup_points({"POSTED": 3})
+        self.group = Group.objects.create(name="Dwarfs")
+        for day, target, key, source in [
+            (1, self.users[0], "POSTED", None),
+            (2, self.group, 5, self.users[1]),
+            (3, self.users[1], "POSTED", self.group),
+        ]:
+            apv = award_points(target, key, reason="day {0}".format(day), source=source)
+            apv.timestamp = datetime(2020, 1, day, 12)
+            apv.save()
+        self.apvs = list(AwardedPointValue.objects.order_by("pk"))
+
+    def export(self, *args):
+        out = StringIO()
+        call_command("export_points", *args, stdout=out)
+        return out.getvalue()
+
+    def test_csv(self):
+        self.assertEqual(self.export().splitlines(), [
+            "id,timestamp,points,key,reason,target_type,target_id,source_type,source_id",
+            "{0},2020-01-01T12:00:00,3,POSTED,day 1,auth.user,{1},,".format(self.apvs[0].pk, self.users[0].pk),
+            "{0},2020-01-02T12:00:00,5,,day 2,auth.group,{1},auth.user,{2}".format(
+                self.apvs[1].pk, self.group.pk, self.users[1].pk
+            ),
+            "{0},2020-01-03T12:00:00,3,POSTED,day 3,auth.user,{1},auth.group,{2}".format(
+                self.apvs[2].pk, self.users[1].pk, self.group.pk
+            ),
+        ])
+
+    def test_ndjson_filters(self):
+        rows = [
+            json.loads(line)
+            for line in self.export("--format", "ndjson", "--since", "2020-01-01T13:00", "--key", "POSTED").splitlines()
+        ]
+        self.assertEqual(rows, [{
+            "id": self.apvs[2].pk,
+            "timestamp": "2020-01-03T12:00:00",
+            "points": 3,
+            "key": "POSTED",
+            "reason": "day 3",
+            "target_type": "auth.user",
+            "target_id": self.users[1].pk,
+            "source_type": "auth.group",
+            "source_id": self.group.pk,
+        }])
+        self.assertEqual(len(self.export("--until", "2020-01-03").splitlines()), 3)
+
+    def test_output_file(self):
+        with tempfile.NamedTemporaryFile("r", suffix=".ndjson") as f:
+            self.export("--format", "ndjson", "--output", f.name, "--chunk-size", "1")
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+    def test_bad_date(self):
+        with self.assertRaises(CommandError):
+            self.export("--since", "yesterday")
+
+    def test_queries_do_not_grow_with_rows(self):
+        # content types, then the ledger with its keys joined in
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(export.ledger_rows())), 3)
+
+    def test_view(self):
+        request = RequestFactory().get(reverse("pinax_points:export"), {"format": "ndjson", "key": "POSTED"})
+        request.user = User.objects.create_user("staff", is_staff=True)
+        response = views.export_ledger(request)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [self.apvs[0].pk, self.apvs[2].pk])
+
+    def test_view_bad_request(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        for params in [{"format": "xml"}, {"until": "soon"}]:
+            request = RequestFactory().get(reverse("pinax_points:export"), params)
+            request.user = staff
+            self.assertEqual(views.export_ledger(request).status_code, 400)
+
+
+class ImportPointsTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.setup_points({"POSTED": 3})
+        self.group = Group.objects.create(name="Dwarfs")
+
+    def import_points(self, content, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=args and ".ndjson" or ".csv") as f:
+            f.write(content)
+            f.flush()
+            out = StringIO()
+            call_command("import_points", f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        award_points(self.users[0], "POSTED", source=self.group)
+        award_points(self.group, 5, reason="bonus", source=self.users[1])
+        award_points(self.users[1], 7)
+        exported = StringIO()
+        call_command("export_points", stdout=exported)
+        rows = list(AwardedPointValue.objects.order_by("pk").values_list(
+            "points", "value", "reason", "target_user", "target_content_type", "target_object_id",
+            "source_user", "source_content_type", "source_object_id", "timestamp",
+        ))
+
+        AwardedPointValue.objects.all().delete()
+        TargetStat.objects.all().delete()
+        PointRollup.objects.all().delete()
+        output = self.import_points(exported.getvalue())
+
+        self.assertEqual(output, "Imported 3 awards, updated 3 of 3 targets\n")
+        self.assertEqual(list(AwardedPointValue.objects.order_by("pk").values_list(
+            "points", "value", "reason", "target_user", "target_content_type", "target_object_id",
+            "source_user", "source_content_type", "source_object_id", "timestamp",
+        )), rows)
+        self.assertEqual(points_awarded(self.users[0]), 3)
+        self.assertEqual(points_awarded(self.group), 5)
+        self.assertEqual(points_awarded(self.group, since=datetime.now() - timedelta(hours=2)), 5)
+        self.assertEqual(
+            list(TargetStat.objects.order_by("position").values_list("points", "position")),
+            [(7, 1), (5, 2), (3, 3)],
+        )
+
+    def test_ndjson_defaults(self):
+        award_points(self.users[2], 4)
+        lines = [
+            {"key": "POSTED", "target_type": "auth.User", "target_id": self.users[0].pk},
+            {"points": -1, "target_type": "auth.group", "target_id": self.group.pk, "timestamp": "2020-01-01"},
+            {"key": "POSTED", "points": 10, "target_type": "auth.user", "target_id": self.users[2].pk},
+        ]
+        self.import_points("".join(json.dumps(line) + "\n" for line in lines), "--batch-size", "2")
+        apvs = AwardedPointValue.objects.order_by("pk")
+        self.assertEqual([apv.points for apv in apvs], [4, 3, -1, 10])
+        self.assertEqual(apvs[2].timestamp, datetime(2020, 1, 1))
+        self.assertEqual(points_awarded(self.users[2]), 14)
+        self.assertEqual(TargetStat.objects.get(target_user=self.users[2]).position, 1)
+
+    def test_inserts_are_batched(self):
+        content = "timestamp,points,target_type,target_id\n" + "".join(
+            "2020-01-0{0},1,auth.user,{1}\n".format(day, user.pk)
+            for day in range(1, 5) for user in self.users
+        )
+        with CaptureQueriesContext(connection) as captured:
+            self.import_points(content, "--format", "csv")
+        inserts = [q for q in captured if q["sql"].startswith('INSERT INTO "pinax_points_awardedpointvalue"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(points_awarded(self.users[1]), 4)
+
+    def test_bad_rows(self):
+        for content, message in [
+            ("points,target_type,target_id\n1,auth.user,1\n1,auth.nope,1\n", "Line 3: unknown target type 'auth.nope'"),
+            ("key,target_type,target_id\nMISSING,auth.user,1\n", "Line 2: unknown PointValue key 'MISSING'"),
+            ("points,target_id\n1,1\n", "Line 2: missing 'target_type'"),
+            ("target_type,target_id\nauth.user,1\n", "Line 2: points or key is required"),
+        ]:
+            with self.assertRaisesMessage(CommandError, message):
+                self.import_points(content)
+        self.assertEqual(AwardedPointValue.objects.count(), 0)
+
+    def test_only_imported_targets_are_updated(self):
+        award_points(self.users[1], 4)
+        TargetStat.objects.filter(target_user=self.users[1]).update(points=99)
+        output = self.import_points("points,target_type,target_id\n2,auth.user,{0}\n".format(self.users[0].pk))
+        self.assertEqual(output, "Imported 1 awards, updated 1 of 1 targets\n")
+        self.assertEqual(points_awarded(self.users[0]), 2)
+        self.assertEqual(TargetStat.objects.get(target_user=self.users[1]).points, 99)
+
+    def test_bad_row_keeps_its_error(self):
+        content = "points,target_type,target_id\n2,auth.user,{0}\n1,auth.nope,1\n".format(self.users[0].pk)
+        with self.assertRaisesMessage(CommandError, "Line 3: unknown target type 'auth.nope'"):
+            self.import_points(content, "--format", "csv", "--batch-size", "1")
+        # the batch before the bad row is imported and totalled
+        self.assertEqual(points_awarded(self.users[0]), 2)
+        self.assertEqual(TargetStat.objects.get(target_user=self.users[0]).position, 1)
+
+        with mock.patch("pinax.points.management.commands.import_points.check_targets", side_effect=DatabaseError):
+            with self.assertRaisesMessage(CommandError, "Line 3: unknown target type 'auth.nope'"):
+                self.import_points(content, "--format", "csv", "--batch-size", "1")
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are checked on SQLite")
+class IndexUsageTestCase(BasePointsTestCase, TestCase):
+    """
+    Each public query path must be served by one of the indexes in
+    ``0004_query_indexes``.
+    """
+
+    def setUp(self):
+        self.setup_users(2)
+        self.group = Group.objects.create(name="Dwarfs")
+        award_points(self.users[0], 10, source=self.users[1])
+        award_points(self.group, 10, source=self.users[1])
+
+    def assertUsesIndex(self, func, index):
+        statements = []
+
+        def capture(execute, statement, params, many, context):
+            statements.append((statement, params))
+            return execute(statement, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            func()
+        plans = []
+        with connection.cursor() as cursor:
+            for statement, params in statements:
+                if statement.startswith(("SELECT", "UPDATE")):
+                    cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+                    plans.extend(row[-1] for row in cursor.fetchall())
+        self.assertTrue(
+            any(" INDEX {0} ".format(index) in plan + " " for plan in plans),
+            "{0} not used by any of {1}".format(index, plans)
+        )
+
+    def test_user_vote_lookup(self):
+        self.assertUsesIndex(
+            lambda: points_awarded(target=self.users[0], source=self.users[1]),
+            "pinax_apv_user_source"
+        )
+
+    def test_generic_vote_lookup(self):
+        self.assertUsesIndex(
+            lambda: points_awarded(target=self.group, source=self.users[1]),
+            "pinax_apv_target_source"
+        )
+
+    def test_user_since(self):
+        self.assertUsesIndex(
+            lambda: points_awarded(self.users[0], since=datetime.now() - timedelta(days=7)),
+            "pinax_apv_user_time"
+        )
+
+    def test_generic_since(self):
+        self.assertUsesIndex(
+            lambda: points_awarded(self.group, since=datetime.now() - timedelta(days=7)),
+            "pinax_apv_target_time"
+        )
+
+    def test_ranking(self):
+        self.assertUsesIndex(lambda: TargetStat.update_positions((5, 10)), "pinax_stat_points")
+
+    def test_user_leaderboard(self):
+        self.assertUsesIndex(lambda: list(fetch_top_objects(User, None)[:10]), "pinax_stat_points")
+
+    def test_generic_leaderboard(self):
+        self.assertUsesIndex(lambda: list(fetch_leaderboard(Group)[:10]), "pinax_stat_type_points")
+
+    def test_grouped_ranking(self):
+        self.assertUsesIndex(
+            lambda: TargetStat._update_positions_grouped((5, 10)),
+            "pinax_stat_points"
+        )
+
+    def test_time_range(self):
+        since = datetime.now() - timedelta(days=7)
+        self.assertUsesIndex(
+            lambda: AwardedPointValue.objects.filter(timestamp__gte=since, timestamp__lt=datetime.now()).count(),
+            "pinax_apv_time"
+        )
+
+
+class AdminTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.setup_points({"POSTED": 3})
+        self.groups = [Group.objects.create(name="Group {0}".format(i)) for i in range(2)]
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(self.admin)
+
+    def award_many(self, n):
+        targets = self.users + self.groups
+        award_points_bulk((targets[i % len(targets)], "POSTED" if i % 2 else 1) for i in range(n))
+
+    def changelist(self, **params):
+        return self.client.get(reverse("admin:pinax_points_awardedpointvalue_changelist"), params)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.award_many(5)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.changelist().status_code, 200)
+        self.award_many(40)
+        with CaptureQueriesContext(connection) as many:
+            response = self.changelist()
+        self.assertEqual(len(many), len(few))
+        self.assertContains(response, "Group 1")
+        self.assertContains(response, "POSTED")
+
+    def test_filters(self):
+        self.award_many(4)
+        AwardedPointValue.objects.filter(pk=AwardedPointValue.objects.first().pk).update(
+            timestamp=datetime.now() - timedelta(days=30)
+        )
+        response = self.changelist(**{"timestamp__gte": (datetime.now() - timedelta(days=7)).date().isoformat()})
+        self.assertEqual(response.context["cl"].result_count, 3)
+        response = self.changelist(value__id__exact=PointValue.objects.get(key="POSTED").pk)
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+    def test_estimated_count(self):
+        self.award_many(4)
+        queryset = AwardedPointValue.objects.order_by("pk")
+        with mock.patch("pinax.points.sql.estimated_count", return_value=("SELECT 250000", [])):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 250000)
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(points=1), 100).count, 2)
+        with mock.patch("pinax.points.sql.estimated_count", return_value=("SELECT 50", [])):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 4)
+        # SQLite keeps no estimate
+        self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 4)
+
+    def test_one_off_points(self):
+        url = reverse("admin:pinax_points_awardedpointvalue_one_off_points")
+        response = self.client.get(url)
+        self.assertContains(response, "vForeignKeyRawIdAdminField")
+        self.assertNotContains(response, "<option")
+        response = self.client.post(url, {"user": self.users[1].pk, "points": 7, "reason": "thanks"})
+        self.assertRedirects(response, reverse("admin:pinax_points_awardedpointvalue_changelist"))
+        self.assertEqual(points_awarded(self.users[1]), 7)
+
+    def test_one_off_points_invalid(self):
+        url = reverse("admin:pinax_points_awardedpointvalue_one_off_points")
+        response = self.client.post(url, {"user": 0, "points": 7, "reason": "thanks"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].form.errors)
+
+
+class BulkAwardAdminTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(4)
+        self.users[3].is_active = False
+        self.users[3].save()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:pinax_points_awardedpointvalue_bulk_points")
+
+    def post(self, **data):
+        return self.client.post(self.url, dict(data, points=5, reason="sorry"))
+
+    def totals(self):
+        return [points_awarded(user) for user in self.users]
+
+    def test_uploaded_ids(self):
+        ids = SimpleUploadedFile("ids.txt", "{0}, {1}\n999999\n".format(self.users[0].pk, self.users[2].pk).encode())
+        with mock.patch.object(TargetStat, "update_positions", wraps=TargetStat.update_positions) as update:
+            response = self.post(user_ids=ids)
+        self.assertRedirects(response, reverse("admin:pinax_points_awardedpointvalue_changelist"))
+        self.assertEqual(self.totals(), [5, 0, 5, 0])
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)],
+            ["Awarded 5 points to 2 users."]
+        )
+
+    def test_filter(self):
+        response = self.post(user_filter="is_active=1&username__startswith=user_")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [5, 5, 5, 0])
+        self.assertEqual(points_awarded(self.admin), 0)
+
+    def test_invalid(self):
+        ids = SimpleUploadedFile("ids.txt", b"1 two")
+        for data, error in [
+            ({}, "Upload a list of user ids or enter a filter, but not both."),
+            ({"user_filter": "is_active=1", "user_ids": SimpleUploadedFile("ids.txt", b"1")},
+             "Upload a list of user ids or enter a filter, but not both."),
+            ({"user_ids": ids}, "The file must hold user ids separated by commas, spaces or new lines."),
+            ({"user_filter": "is_active__nope=1"}, "Invalid filter"),
+            ({"user_filter": "nope=1"}, "Users can only be filtered by their own fields, not &#x27;nope&#x27;."),
+            ({"user_filter": "password__startswith=md5"}, "Users can&#x27;t be filtered by password."),
+            ({"user_filter": "is_active=1&groups__user__password__startswith=pbkdf2_sha256$"},
+             "Users can&#x27;t be filtered by password."),
+            ({"user_filter": "groups__user__username=admin"},
+             "Users can only be filtered by their own fields, not &#x27;groups&#x27;."),
+            ({"user_filter": "awardedpointvalue_targets__points=1"},
+             "Users can only be filtered by their own fields, not &#x27;awardedpointvalue_targets&#x27;."),
+        ]:
+            response = self.post(**data)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, error)
+        self.assertEqual(AwardedPointValue.objects.count(), 0)
+
+    def test_requires_add_permission(self):
+        staff = User.objects.create_user("staff", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_user_action(self):
+        url = reverse("admin:auth_user_changelist")
+        with mock.patch.object(admin.site._registry[User], "actions", [award_points_action]):
+            response = self.client.post(url, {
+                "action": "award_points_action",
+                "_selected_action": [self.users[0].pk, self.users[1].pk],
+            })
+            self.assertContains(response, "The points will be awarded to 2 users.")
+            self.assertEqual(self.totals(), [0, 0, 0, 0])
+            response = self.client.post(url, {
+                "action": "award_points_action",
+                "_selected_action": [self.users[0].pk, self.users[1].pk],
+                "select_across": "0",
+                "apply": "1",
+                "points": 5,
+                "reason": "sorry",
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [5, 5, 0, 0])
+
+    def test_user_action_select_across(self):
+        url = reverse("admin:auth_user_changelist") + "?is_active__exact=0"
+        with mock.patch.object(admin.site._registry[User], "actions", [award_points_action]):
+            response = self.client.post(url, {
+                "action": "award_points_action",
+                "_selected_action": [self.users[3].pk],
+                "select_across": "1",
+                "apply": "1",
+                "points": 5,
+                "reason": "sorry",
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.totals(), [0, 0, 0, 5])
+
+
 class TargetObjectsTestCase(BasePointsTestCase, TestCase):
 
     def test_exception_assiging_object_to_user(self):
@@ -392,11 +1654,9 @@ class TopObjectsTagTestCase(BasePointsTestCase, TestCase):
     def test_should_return_annotated_queryset_non_user_model(self):
         t = Template("""{% load pinax_points_tags %}{% top_objects "auth.Group" as top_users %}""")
         c = Context({})
-        try:
-            t.render(c)
-            self.fail("Should have raised a NotImplementedError!")
-        except NotImplementedError:
-            pass
+        t.render(c)
+        self.assertEquals(c["top_users"].model, Group)
+        self.assertEquals([g.name for g in c["top_users"]], ["Eldarion"])
 
     def test_should_return_annotated_queryset_has_points(self):
         t = Template("""{% load pinax_points_tags %}{% top_objects "auth.User" as top_users %}""")
@@ -411,13 +1671,42 @@ class TopObjectsTagTestCase(BasePointsTestCase, TestCase):
         self.assertEquals(c["top_users"][0].num_points, 50)
 
     def test_should_return_annotated_queryset_non_user_model_has_points(self):
-        t = Template("""{% load pinax_points_tags %}{% top_objects "auth.Group" as top_users %}""")
+        t = Template("""{% load pinax_points_tags %}{% top_objects "auth.Group" as top_users limit 10 %}""")
         c = Context({})
-        try:
-            t.render(c)
-            self.fail("Should have raised a NotImplementedError!")
-        except NotImplementedError:
-            pass
+        t.render(c)
+        self.assertEquals(c["top_users"][0].num_points, 20)
+
+    def test_top_objects_order_and_positions(self):
+        award_points(self.users[1], 60)
+        award_points(self.users[2], 50)
+        objs = fetch_leaderboard(User)
+        self.assertEqual(
+            [(u, u.num_points, u.points_position) for u in objs],
+            [(self.users[1], 60, 1), (self.users[0], 50, 2), (self.users[2], 50, 2)]
+        )
+        self.assertEqual(objs.count(), 3)
+        self.assertEqual(objs[1], self.users[0])
+        self.assertEqual(list(objs[1:]), [self.users[0], self.users[2]])
+
+    def test_top_objects_bulk_fetch(self):
+        for i in range(3):
+            award_points(Group.objects.create(name="Group {0}".format(i)), i + 1)
+        # one query for the stats and one bulk fetch of the groups
+        with self.assertNumQueries(2):
+            self.assertEqual(len(fetch_leaderboard(Group)[:3]), 3)
+
+    def test_fetch_top_objects_is_a_queryset(self):
+        award_points(self.users[1], 60)
+        group = Group.objects.create(name="Elves")
+        award_points(group, 5)
+        users = fetch_top_objects(User, None)
+        self.assertIsInstance(users, QuerySet)
+        self.assertEqual([(u, u.num_points) for u in users[:2]], [(self.users[1], 60), (self.users[0], 50)])
+        self.assertTrue(users.filter(pk=self.users[0].pk).exists())
+        self.assertFalse(users.filter(pk=self.users[2].pk).exists())
+        groups = fetch_top_objects(Group, None)
+        self.assertIsInstance(groups, QuerySet)
+        self.assertEqual([g.num_points for g in groups.filter(name="Elves")], [5])
 
     def test_should_return_annotated_queryset_with_timeframe_has_points(self):
         t = Template("""{% load pinax_points_tags %}{% top_objects "auth.User" as top_users timeframe 7 days %}""")  # noqa
@@ -435,6 +1724,787 @@ class TopObjectsTagTestCase(BasePointsTestCase, TestCase):
             pass
 
 
+@mock.patch("pinax.points.cache.TOP_OBJECTS_CACHE_TIMEOUT", 60)
+class TopObjectsInvalidationTestCase(BasePointsTestCase, TransactionTestCase):
+
+    def setUp(self):
+        self.setup_users(1)
+        patcher = mock.patch("pinax.points.receivers.invalidate_top_objects")
+        self.invalidate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_autocommit_invalidates_once(self):
+        award_points(self.users[0], 5)
+        self.invalidate.assert_called_once_with(User, 0, 5)
+
+    def test_transaction_invalidates_again_on_commit(self):
+        with transaction.atomic():
+            award_points(self.users[0], 5)
+            self.assertEqual(self.invalidate.call_count, 1)
+        self.assertEqual(self.invalidate.call_count, 2)
+
+
+@mock.patch("pinax.points.cache.TOP_OBJECTS_CACHE_TIMEOUT", 60)
+class TopObjectsCacheTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        caches["default"].clear()
+        self.setup_users(5)
+        for i, user in enumerate(self.users):
+            award_points(user, 50 - i * 10)
+
+    def tearDown(self):
+        super(TopObjectsCacheTestCase, self).tearDown()
+        caches["default"].clear()
+
+    def render(self, limit=3, timeframe=""):
+        t = Template(
+            "{% load pinax_points_tags %}"
+            '{% top_objects "auth.User" as top limit ' + str(limit) + timeframe + " %}"
+            "{% for u in top %}{{ u.username }}={{ u.num_points }} {% endfor %}"
+        )
+        return t.render(Context({}))
+
+    def test_hit(self):
+        rendered = self.render()
+        self.assertEqual(rendered, "user_0=50 user_1=40 user_2=30 ")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), rendered)
+
+    def test_award_below_cutoff_keeps_entry(self):
+        rendered = self.render()
+        award_points(self.users[4], 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), rendered)
+
+    def test_award_reaching_cutoff_invalidates(self):
+        self.render()
+        award_points(self.users[3], 15)
+        self.assertEqual(self.render(), "user_0=50 user_1=40 user_3=35 ")
+
+    def test_award_leaving_list_invalidates(self):
+        self.render()
+        award_points(self.users[0], -45)
+        self.assertEqual(self.render(), "user_1=40 user_2=30 user_3=20 ")
+
+    def test_short_list_invalidates_on_any_award(self):
+        self.render(limit=10)
+        award_points(self.users[4], 1)
+        self.assertIn("user_4=11", self.render(limit=10))
+
+    def test_lowest_cutoff_wins(self):
+        self.render(limit=2)
+        self.render(limit=4)
+        award_points(self.users[4], 15)
+        self.assertEqual(self.render(limit=4), "user_0=50 user_1=40 user_2=30 user_4=25 ")
+
+    def test_timeframe_invalidates_on_any_award(self):
+        rendered = self.render(timeframe=" timeframe 7 days")
+        self.assertEqual(rendered, "user_0=50 user_1=40 user_2=30 ")
+        with self.assertNumQueries(0):
+            self.render(timeframe=" timeframe 7 days")
+        award_points(self.users[4], 5)
+        self.render(limit=3)
+        self.assertEqual(self.render(timeframe=" timeframe 7 days"), rendered)
+        award_points(self.users[2], -25)
+        self.assertEqual(self.render(timeframe=" timeframe 7 days"), "user_0=50 user_1=40 user_3=20 ")
+
+    def test_bulk_awards_invalidate(self):
+        self.render()
+        award_points_bulk([(self.users[4], 10), (self.users[4], 30)])
+        self.assertEqual(self.render(), "user_0=50 user_4=50 user_1=40 ")
+
+    def test_caching_off_skips_invalidation(self):
+        with mock.patch("pinax.points.cache.TOP_OBJECTS_CACHE_TIMEOUT", 0):
+            with mock.patch("pinax.points.receivers.invalidate_top_objects") as invalidate:
+                award_points(self.users[0], 5)
+        invalidate.assert_not_called()
+
+    def test_signal_sends_total(self):
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append((kwargs["points"], kwargs["total"]))
+
+        signals.points_awarded.connect(receiver)
+        try:
+            award_points(self.users[0], 5)
+            award_points_bulk([(self.users[1], 1), (self.users[1], 2)])
+        finally:
+            signals.points_awarded.disconnect(receiver)
+        self.assertEqual(received, [(5, 55), (1, 41), (2, 43)])
+
+
+class LeaderboardTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(12)
+        for i, user in enumerate(self.users):
+            # users 2k and 2k + 1 tie
+            award_points(user, 100 - (i // 2) * 10)
+
+    def test_pages_cover_leaderboard(self):
+        seen = []
+        cursor = None
+        while True:
+            page = leaderboard_page(User, cursor, limit=5)
+            if not page:
+                break
+            seen.extend(page)
+            cursor = page.cursor
+        self.assertEqual(seen, list(fetch_leaderboard(User)))
+        self.assertEqual(len(seen), 12)
+
+    def test_deep_page_query_shape(self):
+        cursor = leaderboard_page(User, None, limit=9).cursor
+        with self.assertNumQueries(2):
+            page = list(leaderboard_page(User, cursor, limit=5))
+        self.assertEqual([u.num_points for u in page], [60, 50, 50])
+
+    def test_bad_cursor(self):
+        self.assertRaises(ValueError, leaderboard_page, User, "nope")
+
+    def test_around(self):
+        neighbours = leaderboard_around(self.users[5], 2)
+        self.assertEqual(neighbours, self.users[3:8])
+        self.assertEqual(
+            [(u.num_points, u.points_position) for u in neighbours],
+            [(90, 3), (80, 5), (80, 5), (70, 7), (70, 7)]
+        )
+
+    def test_around_edges(self):
+        self.assertEqual(leaderboard_around(self.users[0], 2), self.users[:3])
+        self.assertEqual(leaderboard_around(self.users[11], 2), self.users[9:])
+
+    def test_around_without_points(self):
+        self.assertEqual(leaderboard_around(Group.objects.create(name="Dwarfs")), [])
+
+    def test_page_tag(self):
+        t = Template(
+            "{% load pinax_points_tags %}"
+            '{% leaderboard_page "auth.User" as page limit 3 after after %}'
+            "{% for u in page %}{{ u.points_position }}:{{ u.num_points }} {% endfor %}{{ page.cursor }}"
+        )
+        first = t.render(Context({"after": ""}))
+        self.assertTrue(first.startswith("1:100 1:100 3:90 "))
+        cursor = first.split(" ")[-1]
+        self.assertTrue(t.render(Context({"after": cursor})).startswith("3:90 5:80 5:80 "))
+        self.assertTrue(t.render(Context({"after": "garbage"})).startswith("1:100 1:100 3:90 "))
+
+    def test_around_tag(self):
+        t = Template(
+            "{% load pinax_points_tags %}"
+            "{% leaderboard_around user as neighbours limit 1 %}"
+            "{% for u in neighbours %}{{ u.username }} {% endfor %}"
+        )
+        self.assertEqual(t.render(Context({"user": self.users[4]})), "user_3 user_4 user_5 ")
+
+    def test_tag_syntax(self):
+        self.assertRaises(
+            TemplateSyntaxError,
+            Template,
+            "{% load pinax_points_tags %}{% leaderboard_around user as neighbours count 1 %}"
+        )
+
+
+class FakeRedis(object):
+    """
+    Just enough of redis-py's sorted set API for ``RedisLeaderboard``.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def zadd(self, name, mapping):
+        self.data.setdefault(name, {}).update(
+            (str(member), float(score)) for member, score in mapping.items()
+        )
+
+    def zscore(self, name, member):
+        return self.data.get(name, {}).get(member)
+
+    def zcount(self, name, low, high):
+        assert low.startswith("(") and high == "+inf"
+        return len([s for s in self.data.get(name, {}).values() if s > float(low[1:])])
+
+    def zrevrange(self, name, start, end, withscores=False):
+        entries = sorted(self.data.get(name, {}).items(), key=lambda e: (e[1], e[0]), reverse=True)
+        entries = entries[start:None if end == -1 else end + 1]
+        return [(m.encode(), s) for m, s in entries]
+
+    def zrevrangebyscore(self, name, max, min, withscores=False):
+        entries = self.zrevrange(name, 0, -1, withscores=True)
+        return [(m, s) for m, s in entries if float(min) <= s <= float(max)]
+
+    def sadd(self, name, *values):
+        self.data.setdefault(name, set()).update(str(v).encode() for v in values)
+
+    def smembers(self, name):
+        return set(self.data.get(name, set()))
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    def rename(self, src, dst):
+        self.data[dst] = self.data.pop(src)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    """
+    Queues commands for ``FakeRedis`` until ``execute``.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+class LeaderboardBackendMixin(BasePointsTestCase):
+
+    backend = None
+    options = {}
+
+    def setUp(self):
+        patchers = [
+            mock.patch("pinax.points.leaderboard.LEADERBOARD_BACKEND", self.backend),
+            mock.patch("pinax.points.leaderboard.LEADERBOARD_OPTIONS", self.options),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        leaderboard.get_leaderboard.cache_clear()
+        self.addCleanup(leaderboard.get_leaderboard.cache_clear)
+
+        self.setup_users(4)
+        self.groups = [Group.objects.create(name="Group {0}".format(i)) for i in range(2)]
+        for target, points in zip(self.users + self.groups, [30, 10, 20, 10, 25, 5]):
+            award_points(target, points)
+
+    def expected_ranks(self):
+        TargetStat.update_positions()
+        return leaderboard.SQLLeaderboard()
+
+    def assertMatchesSQL(self):
+        board = leaderboard.get_leaderboard()
+        sql_board = self.expected_ranks()
+        for target in self.users + self.groups:
+            self.assertEqual(board.rank(target), sql_board.rank(target))
+        for model, limit in [(User, None), (User, 2), (Group, 1)]:
+            # backends may break ties differently
+            self.assertEqual(
+                sorted((o.pk, o.num_points, o.points_position) for o in board.top(model, limit)),
+                sorted((o.pk, o.num_points, o.points_position) for o in sql_board.top(model, limit))
+            )
+
+    def test_matches_sql(self):
+        self.assertMatchesSQL()
+
+    def test_awards_update_backend(self):
+        leaderboard.get_leaderboard().rank(self.users[0])
+        award_points(self.users[1], 25)
+        award_points_bulk([(self.groups[1], 40), (self.users[3], -10)])
+        self.assertEqual(leaderboard.get_leaderboard().rank(self.groups[1]), 1)
+        self.assertMatchesSQL()
+
+    def test_rolled_back_award_is_ignored(self):
+        leaderboard.get_leaderboard().rank(self.users[0])
+        try:
+            with transaction.atomic():
+                award_points(self.users[1], 100)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(leaderboard.get_leaderboard().rank(self.users[1]), 4)
+        self.assertMatchesSQL()
+
+    def test_rebuild(self):
+        TargetStat.objects.filter(target_user=self.users[2]).update(points=100)
+        board = leaderboard.get_leaderboard()
+        board.rebuild()
+        self.assertEqual(board.rank(self.users[2]), 1)
+        self.assertMatchesSQL()
+
+    def test_unranked(self):
+        self.assertIsNone(leaderboard.get_leaderboard().rank(Group.objects.create(name="New")))
+
+    def test_positions_follow_backend(self):
+        leaderboard.get_leaderboard().rank(self.users[0])
+        award_points(self.users[1], 25)
+        award_points(self.groups[1], 50)
+        around = [(o.pk, o.points_position) for o in leaderboard_around(self.users[1], 1)]
+        page = [(o.pk, o.points_position) for o in leaderboard_page(User, limit=3)]
+        self.assertEqual(around, [(self.users[1].pk, 2), (self.users[0].pk, 3)])
+        self.expected_ranks()
+        self.assertEqual(around, [(o.pk, o.points_position) for o in leaderboard_around(self.users[1], 1)])
+        self.assertEqual(page, [(o.pk, o.points_position) for o in leaderboard_page(User, limit=3)])
+
+    def test_tag(self):
+        t = Template(
+            '{% load pinax_points_tags %}{% top_objects "auth.User" as top limit 2 %}'
+            "{% for u in top %}{{ u.username }}={{ u.num_points }}#{{ u.points_position }} {% endfor %}"
+        )
+        self.assertEqual(t.render(Context({})), "user_0=30#1 user_2=20#3 ")
+
+
+class SQLLeaderboardTestCase(LeaderboardBackendMixin, TestCase):
+
+    backend = "pinax.points.leaderboard.SQLLeaderboard"
+
+    def test_default_backend(self):
+        leaderboard.get_leaderboard.cache_clear()
+        with mock.patch("pinax.points.leaderboard.LEADERBOARD_BACKEND", leaderboard.LEADERBOARD_BACKEND):
+            self.assertIsInstance(leaderboard.get_leaderboard(), leaderboard.SQLLeaderboard)
+
+    def test_bad_backend(self):
+        leaderboard.get_leaderboard.cache_clear()
+        with mock.patch("pinax.points.leaderboard.LEADERBOARD_BACKEND", "pinax.points.Nope"):
+            with self.assertRaises(ImproperlyConfigured):
+                leaderboard.get_leaderboard()
+
+
+class MemoryLeaderboardTestCase(LeaderboardBackendMixin, TransactionTestCase):
+
+    backend = "pinax.points.leaderboard.MemoryLeaderboard"
+
+    def test_reads_do_not_query(self):
+        board = leaderboard.get_leaderboard()
+        board.rebuild()
+        with self.assertNumQueries(0):
+            self.assertEqual(board.rank(self.users[3]), 4)
+
+    def test_award_skips_ranking_update(self):
+        # BEGIN, stat upsert, ledger INSERT, rollup upsert
+        with self.assertNumQueries(4):
+            award_points(self.users[0], 1)
+
+
+class RedisLeaderboardTestCase(LeaderboardBackendMixin, TransactionTestCase):
+
+    backend = "pinax.points.leaderboard.RedisLeaderboard"
+
+    def setUp(self):
+        self.options = {"client": FakeRedis()}
+        super(RedisLeaderboardTestCase, self).setUp()
+        leaderboard.get_leaderboard().rebuild()
+
+    def test_rebuild_replaces_keys(self):
+        client = self.options["client"]
+        keys = set(client.data)
+        TargetStat.objects.filter(target_user__isnull=True).delete()
+        TargetStat.objects.filter(target_user=self.users[2]).update(points=100)
+        board = leaderboard.get_leaderboard()
+        board.rebuild()
+        group_key = "pinax-points:leaderboard:type:{0}".format(ContentType.objects.get_for_model(Group).pk)
+        self.assertEqual(set(client.data), keys - {group_key})
+        self.assertEqual(board.rank(self.users[2]), 1)
+        self.assertMatchesSQL()
+
+    def test_failed_rebuild_keeps_leaderboard(self):
+        client = self.options["client"]
+        live = dict((key, copy.copy(value)) for key, value in client.data.items())
+
+        def failing_totals():
+            yield (0, 1), 5
+            yield (0, 2), 5
+            raise DatabaseError
+
+        TargetStat.objects.filter(target_user=self.users[2]).update(points=100)
+        with mock.patch("pinax.points.models.BULK_BATCH_SIZE", 1), \
+                mock.patch("pinax.points.leaderboard.iter_totals", failing_totals):
+            with self.assertRaises(DatabaseError):
+                leaderboard.get_leaderboard().rebuild()
+        self.assertEqual(dict((key, value) for key, value in client.data.items() if key in live), live)
+        self.assertEqual(leaderboard.get_leaderboard().rank(self.users[2]), 3)
+
+    def test_top_ranks_in_two_calls(self):
+        client = self.options["client"]
+        with mock.patch.object(client, "zcount", wraps=client.zcount) as zcount, \
+                mock.patch.object(client, "zrevrangebyscore", wraps=client.zrevrangebyscore) as window:
+            top = leaderboard.get_leaderboard().top(User)
+        self.assertEqual([o.points_position for o in top], [1, 3, 4, 4])
+        self.assertEqual((zcount.call_count, window.call_count), (1, 1))
+
+
+class SignalDispatchMixin(BasePointsTestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.received = []
+        self.batches = []
+
+        def receiver(sender, **kwargs):
+            self.received.append((kwargs["target"], kwargs["points"], kwargs["total"]))
+
+        def batch_receiver(sender, awards, **kwargs):
+            self.batches.append([(award["target"], award["points"], award["total"]) for award in awards])
+
+        signals.points_awarded.connect(receiver)
+        signals.points_awarded_batch.connect(batch_receiver)
+        self.addCleanup(signals.points_awarded.disconnect, receiver)
+        self.addCleanup(signals.points_awarded_batch.disconnect, batch_receiver)
+
+
+class ImmediateDispatchTestCase(SignalDispatchMixin, TestCase):
+
+    def test_award(self):
+        award_points(self.users[0], 5)
+        self.assertEqual(self.received, [(self.users[0], 5, 5)])
+        self.assertEqual(self.batches, [[(self.users[0], 5, 5)]])
+
+    def test_bulk_award_is_one_batch(self):
+        award_points_bulk([(self.users[0], 5), (self.users[1], 2), (self.users[0], 1)])
+        awards = [(self.users[0], 5, 5), (self.users[1], 2, 2), (self.users[0], 1, 6)]
+        self.assertEqual(self.received, awards)
+        self.assertEqual(self.batches, [awards])
+
+    def test_sent_inside_transaction(self):
+        with transaction.atomic():
+            award_points(self.users[0], 5)
+            self.assertEqual(len(self.batches), 1)
+
+
+@mock.patch("pinax.points.models.SIGNAL_DISPATCH", "on_commit")
+class OnCommitDispatchTestCase(SignalDispatchMixin, TransactionTestCase):
+
+    def test_sent_after_commit_in_one_batch(self):
+        with transaction.atomic():
+            award_points(self.users[0], 5)
+            award_points_bulk([(self.users[1], 2), (self.users[0], 1)])
+            award_points(self.users[2], 3)
+            self.assertEqual(self.received, [])
+            self.assertEqual(self.batches, [])
+        awards = [
+            (self.users[0], 5, 5),
+            (self.users[1], 2, 2),
+            (self.users[0], 1, 6),
+            (self.users[2], 3, 3),
+        ]
+        self.assertEqual(self.received, awards)
+        self.assertEqual(self.batches, [awards])
+
+    def test_transactions_are_batched_separately(self):
+        for points in [1, 2]:
+            with transaction.atomic():
+                award_points(self.users[0], points)
+        self.assertEqual(self.batches, [[(self.users[0], 1, 1)], [(self.users[0], 2, 3)]])
+
+    def test_autocommit(self):
+        award_points(self.users[0], 5)
+        award_points_bulk([(self.users[1], 2), (self.users[2], 1)])
+        self.assertEqual(self.batches, [
+            [(self.users[0], 5, 5)],
+            [(self.users[1], 2, 2), (self.users[2], 1, 1)],
+        ])
+
+    def test_rollback(self):
+        try:
+            with transaction.atomic():
+                award_points(self.users[0], 5)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(self.received, [])
+        award_points(self.users[1], 1)
+        self.assertEqual(self.batches, [[(self.users[1], 1, 1)]])
+
+    def test_batched_after_rollback(self):
+        try:
+            with transaction.atomic():
+                award_points(self.users[0], 5)
+                award_points(self.users[1], 1)
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        with transaction.atomic():
+            award_points(self.users[2], 3)
+            award_points(self.users[0], 2)
+        self.assertEqual(self.batches, [[(self.users[2], 3, 3), (self.users[0], 2, 2)]])
+
+    def test_rolled_back_savepoints_drop_out(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    award_points(self.users[0], 5)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            award_points(self.users[1], 2)
+            try:
+                with transaction.atomic():
+                    award_points(self.users[2], 3)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            with transaction.atomic():
+                award_points(self.users[0], 1)
+            award_points(self.users[2], 4)
+        self.assertEqual(self.received, [(self.users[0], 1, 1), (self.users[1], 2, 2), (self.users[2], 4, 4)])
+        # awards made in a savepoint that commits are sent in a batch of their own
+        self.assertEqual(self.batches, [
+            [(self.users[0], 1, 1)],
+            [(self.users[1], 2, 2), (self.users[2], 4, 4)],
+        ])
+
+    def test_other_hooks_keep_their_order(self):
+        hooks = []
+        with transaction.atomic():
+            award_points(self.users[0], 5)
+            transaction.on_commit(lambda: hooks.append(len(self.batches)))
+            award_points(self.users[1], 2)
+        self.assertEqual(hooks, [0])
+        self.assertEqual(self.batches, [[(self.users[0], 5, 5), (self.users[1], 2, 2)]])
+
+
+@mock.patch("pinax.points.models.ALLOW_NEGATIVE_TOTALS", True)
+class MetricsTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("pinax.points.metrics.METRICS_COLLECTOR", "pinax.points.metrics.MemoryCollector")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.get_collector.cache_clear()
+        self.addCleanup(metrics.get_collector.cache_clear)
+        self.setup_users(2)
+        award_points(self.users[1], 10)
+        self.collector = metrics.get_collector()
+        self.collector.reset()
+
+    def test_off_by_default(self):
+        metrics.get_collector.cache_clear()
+        with mock.patch("pinax.points.metrics.METRICS_COLLECTOR", None):
+            self.assertIsNone(metrics.get_collector())
+
+    def test_bad_collector(self):
+        metrics.get_collector.cache_clear()
+        with mock.patch("pinax.points.metrics.METRICS_COLLECTOR", "pinax.points.Nope"):
+            with self.assertRaises(ImproperlyConfigured):
+                metrics.get_collector()
+
+    def test_award(self):
+        award_points(self.users[0], 20)
+        award_points(self.users[0], 5)
+        self.assertEqual(self.collector.counter("calls", operation="award_points"), 2)
+        self.assertEqual(self.collector.counter("calls", operation="update_positions"), 2)
+        count, queries = self.collector.summary("queries", operation="award_points")
+        self.assertEqual((count, queries), (2, 8))
+        self.assertEqual(self.collector.summary("duration_seconds", operation="award_points")[0], 2)
+        # user_0 passes user_1; the second award changes no position
+        self.assertEqual(self.collector.summary("rows_reranked"), (2, 2))
+
+    def test_errors(self):
+        with self.assertRaises(ImproperlyConfigured):
+            award_points(self.users[0], "MISSING")
+        self.assertEqual(self.collector.counter("errors", operation="award_points"), 1)
+        self.assertEqual(self.collector.counter("calls", operation="award_points"), 1)
+
+    def test_reads_and_tags(self):
+        points_awarded(self.users[1])
+        Template(
+            '{% load pinax_points_tags %}{% top_objects "auth.User" as top limit 1 %}'
+            "{% points_for_object user %}"
+        ).render(Context({"user": self.users[1]}))
+        self.assertEqual(self.collector.counter("calls", operation="points_awarded"), 2)
+        self.assertEqual(self.collector.counter("calls", operation="top_objects_tag"), 1)
+        self.assertEqual(self.collector.summary("queries", operation="points_for_object_tag"), (1, 1))
+
+    def test_exposition(self):
+        award_points(self.users[0], 20)
+        self.collector.increment("labelled", {"key": 'a "b"'}, 1)
+        text = self.collector.exposition()
+        self.assertIn("# TYPE pinax_points_calls_total counter\n", text)
+        self.assertIn('pinax_points_calls_total{operation="award_points"} 1\n', text)
+        self.assertIn('pinax_points_labelled_total{key="a \\"b\\""} 1\n', text)
+        self.assertIn("# TYPE pinax_points_queries summary\n", text)
+        self.assertIn('pinax_points_queries_count{operation="award_points"} 1\n', text)
+        self.assertIn('pinax_points_queries_sum{operation="award_points"} 4\n', text)
+        self.assertIn("pinax_points_rows_reranked_sum 2\n", text)
+        self.assertEqual(text.count("# TYPE pinax_points_calls_total"), 1)
+
+
+@mock.patch("pinax.points.models.ALLOW_NEGATIVE_TOTALS", True)
+class VoteTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(2)
+        self.voter = self.users[0]
+        self.group = Group.objects.create(name="Dwarfs")
+
+    def test_vote_transitions(self):
+        self.assertEqual(record_vote(self.voter, self.group, 1), 1)
+        self.assertEqual(record_vote(self.voter, self.group, -1), -1)
+        self.assertEqual(get_vote(self.voter, self.group), -1)
+        self.assertEqual(record_vote(self.voter, self.group, 0), 0)
+        self.assertEqual(record_vote(self.users[1], self.group, -1), -1)
+        self.assertEqual(
+            list(AwardedPointValue.objects.order_by("pk").values_list("points", flat=True)),
+            [1, -2, 1, -1]
+        )
+        self.assertEqual(points_awarded(source=self.voter, target=self.group), 0)
+
+    def test_repeated_votes(self):
+        record_vote(self.voter, self.group, 1)
+        self.assertRaises(VoteError, record_vote, self.voter, self.group, 1)
+        record_vote(self.voter, self.group, -1)
+        self.assertRaises(VoteError, record_vote, self.voter, self.group, -1)
+        self.assertEqual(record_vote(self.voter, self.group, 0), 0)
+        self.assertEqual(record_vote(self.voter, self.group, 0), None)
+        self.assertEqual(AwardedPointValue.objects.count(), 3)
+
+    def test_invalid_vote(self):
+        self.assertRaises(ValueError, record_vote, self.voter, self.group, 2)
+
+    def test_user_target(self):
+        record_vote(self.voter, self.users[1], 1)
+        self.assertEqual(points_awarded(self.users[1]), 1)
+        self.assertEqual(get_vote(self.voter, self.users[1]), 1)
+
+    def test_no_ledger_aggregate(self):
+        record_vote(self.voter, self.group, 1)
+        statements = []
+        with connection.execute_wrapper(lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)):
+            record_vote(self.voter, self.group, -1)
+        self.assertFalse([sql for sql in statements if "SUM(" in sql])
+
+    def test_without_upsert_returning(self):
+        with mock.patch("pinax.points.sql.can_swap_votes", return_value=False):
+            self.assertEqual(record_vote(self.voter, self.group, 1), 1)
+            self.assertRaises(VoteError, record_vote, self.voter, self.group, 1)
+            self.assertEqual(record_vote(self.voter, self.group, -1), -1)
+            self.assertEqual(record_vote(self.voter, self.group, 0), 0)
+        self.assertEqual(Vote.objects.get().previous, -1)
+
+    def test_user_has_voted_tag(self):
+        t = Template("{% load pinax_points_tags %}{% user_has_voted user obj as vote %}{{ vote }}")
+        self.assertEqual(t.render(Context({"user": self.voter, "obj": self.group})), "novote")
+        record_vote(self.voter, self.group, 1)
+        self.assertEqual(t.render(Context({"user": self.voter, "obj": self.group})), "upvote")
+        record_vote(self.voter, self.group, -1)
+        self.assertEqual(t.render(Context({"user": self.voter, "obj": self.group})), "downvote")
+        self.assertEqual(t.render(Context({"user": AnonymousUser(), "obj": self.group})), "novote")
+
+
+class UserVotesTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.voter = self.users[0]
+        self.groups = [Group.objects.create(name="Group {0}".format(i)) for i in range(3)]
+        record_vote(self.voter, self.groups[0], 1)
+        record_vote(self.voter, self.users[1], 1)
+        record_vote(self.voter, self.groups[2], 1)
+        record_vote(self.voter, self.groups[2], -1)
+        record_vote(self.users[1], self.groups[1], 1)
+        self.objects = self.groups + self.users[1:]
+
+    def test_get_votes(self):
+        with self.assertNumQueries(1):
+            votes = get_votes(self.voter, self.objects)
+        self.assertEqual(
+            [votes[obj] for obj in self.objects],
+            [1, 0, -1, 1, 0]
+        )
+
+    def test_get_votes_anonymous(self):
+        with self.assertNumQueries(0):
+            votes = get_votes(AnonymousUser(), self.objects)
+        self.assertEqual(set(votes.values()), {0})
+
+    def test_list_page(self):
+        t = Template(
+            "{% load pinax_points_tags %}{% user_votes user objects as votes %}"
+            "{% for obj in objects %}{% user_has_voted user obj as vote %}"
+            "{{ vote }}/{{ votes|for_object:obj }} {% endfor %}"
+        )
+        context = Context({"user": self.voter, "objects": self.objects})
+        with self.assertNumQueries(1):
+            rendered = t.render(context)
+        self.assertEqual(
+            rendered,
+            "upvote/upvote novote/novote downvote/downvote upvote/upvote novote/novote "
+        )
+
+    def test_other_users_are_not_preloaded(self):
+        t = Template(
+            "{% load pinax_points_tags %}{% user_votes user objects as votes %}"
+            "{% user_has_voted other obj as vote %}{{ vote }}"
+        )
+        context = Context({"user": self.voter, "other": self.users[1], "objects": self.objects, "obj": self.groups[1]})
+        self.assertEqual(t.render(context), "upvote")
+
+
+class PointsAwardedManyTestCase(BasePointsTestCase, TestCase):
+
+    def setUp(self):
+        self.setup_users(3)
+        self.groups = [Group.objects.create(name="Group {0}".format(i)) for i in range(3)]
+        self.now = datetime.now()
+        for i, target in enumerate(self.users[:2] + self.groups[:2]):
+            award_points(target, i + 1)
+            apv = award_points(target, 10)
+            apv.timestamp = self.now - timedelta(days=3)
+            apv.save()
+        self.objects = self.users + self.groups
+
+    def test_all_time(self):
+        with self.assertNumQueries(2):
+            totals = points_awarded_many(self.objects)
+        self.assertEqual(
+            [totals[obj] for obj in self.objects],
+            [11, 12, 0, 13, 14, 0]
+        )
+
+    def test_since(self):
+        for since in [self.now - timedelta(minutes=90), self.now - timedelta(days=1)]:
+            with self.assertNumQueries(2):
+                totals = points_awarded_many(self.objects, since=since)
+            self.assertEqual(
+                [totals[obj] for obj in self.objects],
+                [points_awarded(obj, since=since) for obj in self.objects]
+            )
+        totals = points_awarded_many(self.objects, since=self.now - timedelta(days=4))
+        self.assertEqual(totals[self.groups[1]], 14)
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(points_awarded_many([]), {})
+
+    def test_with_points(self):
+        users = with_points(User.objects.order_by("pk"))
+        self.assertEqual([u.num_points for u in users], [11, 12, 0])
+        groups = with_points(Group.objects.order_by("-pk"), name="score")
+        self.assertEqual([g.score for g in groups], [0, 14, 13])
+
+    def test_tag(self):
+        t = Template(
+            "{% load pinax_points_tags %}{% points_for_objects objects as points %}"
+            "{% for obj in objects %}{{ points|for_object:obj }} {% endfor %}"
+        )
+        with self.assertNumQueries(2):
+            rendered = t.render(Context({"objects": self.objects}))
+        self.assertEqual(rendered, "11 12 0 13 14 0 ")
+
+    def test_tag_limit(self):
+        t = Template(
+            "{% load pinax_points_tags %}{% points_for_objects objects limit 1 days as points %}"
+            "{% for obj in objects %}{{ points|for_object:obj }} {% endfor %}"
+        )
+        self.assertEqual(t.render(Context({"objects": self.objects})), "1 2 0 3 4 0 ")
+
+    def test_tag_syntax(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template("{% load pinax_points_tags %}{% points_for_objects objects %}")
+
+
 class PointsForObjectTagTestCase(BasePointsTestCase, TestCase):
     """
     points_for_object
@@ -1 +1,7 @@
-urlpatterns = []
+from django.conf.urls import include, url
+from django.contrib import admin
+
+urlpatterns = [
+    url(r"^admin/", admin.site.urls),
+    url(r"^points/", include("pinax.points.urls", namespace="pinax_points")),
+]
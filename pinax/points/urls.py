@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from . import views
+
+app_name = "pinax_points"
+
+urlpatterns = [
+    url(r"^export/$", views.export_ledger, name="export"),
+]
@@ -0,0 +1,28 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .export import FORMATS, export_lines, ledger_rows, parse_when
+
+
+@require_GET
+@staff_member_required
+def export_ledger(request):
+    """
+    Streams the ledger to staff as CSV (the default) or NDJSON, filtered by
+    the ``since``, ``until`` and (repeatable) ``key`` query parameters.
+    """
+    format = request.GET.get("format", "csv")
+    if format not in FORMATS:
+        return HttpResponseBadRequest("format must be one of {0}".format(", ".join(sorted(FORMATS))))
+    try:
+        since, until = [
+            parse_when(request.GET[name]) if request.GET.get(name) else None
+            for name in ("since", "until")
+        ]
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    rows = ledger_rows(since, until, request.GET.getlist("key"))
+    response = StreamingHttpResponse(export_lines(format, rows), content_type=FORMATS[format])
+    response["Content-Disposition"] = 'attachment; filename="points.{0}"'.format(format)
+    return response
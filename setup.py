@@ -65,7 +65,7 @@ setup(
     package_data={
         "points": [
             "templates/pinax/points/*.html",
-            "templates/admin/pinax/points/awardedpointvalue/*.html",
+            "templates/pinax/admin/pinax/points/awardedpointvalue/*.html",
         ]
     },
     extras_require={